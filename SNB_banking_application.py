@@ -9,52 +9,1747 @@
 # The admin login is: 
 # (Username: admin - Password: access)
 
-# Note - Floating point numbers were not used to represent currency because of the rounding errors they produce. Instead pounds and pence are represented as seperate integers which are then correctly formated.
+# Note - Floating point numbers were not used to represent currency because of the rounding errors they produce. Instead ammounts are represented as a whole number of pence by the 'Money' class which are then correctly formated.
 
-# To skip to the first function that starts the program please go to line number: 760
+# To skip to the first function that starts the program please go to line number: 2829
 
 
 
 
-# 'randint' is imported to generate a random account number for each bank account.
-from random import randint
-# 'ceil' is imported for use in calculating monthly mortgage repayments
-from math import ceil
+# 'randint' and 'choice' are imported to generate a random account number for each bank account.
+from random import randint, choice
+# 'filterfalse' is imported to pick out the free account numbers in a block of numbers without a Python loop over them.
+# 'islice' is imported to take one page at a time from the results of the admin account browser.
+from itertools import filterfalse, islice
+# 'heapify' and 'heappop' are imported to give accounts in order of balance without sorting every result first.
+from heapq import heapify, heappop
+# 'lru_cache' is imported to remember mortgage quotes and repayment schedules that have already been worked out.
+# 'partial' is imported to pass the next menu an ammount chosen in the menu before it, such as the ammount to deposit.
+# 'wraps' is imported to keep the name of each function timed by the metrics.
+from functools import lru_cache, partial, wraps
+# 'bisect_left' is imported to find the bucket of a latency histogram that a timing falls in.
+from bisect import bisect_left
 # 'json' module is imported for handling the import and export of accounts and customer records into and out of the program.
 import json
+# 'os' is imported to force journal records and snapshots onto the disk with 'fsync' and to replace snapshot files in a single step.
+import os
+# 'shutil' is imported to copy a snapshot into its backup generation where hard links are not supported.
+import shutil
+# 'hashlib' is imported to checksum snapshot files so that unchanged files can be loaded without validating them again, and to hash customer passwords.
+import hashlib
+# 'hmac' is imported to compare password hashes in constant time, and 'secrets' to generate session tokens for the SNB server.
+import hmac
+import secrets
+# 'sys' is imported to intern the customer names and passwords repeated across many accounts.
+import sys
+# 'array' is imported to hold account columns as compact typed arrays in 'ColumnarAccounts'.
+from array import array
+# 're' is imported to skip the whitespace between accounts when scanning 'accounts.json'.
+import re
+# 'mmap' and 'struct' are imported to read and write values in place in the binary 'accounts.snb' file.
+import mmap
+import struct
+# 'argparse' is imported to read the options the application is started with.
+import argparse
+# 'sqlite3' is imported to keep accounts and customer logins in the embedded 'snb.db' database.
+import sqlite3
+# 'csv' is imported to read batch posting files and write their result reports.
+import csv
+# 'time' is imported to report how quickly a batch posting file was posted, and to time the hot paths when metrics are turned on.
+import time
+# 'contextmanager' is imported to group the changes made by a batch of transactions so they are saved together.
+from contextlib import contextmanager
+# 'date' is imported to work out how many interest periods have passed since savings interest was last accrued.
+from datetime import date
+# 'asyncio' and 'signal' are imported to serve many customers at the same time over the network and to stop the server cleanly.
+import asyncio
+import signal
+# 'traceback' is imported to print unexpected errors met by the SNB server while it carries on serving other clients.
+import traceback
+# 'threading' is imported to lock accounts while a transaction changes them, so transactions can be made from several threads at once.
+import threading
+# 'cProfile', 'pstats' and 'tracemalloc' are imported to profile the time and memory used by each phase of the application when it is started with '--profile'.
+import cProfile
+import pstats
+import tracemalloc
+
+
+
+
+# Money represents an ammount of currency as a single whole number of pence.
+# Keeping one integer means adding, subtracting and comparing ammounts are single integer operations, with no carrying between pounds and pence and no rounding errors.
+# Money values are never changed in place, every calculation returns a new 'Money' object.
+class Money:
+    # '__slots__' stops each Money object carrying its own attribute dictionary, since one exists for every balance at the bank.
+    __slots__ = ("pence",)
+
+    def __init__(self, pence=0):
+        self.pence = pence
+
+
+
+    # Creates a Money object from separate pounds and pence values, as stored in the older 'accounts.json' layout.
+    @classmethod
+    def from_pounds_pence(cls, pounds, pence):
+        return cls(pounds * 100 + pence)
+
+
+
+    # The whole pounds part of the ammount.
+    @property
+    def pounds_part(self):
+        return abs(self.pence) // 100
+
+
+
+    # The pence left over after the whole pounds.
+    @property
+    def pence_part(self):
+        return abs(self.pence) % 100
+
+
+
+    # Formats the ammount with a pound sign and two pence digits, for example '£12.05'.
+    def __str__(self):
+        sign = "-" if self.pence < 0 else ""
+        return f"{sign}£{self.pounds_part}.{self.pence_part:02d}"
+
+
+
+    def __repr__(self):
+        return f"Money({self.pence})"
+
+
+
+    # Formats the ammount as pounds and pence with no pound sign, for example '12.05', as written in CSV files and read by 'from_text'.
+    def plain(self):
+        sign = "-" if self.pence < 0 else ""
+        return f"{sign}{self.pounds_part}.{self.pence_part:02d}"
+
+
+
+    # Reads an ammount written in pounds and pence, such as '123.45', '123.4' or '123', raising a 'ValueError' if the text is not a valid ammount.
+    # The text is read digit by digit rather than through a float so no rounding can happen.
+    @classmethod
+    def from_text(cls, text):
+        match = money_text.fullmatch(text.strip())
+        if match is None:
+            raise ValueError(f"'{text}' is not a valid ammount in pounds and pence")
+        return cls.from_pounds_pence(int(match.group(1)), int((match.group(2) or "").ljust(2, "0")))
+
+
+
+    def __add__(self, other):
+        return Money(self.pence + other.pence)
+
+
+
+    def __sub__(self, other):
+        return Money(self.pence - other.pence)
+
+
+
+    def __neg__(self):
+        return Money(-self.pence)
+
+
+
+    # Multiplies an ammount by a whole number, for example a monthly repayment by a number of months.
+    def __mul__(self, times):
+        return Money(self.pence * times)
+
+    __rmul__ = __mul__
+
+
+
+    def __eq__(self, other):
+        return isinstance(other, Money) and self.pence == other.pence
+
+
+
+    def __lt__(self, other):
+        return self.pence < other.pence
+
+
+
+    def __le__(self, other):
+        return self.pence <= other.pence
+
+
+
+    def __gt__(self, other):
+        return self.pence > other.pence
+
+
+
+    def __ge__(self, other):
+        return self.pence >= other.pence
+
+
+
+    def __hash__(self):
+        return hash(self.pence)
+
+
+
+    # A zero ammount counts as False.
+    def __bool__(self):
+        return self.pence != 0
+
+
+
+
+# Reads an ammount of money from an account dictionary.
+# Newer files store the ammount as a whole number of pence under 'key', older files store separate pounds and pence values under 'pounds_key' and 'pence_key'.
+def money_from_dict(data, key, pounds_key, pence_key):
+    if key in data:
+        return Money(data[key])
+    return Money.from_pounds_pence(data[pounds_key], data[pence_key])
+
+
+
+
+# BankError is the parent class of every error raised by the transaction functions ('open_account', 'deposit', 'withdraw' and so on).
+# The message of each error is written so that it can be shown straight to the customer, for example "not enough funds in your account".
+class BankError(Exception):
+    pass
+
+
+
+# Raised when no account at SNB has the given account number.
+class AccountNotFoundError(BankError):
+    pass
+
+
+
+# Raised when a transaction is not available for an account's category, such as depositing into a 'Mortgage' account.
+class AccountTypeError(BankError):
+    pass
+
+
+
+# Raised when an account does not hold enough money to cover a withdrawal, transfer or mortgage payment.
+class InsufficientFundsError(BankError):
+    pass
+
+
+
+# Raised when an ammount of money is not allowed, such as a deposit of £0.00 or a mortgage below the minimum SNB lends.
+class InvalidAmountError(BankError):
+    pass
+
+
+
+# Raised when a mortgage repayment term is outside the range SNB offers.
+class InvalidTermError(BankError):
+    pass
+
+
+
+# Raised when a foreign exchange fee or interest rate tier does not exist.
+class InvalidTierError(BankError):
+    pass
+
+
+
+# Raised when an account used in a transaction belongs to a different customer, such as paying a mortgage from someone else's current account.
+class AccountOwnerError(BankError):
+    pass
+
+
+
+# Raised when a transfer names the same account to send from and to.
+class SameAccountError(BankError):
+    pass
+
+
+
+# Raised when a payment is made towards a mortgage that has already been paid off.
+class MortgagePaidOffError(BankError):
+    pass
+
+
+
+# Raised by the SNB server when a username and password are incorrect, or a transaction is requested before logging in.
+class LoginError(BankError):
+    pass
+
+
+
+# Raised by the SNB server when a new customer's username or password cannot be used.
+class RegistrationError(BankError):
+    pass
+
+
+
+
+# TransactionResult is returned by every transaction function to describe what was done.
+# 'operation' names the transaction (such as "deposit"), 'accounts' holds every account it changed in the order they were passed in, and 'ammount' is the money moved (or £0.00 if none was).
+class TransactionResult:
+    __slots__ = ("operation", "accounts", "ammount")
+
+    def __init__(self, operation, accounts, ammount):
+        self.operation = operation
+        self.accounts = accounts
+        self.ammount = ammount
+
+
+
+    # The first account changed by the transaction, which is the only one for most transactions.
+    @property
+    def account(self):
+        return self.accounts[0]
+
+
+
+    def __repr__(self):
+        return f"TransactionResult({self.operation!r}, {self.accounts!r}, {self.ammount!r})"
+
+
+
+
+# MortgageRunSummary counts what happened to every 'Mortgage' account in a month-end mortgage run.
+# Ammounts are kept as whole numbers of pence while the run adds them up and are given as 'Money' by the properties.
+class MortgageRunSummary:
+    __slots__ = ("mortgages", "paid", "missed", "newly_flagged", "paid_off", "already_paid_off", "collected_pence", "missed_pence")
+
+    def __init__(self):
+        # Number of 'Mortgage' accounts looked at.
+        self.mortgages = 0
+        # Payments taken, and payments that could not be taken because the payment account was missing or did not hold enough money.
+        self.paid = 0
+        self.missed = 0
+        # Mortgages flagged for missed payments by this run (rather than already flagged).
+        self.newly_flagged = 0
+        # Mortgages fully paid off by this run, and mortgages that were already paid off so had no payment due.
+        self.paid_off = 0
+        self.already_paid_off = 0
+        self.collected_pence = 0
+        self.missed_pence = 0
+
+
+
+    @property
+    def collected(self):
+        return Money(self.collected_pence)
+
+
+
+    @property
+    def missed_ammount(self):
+        return Money(self.missed_pence)
+
+
+
+
+# InterestRunSummary counts what happened to every 'Savings' account in a savings interest run.
+class InterestRunSummary:
+    __slots__ = ("accounts", "credited", "periods", "interest_pence")
+
+    def __init__(self, periods):
+        # Number of 'Savings' accounts looked at, and how many of them had interest added (accounts with no balance earn none).
+        self.accounts = 0
+        self.credited = 0
+        # Number of interest periods accrued by the run, which is more than one when catching up on missed runs.
+        self.periods = periods
+        self.interest_pence = 0
+
+
+
+    @property
+    def interest(self):
+        return Money(self.interest_pence)
+
+
+
+
+# RepricingSummary counts what a bulk repricing (see 'reprice_accounts') did, or would do in a dry run.
+# 'before' and 'after' count the matching accounts in each tier before and after the repricing, by tier name.
+class RepricingSummary:
+    __slots__ = ("category", "new_tier", "dry_run", "accounts", "changed", "before", "after", "not_found", "other_category")
+
+    def __init__(self, category, new_tier, dry_run):
+        self.category = category
+        self.new_tier = new_tier
+        self.dry_run = dry_run
+        # Number of accounts that matched, and how many of them were (or would be) moved to 'new_tier'.
+        self.accounts = 0
+        self.changed = 0
+        self.before = {}
+        self.after = {}
+        # Account numbers given in a list that do not exist, or that belong to an account of another category.
+        self.not_found = 0
+        self.other_category = 0
+
+
+
+    # Number of matching accounts that were already in 'new_tier'.
+    @property
+    def unchanged(self):
+        return self.accounts - self.changed
+
+
+
+
+# LatencyHistogram counts how many timings fall in each of the 'metrics_buckets' and adds up their total, so latencies can be summarised without keeping every timing.
+# Recording a timing is a binary search of the bucket bounds and two additions, made under a lock so that timings from several threads at once are never lost.
+class LatencyHistogram:
+    __slots__ = ("counts", "total", "lock")
+
+    def __init__(self):
+        # The last count is of timings longer than every bucket bound.
+        self.counts = [0] * (len(metrics_buckets) + 1)
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+
+
+    # Records one timing in seconds.
+    def observe(self, seconds):
+        bucket = bisect_left(metrics_buckets, seconds)
+        with self.lock:
+            self.counts[bucket] += 1
+            self.total += seconds
+
+
+
+    # Gives a copy of the count in each bucket and the total of every timing, taken together.
+    def read(self):
+        with self.lock:
+            return list(self.counts), self.total
+
+
+
+    # Gives the bucket bound that percentile 'p' (0 to 100) of the timings falls within, from a copy of the counts given by 'read'.
+    # None is given if no timing has been recorded, and infinity if the percentile is longer than every bucket bound.
+    @staticmethod
+    def percentile(counts, p):
+        total = sum(counts)
+        if total == 0:
+            return None
+        rank = total * p / 100
+        seen = 0
+        for bound, count in zip(metrics_buckets, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+
+
+# ProfiledPhase gathers the CPU profile and memory use of every run of one named phase of the application, such as "import" or "menu", while profiling is turned on.
+class ProfiledPhase:
+    __slots__ = ("name", "profilers", "calls", "seconds", "measured", "peak", "net", "allocations", "snapshot")
+
+    def __init__(self, name):
+        self.name = name
+        # A 'cProfile.Profile' for each thread the phase has run in, since a profiler only follows the thread it was turned on in.
+        self.profilers = {}
+        self.calls = 0
+        self.seconds = 0.0
+        # The number of runs whose memory was measured (those in the main thread, see 'run_profiled_phase').
+        # The most memory traced at once while those runs ran, and the memory they left allocated, in bytes.
+        self.measured = 0
+        self.peak = 0
+        self.net = 0
+        # The bytes and blocks left allocated by the phase at each line of code, and a snapshot of every allocation after its latest run.
+        # These are only kept for phases that take allocation snapshots.
+        self.allocations = {}
+        self.snapshot = None
+
+
+
+    # Gives the profiler of the thread this is called from, creating it the first time the phase runs in that thread.
+    def profiler(self):
+        thread = threading.get_ident()
+        if thread not in self.profilers:
+            self.profilers[thread] = cProfile.Profile()
+        return self.profilers[thread]
+
+
+
+    # Adds the allocations left by one run of the phase, found by comparing the snapshots taken before and after it.
+    # Allocations made by 'tracemalloc' itself are left out.
+    def add_allocations(self, before, after):
+        for statistic in after.compare_to(before, "lineno"):
+            if statistic.traceback[0].filename == tracemalloc.__file__:
+                continue
+            line = str(statistic.traceback)
+            size, count = self.allocations.get(line, (0, 0))
+            self.allocations[line] = (size + statistic.size_diff, count + statistic.count_diff)
+        self.snapshot = after
+
+
+
+
+# Session holds the login of one connection to the SNB server, in place of the 'c_username' and 'c_customer_id' globals used by the menus.
+# Every connection has its own session, so many customers can be logged in at the same time.
+# Logging in gives the session a token, which is kept in 'session_cache' so later requests (on this or any other connection) can use the session by sending the token instead of the password.
+class Session:
+    __slots__ = ("c_name", "customer_id", "token", "expires")
+
+    def __init__(self):
+        # The username and customer id of the logged in customer, or None before logging in.
+        self.c_name = None
+        self.customer_id = None
+        # The session's token and the 'time.monotonic' time after which the token can no longer be used, or None before logging in.
+        self.token = None
+        self.expires = None
+
+
+
+    @property
+    def logged_in(self):
+        return self.customer_id is not None
+
+
+
+
+# AccountLocks holds the locks of a group of accounts for the length of a 'with' block, as given by 'locked_accounts'.
+# The locks are always taken in the same order (by their position in 'account_locks'), so two transactions on the same accounts (such as transfers in opposite directions) can never each hold one lock while waiting for the other.
+# Accounts that share a lock only take it once.
+# Once the locks are held each account is checked to still be open, since another thread may have closed it while this one was waiting.
+# It is a class rather than a '@contextmanager' function because every transaction uses it, and a class is quicker to enter and leave.
+class AccountLocks:
+    __slots__ = ("accounts", "locks")
+
+    def __init__(self, accounts):
+        self.accounts = accounts
+        if len(accounts) == 1:
+            self.locks = (account_locks[accounts[0].number % account_lock_count],)
+        else:
+            self.locks = [account_locks[position] for position in sorted({account.number % account_lock_count for account in accounts})]
+
+
+
+    def __enter__(self):
+        for lock in self.locks:
+            lock.acquire()
+        for account in self.accounts:
+            if account_store.by_number.get(account.number) is not account:
+                self.release()
+                raise AccountNotFoundError(f"account {account.number} has been closed")
+
+
+
+    def __exit__(self, error_type, error, traceback):
+        self.release()
+
+
+
+    def release(self):
+        for lock in reversed(self.locks):
+            lock.release()
+
+
+
+
+# Credential holds a customer's password as a salted PBKDF2 hash, so the password itself is never saved.
+# Hashing a password is deliberately slow (see 'credential_iterations') so that a stolen copy of the customer logins cannot quickly be used to guess passwords.
+# The number of iterations is kept with each credential, so raising 'credential_iterations' only changes how new passwords are hashed and every saved password can still be checked.
+# 'customer_id' is the customer's id, which their accounts refer to instead of their username and password.
+class Credential:
+    __slots__ = ("customer_id", "salt", "iterations", "key")
+
+    def __init__(self, customer_id, salt, iterations, key):
+        self.customer_id = customer_id
+        self.salt = salt
+        self.iterations = iterations
+        self.key = key
+
+
+
+    # Hashes a new password with a random salt and the current 'credential_iterations'.
+    @classmethod
+    def from_password(cls, customer_id, password):
+        salt = os.urandom(16)
+        return cls(customer_id, salt, credential_iterations, hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, credential_iterations))
+
+
+
+    # Checks whether a password matches this credential.
+    # The hashes are compared with 'hmac.compare_digest', which takes the same time however many of their bytes match.
+    def verify(self, password):
+        return hmac.compare_digest(hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), self.salt, self.iterations), self.key)
+
+
+
+    # The credential as saved in 'customer_records.json', with the salt and hash written as hexadecimal text.
+    def dict(self):
+        return {"customer_id": self.customer_id, "salt": self.salt.hex(), "iterations": self.iterations, "hash": self.key.hex()}
+
+
+
+    # Credentials saved before customers had ids are read with an id of None, which 'assign_customer_ids' then fills in.
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("customer_id"), bytes.fromhex(data["salt"]), data["iterations"], bytes.fromhex(data["hash"]))
+
+
+
+
+# AccountStore holds every bank account at SNB in the order they were created or imported.
+# Alongside the ordered accounts it keeps hash indexes by account number, by customer id and by account category.
+# It also indexes 'Current' and 'Savings' accounts by their foreign exchange fee or interest rate, and keeps the 'Mortgage' accounts flagged for missed payments, for the admin account browser (see 'query_accounts').
+# This means looking up a typed account number or listing a customer's accounts does not need a scan over every account at the bank.
+# Accounts imported from storage are only turned into account objects the first time they are used.
+# Until then the store only keeps an index of where each account is in the saved file, so starting the program does not have to build every account.
+class AccountStore:
+    def __init__(self):
+        # Dictionaries keep their insertion order so 'by_number' doubles as the ordered list of all accounts.
+        # Accounts that have not been built from the file yet are stored as None.
+        self.by_number = {}
+        # Each customer and category maps to a dictionary whose keys are the account numbers, used as an ordered set so that accounts can be removed from the index in constant time.
+        self.by_customer = {}
+        self.by_category = {}
+        # 'by_tier' maps a category and rate, such as ("Savings", 5), to the numbers of the accounts with that rate, and 'flagged' holds the numbers of the flagged 'Mortgage' accounts.
+        self.by_tier = {}
+        self.flagged = {}
+        # The index of the imported accounts (an 'AccountsIndex' or 'ColumnarAccounts'), the function that builds the account at a row of it, and the row of each account not yet built.
+        self.source_index = None
+        self.build_account = None
+        self.pending = {}
+        # The text of the imported 'accounts.json' file, when accounts were imported from JSON.
+        self.source = None
+
+
+
+    # Iterating over the store gives every account in the order they were added, the same as the old accounts list.
+    # Any accounts not yet built from the file are built as they are reached.
+    def __iter__(self):
+        for number in list(self.by_number):
+            yield self.materialize(number)
+
+
+
+    def __len__(self):
+        return len(self.by_number)
+
+
+
+    # Checks whether an account number is already in use at SNB.
+    def __contains__(self, number):
+        return number in self.by_number
+
+
+
+    # Adds an account to the store and to each of the indexes.
+    # The indexes are changed while holding 'storage_lock' so another thread never sees an account in some indexes but not others.
+    def append(self, account):
+        with storage_lock:
+            self.by_number[account.number] = account
+            self.by_customer.setdefault(account.customer_id, {})[account.number] = None
+            self.by_category.setdefault(account.category, {})[account.number] = None
+            self.index_query_values(account.number, account.category, *account_query_values(account)[1:])
+
+
+
+    # Adds every account listed in an index to the store and to each of the indexes without building any of them.
+    # The index can be an 'AccountsIndex' or 'ColumnarAccounts', as both have 'numbers', 'balances', 'customers', 'categories', 'rates', 'flags' and 'customer_keys'.
+    # 'build_account' is called with an account's row in the index the first time the account is used.
+    # 'source' is the text of the 'accounts.json' file that an 'AccountsIndex' refers to, if the accounts came from JSON.
+    def append_pending(self, accounts_index, build_account, source=None):
+        self.source_index = accounts_index
+        self.build_account = build_account
+        self.source = source
+        numbers = accounts_index.numbers.tolist()
+        # The number index and the index rows are filled in bulk, without a Python loop over every account.
+        self.by_number.update(dict.fromkeys(numbers))
+        self.pending.update(zip(numbers, range(len(numbers))))
+        # Each customer's and category's dictionary is looked up once, then every account number is added to the right ones.
+        # The rate index dictionaries are found the same way the first time each category and rate is seen.
+        customer_dicts = [self.by_customer.setdefault(key, {}) for key in accounts_index.customer_keys]
+        category_dicts = [self.by_category.setdefault(name, {}) for name in ColumnarAccounts.category_names]
+        tier_dicts = {}
+        mortgage = ColumnarAccounts.category_codes["Mortgage"]
+        for number, customer, category, rate, flagged in zip(numbers, accounts_index.customers, accounts_index.categories, accounts_index.rates, accounts_index.flags):
+            customer_dicts[customer][number] = None
+            category_dicts[category][number] = None
+            if category != mortgage:
+                tier_dict = tier_dicts.get((category, rate))
+                if tier_dict is None:
+                    tier_dict = tier_dicts[category, rate] = self.by_tier.setdefault((ColumnarAccounts.category_names[category], rate), {})
+                tier_dict[number] = None
+            elif flagged:
+                self.flagged[number] = None
+        for name in ColumnarAccounts.category_names:
+            if not self.by_category[name]:
+                del self.by_category[name]
+
+
+
+    # Puts 'account' in the place of the stored account with the same number, keeping its place in 'by_number' and in its customer's and category's accounts.
+    # Only the rate index or flagged mortgages are changed if the new state moves it there, the same as 'reindex'.
+    def replace(self, account):
+        with storage_lock:
+            existing = self.get(account.number)
+            if existing.customer_id != account.customer_id or existing.category != account.category:
+                self.remove(existing)
+                self.append(account)
+                return
+            self.by_number[account.number] = account
+            self.pending.pop(account.number, None)
+            self.reindex(account)
+
+
+
+    # Removes an account from the store and from each of the indexes.
+    # Empty customer and category entries are dropped so the indexes do not grow with closed accounts.
+    def remove(self, account):
+        with storage_lock:
+            del self.by_number[account.number]
+            self.pending.pop(account.number, None)
+            del self.by_customer[account.customer_id][account.number]
+            if not self.by_customer[account.customer_id]:
+                del self.by_customer[account.customer_id]
+            del self.by_category[account.category][account.number]
+            if not self.by_category[account.category]:
+                del self.by_category[account.category]
+            self.unindex_query_values(account.number, account.category)
+
+
+
+    # Adds an account to the rate index (if it is a 'Current' or 'Savings' account) or to the flagged mortgages (if it is a flagged 'Mortgage' account).
+    # Must be called while holding 'storage_lock', except while the store is first being filled.
+    def index_query_values(self, number, category, rate, flagged):
+        if category != "Mortgage":
+            self.by_tier.setdefault((category, rate), {})[number] = None
+        elif flagged:
+            self.flagged[number] = None
+
+
+
+    # Removes an account from the rate index or the flagged mortgages.
+    # There are only a few rates for each category, so every one is checked rather than remembering each account's rate.
+    def unindex_query_values(self, number, category):
+        if category == "Mortgage":
+            self.flagged.pop(number, None)
+            return
+        for key in [key for key in self.by_tier if key[0] == category]:
+            numbers = self.by_tier[key]
+            numbers.pop(number, None)
+            if not numbers:
+                del self.by_tier[key]
+
+
+
+    # Moves an account to the right place in the rate index or the flagged mortgages after a change, such as a new foreign exchange fee.
+    # Most changes (such as deposits) do not move the account, which is checked without taking 'storage_lock'.
+    def reindex(self, account):
+        balance, rate, flagged = account_query_values(account)
+        if account.category == "Mortgage":
+            if (account.number in self.flagged) == bool(flagged):
+                return
+        elif account.number in self.by_tier.get((account.category, rate), {}):
+            return
+        with storage_lock:
+            if account.number in self.by_number:
+                self.unindex_query_values(account.number, account.category)
+                self.index_query_values(account.number, account.category, rate, flagged)
+
+
+
+    # Returns the balance in pence of the account with the given number without building it if it has not been built yet, or None if no such account exists.
+    # The pending row is read before the account, as an account is always removed from 'pending' before it is built and changed.
+    def balance_pence(self, number):
+        index = self.source_index
+        row = self.pending.get(number)
+        account = self.by_number.get(number)
+        if account is None and row is not None and index is not None:
+            return index.balances[row]
+        if account is None:
+            account = self.get(number)
+        return None if account is None else account.balance.pence
+
+
+
+    # Returns the account with the given number, building it from the file text if this is the first time it is used.
+    # Accounts are built while holding 'storage_lock', so two threads using the same account for the first time cannot each build their own copy of it.
+    def materialize(self, number):
+        account = self.by_number[number]
+        if account is None:
+            with storage_lock:
+                account = self.by_number[number]
+                if account is None:
+                    account = self.build_account(self.pending.pop(number))
+                    self.by_number[number] = account
+                    # Once every account has been built the imported index and file text are no longer needed.
+                    if not self.pending:
+                        self.source = None
+                        self.source_index = None
+                        self.build_account = None
+        return account
+
+
+
+    # Returns the account with the given number, or None if no such account exists.
+    # The number can be passed as an integer or as the string typed in by the user.
+    # A typed string only matches if it is exactly the account number, the same as comparing it against 'str(account)'.
+    # Anything else, such as a list sent in a request to the SNB server, matches no account.
+    def get(self, number):
+        if isinstance(number, str):
+            try:
+                typed_number = int(number)
+            except ValueError:
+                return None
+            if str(typed_number) != number:
+                return None
+            number = typed_number
+        elif not isinstance(number, int):
+            return None
+        if number not in self.by_number:
+            return None
+        return self.materialize(number)
+
+
+
+    # Returns a list of the accounts registered to a customer, optionally only those of one category.
+    # The cost depends on how many accounts the customer has rather than how many accounts exist at SNB.
+    # The account numbers are copied before any account is built, so accounts opened by another thread at the same time do not disturb the loop.
+    def for_customer(self, customer_id, category=None):
+        customer_accounts = [self.materialize(number) for number in list(self.by_customer.get(customer_id, {}))]
+        if category is None:
+            return customer_accounts
+        return [a for a in customer_accounts if a.category == category]
+
+
+
+    # Returns a list of all the accounts of one category.
+    def in_category(self, category):
+        return [self.materialize(number) for number in list(self.by_category.get(category, {}))]
+
+
+
+    # Gives the number, customer id, category, values from 'account_query_values' and JSON text of every account, in order, for exporting to 'accounts.json'.
+    # The JSON text is indented to sit inside the list of accounts in the file.
+    # Accounts not yet built have their text copied straight from the imported file (if it was JSON) rather than being built just to be saved again.
+    def snapshot_records(self):
+        for number, account in self.by_number.items():
+            if account is None and self.source is None:
+                account = self.materialize(number)
+            elif account is None:
+                row = self.pending[number]
+                text = self.source[self.source_index.starts[row]:self.source_index.ends[row]]
+                # Accounts saved in an older layout (with separate pounds and pence, or a customer name and password instead of a customer id) are converted as they are exported.
+                if '"customer_id":' in text:
+                    index = self.source_index
+                    customer_id = index.customer_keys[index.customers[row]]
+                    yield number, customer_id, ColumnarAccounts.category_names[index.categories[row]], (index.balances[row], index.rates[row], index.flags[row]), text
+                    continue
+                account = account_from_dict(json.loads(text))
+            yield number, account.customer_id, account.category, account_query_values(account), account_json_text(account)
+
+
+
+
+# AccountNumberAllocator hands out unique 8-digit account numbers for new bank accounts.
+# A number is free when it is neither in the account store's number index nor reserved, and both are hash lookups, so checking a number does not depend on how many accounts exist.
+# Numbers are picked at random so customers cannot guess each other's account numbers.
+# If 'account_number_probes' random picks in a row are all taken, whole blocks of 'account_number_block' numbers are checked at once (starting from a random block) and a random free number in the first block with one is used.
+# This keeps allocation quick even when almost every number is in use, and it always finishes while any number is free.
+# Reserved numbers are held back from every other caller until they are released, which is done once their account is in the account store (or if they are no longer needed).
+# Every allocation holds the allocator's lock, so two threads can never be given the same number.
+class AccountNumberAllocator:
+    def __init__(self):
+        self.reserved = set()
+        self.lock = threading.Lock()
+
+
+
+    # Checks whether an account number is neither used by an account nor reserved.
+    def is_free(self, number):
+        return number not in account_store.by_number and number not in self.reserved
+
+
+
+    # Reserves 'count' free account numbers at once, such as for opening many accounts when a large group of customers joins SNB.
+    # The numbers are returned as a list and stay reserved until passed to 'release'.
+    def reserve(self, count):
+        numbers = []
+        with self.lock:
+            for i in range(count):
+                number = self.find_free_number()
+                self.reserved.add(number)
+                numbers.append(number)
+        return numbers
+
+
+
+    # Reserves and returns a single free account number.
+    def allocate(self):
+        return self.reserve(1)[0]
+
+
+
+    # Releases reserved account numbers. Numbers that have been given to an account stay taken through the account store.
+    def release(self, numbers):
+        with self.lock:
+            self.reserved.difference_update(numbers)
+
+
+
+    # Returns a free account number, picking at random and falling back to checking blocks of numbers.
+    # Only called while holding the allocator's lock.
+    def find_free_number(self):
+        for i in range(account_number_probes):
+            number = randint(account_number_lowest, account_number_highest)
+            if self.is_free(number):
+                return number
+        # Each block is checked against the number index and the reserved numbers by 'filterfalse', which does the lookups without a Python loop.
+        # The blocks after the first random one are checked in turn, going back to the lowest block after the highest.
+        blocks = (account_number_highest - account_number_lowest) // account_number_block + 1
+        first_block = randint(0, blocks - 1)
+        for step in range(blocks):
+            start = account_number_lowest + (first_block + step) % blocks * account_number_block
+            block = range(start, min(start + account_number_block, account_number_highest + 1))
+            free = list(filterfalse(self.reserved.__contains__, filterfalse(account_store.by_number.__contains__, block)))
+            if free:
+                return choice(free)
+        raise BankError("SNB has no account numbers left to give to new accounts")
+
+
+
+
+# AccountsIndex lists where each account is in the text of 'accounts.json', along with the values the account store needs to index it.
+# It is built either by scanning the file or, when the file is unchanged since it was written, read straight from the 'accounts.json.idx' file saved alongside it.
+# Each value is kept in a typed 'array' column so the whole index can be saved and read back as raw bytes.
+class AccountsIndex:
+    def __init__(self):
+        self.numbers = array("i")
+        self.starts = array("q")
+        self.ends = array("q")
+        # Position of each account's customer id in 'customer_keys', and the code of each account's category from 'ColumnarAccounts'.
+        self.customers = array("i")
+        self.categories = array("b")
+        # The balance in pence, the foreign exchange fee or interest rate, and the missed payment flag of each account as it was saved, named the same as the columns of 'ColumnarAccounts'.
+        # These let the admin account browser filter and sort accounts that have not been built yet.
+        self.balances = array("q")
+        self.rates = array("b")
+        self.flags = array("b")
+        self.customer_keys = []
+        self.customer_rows = {}
+        # True if any account in the file was saved with a customer name and password instead of a customer id, so the file should be saved again.
+        self.legacy_customers = False
+
+
+
+    def __len__(self):
+        return len(self.numbers)
+
+
+
+    # Adds one account found between 'start' and 'end' in the file text, along with the values given by 'account_query_values'.
+    def add(self, number, customer_id, category, start, end, balance, rate, flagged):
+        if customer_id not in self.customer_rows:
+            self.customer_rows[customer_id] = len(self.customer_keys)
+            self.customer_keys.append(customer_id)
+        self.numbers.append(number)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.customers.append(self.customer_rows[customer_id])
+        self.categories.append(ColumnarAccounts.category_codes[category])
+        self.balances.append(balance)
+        self.rates.append(rate)
+        self.flags.append(flagged)
+
+
+
+    # Saves the index to 'path', labelled with the checksum of the 'accounts.json' text it describes.
+    # The file starts with one line of JSON holding the checksum, the number of accounts and the customer table, followed by the raw bytes of each column.
+    # The index can always be rebuilt by scanning 'accounts.json', so it is written atomically but not forced onto the disk.
+    def save(self, path, checksum):
+        columns = self.columns()
+        header = {"checksum": checksum, "count": len(self), "itemsizes": [column.itemsize for column in columns], "customer_keys": self.customer_keys}
+        with open(path + ".tmp", "wb") as file:
+            file.write(json.dumps(header, separators=(",", ":")).encode("utf-8") + b"\n")
+            for column in columns:
+                column.tofile(file)
+        os.replace(path + ".tmp", path)
+
+
+
+    # Reads an index saved by 'save', returning None unless it exists, is complete and describes the file with the given checksum.
+    # Indexes saved before customers had ids list customer names and passwords, and are not used so that the file is scanned and its accounts converted.
+    @classmethod
+    def load(cls, path, checksum):
+        try:
+            with open(path, "rb") as file:
+                header = json.loads(file.readline())
+                index = cls()
+                if header["checksum"] != checksum or header["itemsizes"] != [column.itemsize for column in index.columns()]:
+                    return None
+                for column in index.columns():
+                    column.fromfile(file, header["count"])
+        except (OSError, ValueError, KeyError, EOFError):
+            return None
+        if not all(isinstance(key, int) for key in header["customer_keys"]):
+            return None
+        index.customer_keys = header["customer_keys"]
+        return index
+
+
+
+    def columns(self):
+        return [self.numbers, self.starts, self.ends, self.balances, self.customers, self.categories, self.rates, self.flags]
+
+
+
+
+# AccountJournal is an append-only log of changes made to accounts since 'accounts.json' was last written.
+# Each line of the journal file is one JSON record, either the full state of the accounts changed by a transaction ("put") or the number of an account that was closed ("delete").
+# A "put" record holds a single "account", or a list of "accounts" when a transaction (such as a transfer) changed several accounts together.
+# Writing one short record per transaction keeps the cost of a deposit or withdrawal the same no matter how many accounts exist at SNB.
+class AccountJournal:
+    def __init__(self, path, fsync_batch, compact_threshold):
+        self.path = path
+        # Records are flushed to the operating system straight away but only forced to disk (fsync) once every 'fsync_batch' records.
+        self.fsync_batch = fsync_batch
+        # Once the journal holds 'compact_threshold' account changes it is folded back into the 'accounts.json' snapshot.
+        self.compact_threshold = compact_threshold
+        self.file = None
+        self.unsynced = 0
+        self.records = 0
+
+
+
+    # Appends a record to the end of the journal file, opening the file the first time it is needed.
+    # 'changes' is the number of account changes the record holds. The journal is synced and compacted by the number of changes rather than records, so a record holding a large batch of changes counts as all of them.
+    def append(self, record, changes=1):
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+        # Compact separators keep each record on a single short line.
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+        self.unsynced += changes
+        self.records += changes
+        if self.unsynced >= self.fsync_batch:
+            self.sync()
+
+
+
+    # Forces any records that have not yet been synced onto the disk.
+    def sync(self):
+        if self.file is not None and self.unsynced > 0:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+
+
+    # Checks whether the journal has grown enough that it should be compacted into the snapshot.
+    # Compacting writes every account, so the journal is also allowed to grow to as many records as there are accounts ('account_count').
+    # This spreads the cost of each compaction over at least as many changes as it writes, so large batches of changes do not compact over and over.
+    def needs_compaction(self, account_count):
+        return self.records >= max(self.compact_threshold, account_count)
+
+
+
+    # Reads back every complete record in the journal file in the order they were written.
+    # If the program stopped partway through writing a record then the last line is incomplete, so reading stops there.
+    def replay(self):
+        records = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if not line.endswith("\n"):
+                        break
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+        except FileNotFoundError:
+            pass
+        self.records = sum(len(record.get("accounts", ())) or 1 for record in records)
+        return records
+
+
+
+    # Empties the journal once every change it holds has been written to the 'accounts.json' snapshot.
+    def truncate(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        with open(self.path, "w", encoding="utf-8"):
+            pass
+        self.unsynced = 0
+        self.records = 0
+
+
+
+
+# AccountStorage is the parent class of the storage classes, which all share the same methods so the application can use whichever one is selected:
+# 'load' fills an account store, 'save' writes every account, 'record_change' and 'record_removal' save the accounts changed by a single transaction, and 'checkpoint' makes sure everything recorded is in the saved file.
+# Customer logins are loaded and saved through the storage as well. By default they are kept in 'customer_records.json' as username:credential pairs.
+class AccountStorage:
+    # Adds the saved customer logins to the 'records' dictionary as username:'Credential' pairs.
+    # Logins saved in the older layout of plain text password:username pairs are converted with 'migrate_customer_records', and logins saved before customers had ids are given one by 'assign_customer_ids'.
+    # True is returned if either was done, so the logins can be saved again in the new layout.
+    def load_customers(self, records):
+        data = read_snapshot("customer_records.json", load_customer_records_snapshot)
+        if all(isinstance(value, str) for value in data.values()):
+            records.update(migrate_customer_records(data))
+            return bool(data)
+        records.update((c_name, Credential.from_dict(credential)) for c_name, credential in data.items())
+        return assign_customer_ids(records)
+
+
+
+    # Writes every customer login in 'records'.
+    def save_customers(self, records):
+        write_snapshot("customer_records.json", json.dumps({c_name: credential.dict() for c_name, credential in records.items()}, indent = 4))
+
+
+
+    # Saves a newly registered customer login. The whole 'customer_records.json' file is written again since it only holds logins.
+    def record_customer(self, records, c_name):
+        self.save_customers(records)
+
+
+
+    # Deletes the backup generations of 'customer_records.json', once the logins have been converted from plain text passwords so that no copy of the passwords is left behind.
+    def discard_plaintext_customers(self):
+        discard_snapshot_backups("customer_records.json")
+
+
+
+    # Deletes the backup generations of the accounts file, once its accounts have been converted from customer names and passwords to customer ids.
+    def discard_plaintext_accounts(self):
+        discard_snapshot_backups(self.path)
+
+
+
+    def close(self):
+        pass
+
+
+
+
+# JsonAccountStorage keeps accounts in the pretty-printed 'accounts.json' file.
+# Changes made between full saves are recorded in an 'AccountJournal' and the file is only rewritten when the journal is compacted or the application exits.
+class JsonAccountStorage(AccountStorage):
+    def __init__(self, path, journal):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.journal = journal
+        self.store = None
+
+
+
+    # Imports the accounts in the file into 'store', then applies any changes recorded in the journal since the file was written.
+    # Every account found is added to the account store without being built, the store builds each one from the file text the first time it is used.
+    # Returns True if any account in the file was saved with a customer name and password instead of a customer id, so the accounts should be saved again.
+    def load(self, store):
+        self.store = store
+        accounts_text, accounts_index = read_snapshot(self.path, self.load_snapshot)
+        store.append_pending(accounts_index, json_account_builder(accounts_text, accounts_index), accounts_text)
+        self.replay_journal(store)
+        return accounts_index.legacy_customers
+
+
+
+    # Finds where each account is in the contents of the file without building any account objects.
+    # Returns the file text along with an 'AccountsIndex' of the accounts in it.
+    # If the file is unchanged since it was written then the index saved alongside it is used, otherwise the file is scanned one account at a time.
+    def load_snapshot(self, contents, checksum):
+        text = contents.decode("utf-8")
+        if checksum is not None:
+            accounts_index = AccountsIndex.load(self.index_path, checksum)
+            if accounts_index is not None:
+                return text, accounts_index
+        return text, scan_accounts_text(text, checksum is None)
+
+
+
+    # Applies the records in the journal to the account store in the order they were written.
+    # A "put" record replaces each stored account with the state in the record, in the same place in the store so the accounts keep their order, and a "delete" record removes the account.
+    # Only accounts that are not in the store yet (those opened since the last snapshot) are added at the end.
+    # Both kinds of record can safely be applied more than once, so a journal that was not emptied after the last snapshot is still replayed correctly.
+    def replay_journal(self, store):
+        for record in self.journal.replay():
+            if record["op"] == "put":
+                for data in record.get("accounts", [record.get("account")]):
+                    account = account_from_dict(data)
+                    if account.number in store:
+                        store.replace(account)
+                    else:
+                        store.append(account)
+            elif record["op"] == "delete":
+                existing = store.get(record["number"])
+                if existing is not None:
+                    store.remove(existing)
+
+
+
+    # Writes every account in 'store' to the file, then empties the journal since every change in it is now part of the file.
+    def save(self, store):
+        # The JSON text of every account is gathered from the account store's 'snapshot_records' method, then laid out as the text of the file.
+        accounts_text, accounts_index = render_accounts_snapshot(store.snapshot_records())
+        # 'write_snapshot' replaces the file in one step so a crash can never leave it half written.
+        checksum = write_snapshot(self.path, accounts_text)
+        # The positions of each account in the text are saved alongside it so the next import does not need to scan the file.
+        accounts_index.save(self.index_path, checksum)
+        self.journal.truncate()
+
+
+
+    # Records a change made to one or more accounts (including newly opened accounts) by appending their new state to the journal.
+    # Accounts changed together (such as both accounts in a transfer) are written as one record, and a record is only replayed if it was written in full.
+    # This means that after a crash the journal holds the change for every account in it or for none of them.
+    def record_change(self, *accounts):
+        if len(accounts) == 1:
+            self.journal.append({"op": "put", "account": accounts[0].dict()})
+        else:
+            self.journal.append({"op": "put", "accounts": [account.dict() for account in accounts]}, len(accounts))
+        self.compact()
+
 
 
+    # Records that an account has been closed by appending its number to the journal.
+    def record_removal(self, account):
+        self.journal.append({"op": "delete", "number": account.number})
+        self.compact()
 
 
-# List of accounts which updates with each account created or deleted and recieves stored accounts from the 'accounts.json' file when the program starts.
-accounts_list = []
 
-# Dictionary of customer 'password:username' key:value pairs. Also recives stored logins from the 'customers.json' file when the program starts.
+    # Once the journal has grown past its threshold every account is saved to the file, which also empties the journal.
+    def compact(self):
+        if self.journal.needs_compaction(len(self.store)):
+            self.save(self.store)
+
+
+
+    def checkpoint(self):
+        self.save(self.store)
+
+
+
+
+# BinaryAccountStorage keeps accounts in the compact binary 'accounts.snb' file laid out by 'ColumnarAccounts.to_bytes'.
+# Every value has a fixed width, so a change to an existing account (such as a new balance) is written straight into its place in the file through a memory map.
+# Opening or closing an account changes the layout of the file, so these still save every account.
+class BinaryAccountStorage(AccountStorage):
+    def __init__(self, path):
+        self.path = path
+        self.store = None
+        self.columns = None
+        self.file = None
+        self.map = None
+
+
+
+    # Imports the accounts in the file into 'store'.
+    # The file is read column by column and accounts are built from the columns the first time they are used.
+    # Returns True if the file was saved before customers had ids, when its customer table held customer names and passwords.
+    def load(self, store):
+        self.store = store
+        self.columns = read_snapshot(self.path, self.load_snapshot)
+        columns = self.columns
+        legacy_customers = columns.version < 4
+        store.append_pending(columns, lambda row: AccountView(columns, row).materialize())
+        # A file saved in an older format version is saved again straight away, so values can be written in place at the positions of the current version.
+        if columns.version != binary_version:
+            self.save(store)
+        else:
+            self.open_map()
+        return legacy_customers
+
+
+
+    # The binary layout is always checked as it is read, which is quick since it only covers the header and the size of each column.
+    def load_snapshot(self, contents, checksum):
+        return ColumnarAccounts.from_bytes(contents)
+
+
+
+    # Opens the file for writing values in place.
+    def open_map(self):
+        self.file = open(self.path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = None
+            self.file = None
+
+
+
+    # Writes every account in 'store' to a new file which replaces the old one in a single step.
+    # Accounts that have not been built since they were imported from a binary file are copied straight from the imported columns.
+    def save(self, store):
+        columns = ColumnarAccounts()
+        for number, account in store.by_number.items():
+            if account is None and isinstance(store.source_index, ColumnarAccounts):
+                columns.append_row(store.source_index, store.pending[number])
+            else:
+                columns.append(store.materialize(number))
+        self.close()
+        write_snapshot(self.path, columns.to_bytes())
+        self.columns = columns
+        self.open_map()
+
+
+
+    # Writes the new values of changed accounts into their place in the file, then forces the part of the file they are in onto the disk.
+    # Accounts that are not in the file yet (newly opened accounts) are added by saving every account.
+    def record_change(self, *accounts):
+        if self.map is None or any(account.number not in self.columns.row_by_number for account in accounts):
+            self.save(self.store)
+            return
+        starts = self.columns.file_starts()
+        offsets = []
+        for account in accounts:
+            row = self.columns.row_by_number[account.number]
+            offsets.append(self.write_value("balances", starts, row, account.balance.pence))
+            if account.category == "Current":
+                offsets.append(self.write_value("rates", starts, row, account.foreign_exchange_fee))
+            elif account.category == "Savings":
+                offsets.append(self.write_value("rates", starts, row, account.interest_rate))
+            elif account.category == "Mortgage":
+                offsets.append(self.write_value("repayments", starts, row, account.monthly_repayment.pence))
+                offsets.append(self.write_value("months", starts, row, account.months_remaining))
+                offsets.append(self.write_value("flags", starts, row, account.flagged_for_missed_payments))
+                offsets.append(self.write_value("payment_accounts", starts, row, account.payment_account or 0))
+        # The flush starts at the page holding the first value written, since flushes must start on a page boundary, and ends just after the last value written.
+        page_start = min(offsets) - min(offsets) % mmap.ALLOCATIONGRANULARITY
+        self.map.flush(page_start, max(offsets) + 8 - page_start)
+
+
+
+    # Writes one value into the file and into the loaded column named 'name', returning where in the file it was written.
+    # 'starts' gives the position in the file where each column starts, from 'ColumnarAccounts.file_starts'.
+    def write_value(self, name, starts, row, value):
+        column = getattr(self.columns, name)
+        column[row] = value
+        offset = starts[name] + row * column.itemsize
+        struct.pack_into("<" + column.typecode, self.map, offset, value)
+        return offset
+
+
+
+    def record_removal(self, account):
+        self.save(self.store)
+
+
+
+    # Every change is already in the file, so there is nothing more to write.
+    def checkpoint(self):
+        if self.map is not None:
+            self.map.flush()
+
+
+
+
+# SqliteAccountStorage keeps accounts and customer logins in the embedded SQLite database 'snb.db'.
+# The 'accounts' table is indexed by account number and by customer, and the 'credentials' table holds the same username:credential pairs as 'customer_records.json'.
+# Each change is saved in its own transaction which only updates the rows of the accounts involved, so nothing is rewritten when the application exits.
+class SqliteAccountStorage(AccountStorage):
+    # Columns of the 'accounts' table. 'rate' holds the foreign exchange fee of a 'Current' account or the interest rate of a 'Savings' account.
+    # The mortgage columns are left as 0 for other categories, the same as in 'ColumnarAccounts'.
+    # 'payment_account' is NULL unless a 'Mortgage' account has a designated payment account, and 'borrowed_ammount' and 'repayment_term' are NULL unless they were recorded when the mortgage was opened.
+    account_columns = ("number", "customer_id", "balance", "category", "rate", "monthly_repayment", "months_remaining", "flagged_for_missed_payment", "payment_account", "borrowed_ammount", "repayment_term")
+    # Columns added to the 'accounts' table after it was first created, which databases created before them are given when opened.
+    # Databases created before 'customer_id' was added have 'c_name' and 'c_pass' columns instead, which 'load' converts.
+    added_columns = ["payment_account", "borrowed_ammount", "repayment_term", "customer_id"]
+    insert_account = "INSERT INTO accounts (" + ", ".join(account_columns) + ") VALUES (" + ", ".join(["?"] * len(account_columns)) + ")"
+
+    def __init__(self, path):
+        self.path = path
+        self.store = None
+        self.connection = None
+
+
+
+    # Opens the database, creating the tables and indexes if they do not exist yet.
+    # Write-ahead logging lets each transaction be saved by appending to the log instead of rewriting pages of the database in place.
+    def connect(self):
+        if self.connection is not None:
+            return
+        # The connection is shared by every thread, with 'storage_lock' making sure only one thread uses it at a time.
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = FULL")
+        with self.connection:
+            # 'id' keeps accounts in the order they were opened, while the unique constraint on 'number' gives the index by account number.
+            self.connection.execute("CREATE TABLE IF NOT EXISTS accounts (id INTEGER PRIMARY KEY, number INTEGER NOT NULL UNIQUE, customer_id INTEGER, balance INTEGER NOT NULL, category TEXT NOT NULL, rate INTEGER NOT NULL, monthly_repayment INTEGER NOT NULL, months_remaining INTEGER NOT NULL, flagged_for_missed_payment INTEGER NOT NULL, payment_account INTEGER, borrowed_ammount INTEGER, repayment_term INTEGER)")
+            # Databases created before a column was added are given the column, left as NULL for every existing account.
+            existing_columns = [column[1] for column in self.connection.execute("PRAGMA table_info(accounts)")]
+            for column in self.added_columns:
+                if column not in existing_columns:
+                    self.connection.execute(f"ALTER TABLE accounts ADD COLUMN {column} INTEGER")
+            if "c_pass" not in existing_columns:
+                self.connection.execute("CREATE INDEX IF NOT EXISTS accounts_by_customer ON accounts (customer_id)")
+            # Databases created before passwords were hashed have a 'customers' table of plain text passwords instead, which 'load_customers' converts.
+            self.connection.execute("CREATE TABLE IF NOT EXISTS credentials (c_name TEXT PRIMARY KEY, customer_id INTEGER, salt BLOB NOT NULL, iterations INTEGER NOT NULL, hash BLOB NOT NULL)")
+            if "customer_id" not in [column[1] for column in self.connection.execute("PRAGMA table_info(credentials)")]:
+                self.connection.execute("ALTER TABLE credentials ADD COLUMN customer_id INTEGER")
+
+
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+
+    # Imports the accounts in the database into 'store'.
+    # Only the number, customer and category of each account are read so the store can index them, every account is built from its row the first time it is used.
+    # Unlike the files, a database that does not exist yet is not an error here as 'sqlite3' would simply create an empty one, so a missing database is reported the same as a missing file.
+    # The accounts are converted in place if the database was created before customers had ids, so nothing more needs saving and False is returned.
+    def load(self, store):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+        self.store = store
+        self.connect()
+        if "c_pass" in [column[1] for column in self.connection.execute("PRAGMA table_info(accounts)")]:
+            self.migrate_customers()
+        accounts_index = AccountsIndex()
+        for number, customer_id, category, balance, rate, flagged in self.connection.execute("SELECT number, customer_id, category, balance, rate, flagged_for_missed_payment FROM accounts ORDER BY id"):
+            if category in ColumnarAccounts.category_codes:
+                accounts_index.add(number, customer_id, category, 0, 0, balance, rate, flagged)
+        numbers = accounts_index.numbers
+        store.append_pending(accounts_index, lambda row: self.fetch(numbers[row]))
+        return False
+
+
+
+    # Gives every account the customer id of the login with its customer name (see 'legacy_customer_id'), then drops the customer name and password columns.
+    # The database file is rebuilt afterwards so none of the plain text passwords are left in its free space.
+    def migrate_customers(self):
+        with self.connection:
+            customers = self.connection.execute("SELECT DISTINCT c_name FROM accounts").fetchall()
+            self.connection.executemany("UPDATE accounts SET customer_id = ? WHERE c_name = ?", [(legacy_customer_id(c_name), c_name) for (c_name,) in customers])
+            self.connection.execute("DROP INDEX IF EXISTS accounts_by_customer")
+            self.connection.execute("ALTER TABLE accounts DROP COLUMN c_name")
+            self.connection.execute("ALTER TABLE accounts DROP COLUMN c_pass")
+            self.connection.execute("CREATE INDEX accounts_by_customer ON accounts (customer_id)")
+        self.connection.execute("VACUUM")
+
+
+
+    # Builds the account with the given number from its row in the database.
+    def fetch(self, number):
+        row = self.connection.execute("SELECT " + ", ".join(self.account_columns) + " FROM accounts WHERE number = ?", (number,)).fetchone()
+        return account_from_dict(self.row_to_dict(row))
+
+
+
+    # Turns a row of the 'accounts' table into the same dictionary as the account's 'dict' method.
+    @classmethod
+    def row_to_dict(cls, row):
+        data = dict(zip(cls.account_columns, row))
+        rate = data.pop("rate")
+        if data["category"] == "Current":
+            data["foreign_exchange_fee"] = rate
+        elif data["category"] == "Savings":
+            data["interest_rate"] = rate
+        if data["category"] == "Mortgage":
+            data["flagged_for_missed_payment"] = bool(data["flagged_for_missed_payment"])
+        else:
+            for key in ("monthly_repayment", "months_remaining", "flagged_for_missed_payment", "payment_account", "borrowed_ammount", "repayment_term"):
+                del data[key]
+        return data
+
+
+
+    # Turns an account into a row of the 'accounts' table.
+    @staticmethod
+    def account_row(account):
+        if account.category == "Current":
+            rate = account.foreign_exchange_fee
+        elif account.category == "Savings":
+            rate = account.interest_rate
+        else:
+            rate = 0
+        if account.category == "Mortgage":
+            borrowed_ammount = None if account.borrowed_ammount is None else account.borrowed_ammount.pence
+            mortgage_values = (account.monthly_repayment.pence, account.months_remaining, int(account.flagged_for_missed_payments), account.payment_account, borrowed_ammount, account.repayment_term)
+        else:
+            mortgage_values = (0, 0, 0, None, None, None)
+        return (account.number, account.customer_id, account.balance.pence, account.category, rate) + mortgage_values
+
+
+
+    # Replaces every account in the database with the accounts in 'store', in a single transaction.
+    def save(self, store):
+        self.connect()
+        with self.connection:
+            self.connection.execute("DELETE FROM accounts")
+            self.connection.executemany(self.insert_account, (self.account_row(account) for account in store))
+
+
+
+    # Saves the new state of one or more accounts in a single transaction, so a change involving two accounts (such as a mortgage payment) is saved for both or for neither.
+    # Existing accounts keep their row and only have their values updated, and newly opened accounts are added as a new row.
+    def record_change(self, *accounts):
+        updates = ", ".join(f"{column} = excluded.{column}" for column in self.account_columns[1:])
+        with self.connection:
+            self.connection.executemany(f"{self.insert_account} ON CONFLICT (number) DO UPDATE SET {updates}", [self.account_row(account) for account in accounts])
+
+
+
+    def record_removal(self, account):
+        with self.connection:
+            self.connection.execute("DELETE FROM accounts WHERE number = ?", (account.number,))
+
+
+
+    # Every change is committed as it is made, so there is nothing more to write.
+    def checkpoint(self):
+        pass
+
+
+
+    # Logins still in the older 'customers' table of plain text passwords are converted with 'migrate_customer_records', and True is returned so they can be saved in the 'credentials' table.
+    def load_customers(self, records):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+        self.connect()
+        records.update((c_name, Credential(customer_id, salt, iterations, key)) for c_name, customer_id, salt, iterations, key in self.connection.execute("SELECT c_name, customer_id, salt, iterations, hash FROM credentials"))
+        if self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'customers'").fetchone() is None:
+            return assign_customer_ids(records)
+        plaintext = dict(self.connection.execute("SELECT c_pass, c_name FROM customers"))
+        records.update(migrate_customer_records(plaintext))
+        return True
+
+
+
+    # Adds or updates every customer login in 'records'. Customers are never removed at SNB so existing logins are left in place.
+    def save_customers(self, records):
+        self.connect()
+        with self.connection:
+            self.connection.executemany("INSERT INTO credentials (c_name, customer_id, salt, iterations, hash) VALUES (?, ?, ?, ?, ?) ON CONFLICT (c_name) DO UPDATE SET customer_id = excluded.customer_id, salt = excluded.salt, iterations = excluded.iterations, hash = excluded.hash", [(c_name, credential.customer_id, credential.salt, credential.iterations, credential.key) for c_name, credential in records.items()])
+
+
+
+    # Saves a newly registered customer login as a single row.
+    def record_customer(self, records, c_name):
+        credential = records[c_name]
+        with self.connection:
+            self.connection.execute("INSERT INTO credentials (c_name, customer_id, salt, iterations, hash) VALUES (?, ?, ?, ?, ?)", (c_name, credential.customer_id, credential.salt, credential.iterations, credential.key))
+
+
+
+    # Drops the older 'customers' table of plain text passwords once they have been converted, and rebuilds the database file so none of them are left in its free space.
+    def discard_plaintext_customers(self):
+        with self.connection:
+            self.connection.execute("DROP TABLE IF EXISTS customers")
+        self.connection.execute("VACUUM")
+
+
+
+    # The accounts are converted by 'migrate_customers' as they are loaded, which already rebuilds the database file.
+    def discard_plaintext_accounts(self):
+        pass
+
+
+
+
+# Creates the storage for the given format: "json" for 'accounts.json', "binary" for 'accounts.snb' or "sqlite" for the 'snb.db' database.
+def create_account_storage(storage_format):
+    if storage_format == "binary":
+        return BinaryAccountStorage("accounts.snb")
+    if storage_format == "sqlite":
+        return SqliteAccountStorage("snb.db")
+    return JsonAccountStorage("accounts.json", AccountJournal("accounts_journal.jsonl", 32, 10000))
+
+
+
+
+# Store of all accounts which updates with each account created or deleted and recieves stored accounts from the 'accounts.json' file when the program starts.
+account_store = AccountStore()
+
+# Hands out the account number of every new bank account. See 'AccountNumberAllocator'.
+account_number_allocator = AccountNumberAllocator()
+
+# Dictionary of customer 'username:Credential' key:value pairs. Also recives stored logins from the 'customer_records.json' file when the program starts.
 customer_records = {}
 
+# Username of each customer by their customer id, kept alongside 'customer_records' so an account's customer can be shown by name.
+customer_names = {}
+
+# Highest customer id given so far, set when the customer records are loaded and counted up by 'next_customer_id' so registering a customer does not look through every login.
+last_customer_id = 0
+
+# Number of PBKDF2 iterations used to hash new customer passwords, which sets how long checking a password takes (about a quarter of a second).
+# It can be raised as computers get faster, since every saved credential keeps the number of iterations it was hashed with.
+credential_iterations = 600000
+
+# Credential checked when a login names a username that does not exist, so the login takes as long as one with a wrong password and does not give away which usernames exist.
+missing_credential = Credential(None, bytes(16), credential_iterations, bytes(32))
+
+# Logged in SNB server sessions by their token, and how many seconds a token can go unused before the customer has to log in again.
+session_cache = {}
+session_lifetime = 1800
+
 # Admin login information stored in the same format as the customer logins. Only one admin login exists but there is potential to add more.
 admin_records = {"access": "admin"}
 
+# How many accounts the admin account browser shows on each page.
+admin_page_size = 20
+
 # Attributes that the admin user can change on 'Current' or 'Savings' customer accounts. Labeled as standard, premium or best to relect the effect they would have on an account in the real world.
 foreign_exchange_fee_categories = {"standard": 3, "premium": 1, "best": 0}
 saving_interest_categories = {"standard": 4, "premium": 5, "best": 7}
 
-# Fixed interest of 5% is assumed for on mortgage accounts in the SNB application.
-fixed_mortgage_interest = 1.05
+# Fixed interest of 5% is assumed for on mortgage accounts in the SNB application. It is added once to the ammount borrowed, as a whole percentage.
+fixed_mortgage_interest = 5
+
+# The least SNB lends for a mortgage, and the shortest and longest repayment terms it offers in months.
+minimum_mortgage_ammount = Money.from_pounds_pence(10000, 0)
+minimum_mortgage_term = 6
+maximum_mortgage_term = 500
+
+# Format accounts are stored in: "json" ('accounts.json'), "binary" ('accounts.snb') or "sqlite" ('snb.db'). This can also be chosen with the '--storage' option when starting the application.
+# With "sqlite" the customer logins are kept in the database too, otherwise they are kept in 'customer_records.json'.
+account_storage_format = "json"
+
+# Names of the storage formats, in the order they are offered by the '--storage' option.
+account_storage_formats = ["json", "binary", "sqlite"]
+
+# Storage the accounts are imported from and saved to.
+# With JSON storage, changes made since 'accounts.json' was last written are kept in the 'accounts_journal.jsonl' journal.
+# Journal records are synced to disk in batches of 32 and the journal is compacted into 'accounts.json' once it holds 10,000 records.
+account_storage = create_account_storage(account_storage_format)
+
+# Number of previous versions of 'accounts.json' and 'customer_records.json' kept as backups each time they are written.
+snapshot_generations = 3
+
+# Header at the start of the binary 'accounts.snb' file: the letters 'SNBA', the format version, padding, and the number of accounts, followed by padding to 16 bytes.
+binary_header = struct.Struct("<4sHxxI4x")
+
+# Format version of the binary 'accounts.snb' files written by this version of the application.
+# Version 2 added the mortgage payment account column, version 3 the ammount borrowed and repayment term of each mortgage, and version 4 replaced the customer names and passwords in the customer table with customer ids.
+binary_version = 4
+
+# Repayment terms in months and ammounts borrowed quoted by the 'rate-sheet' command when none are given.
+rate_sheet_terms = [60, 120, 180, 240, 300, 360]
+rate_sheet_ammounts = [Money.from_pounds_pence(pounds, 0) for pounds in range(50000, 500001, 50000)]
+
+# Number of upcoming payments of a mortgage's repayment schedule shown by 'view_months_left'.
+schedule_months_shown = 12
+
+# Matches an ammount written in pounds and pence with up to two pence digits, such as '123.45'.
+money_text = re.compile(r"(\d+)(?:\.(\d{1,2}))?")
+
+# Number of transactions in a batch posting file that are applied and saved together.
+posting_batch_size = 10000
+
+# How often interest on 'Savings' accounts can be accrued, and the number of periods of that length in a year.
+# The yearly 'interest_rate' of an account is split evenly across the periods and compounded at the end of each one.
+interest_periods_per_year = {"daily": 365, "monthly": 12}
+
+# File holding the date savings interest was last accrued up to, so the next run can catch up on every period missed since.
+interest_accrual_path = "interest_accrual.json"
+
+# Address the SNB server listens on when started with the 'serve' command. Only connections from the same computer are accepted unless another host is given.
+server_host = "127.0.0.1"
+server_port = 8750
+
+# Timers and counters are only kept for the hot paths of the application when it is started with '--metrics' (see 'enable_metrics').
+# While they are off no function is wrapped and nothing is counted, so they cost nothing at all.
+metrics_enabled = False
+# File the metrics are written to when the application or a command finishes, and regularly while the SNB server runs. JSON if it ends in '.json', Prometheus text otherwise.
+metrics_path = None
+metrics_interval = 10
+# Upper bounds in seconds of the buckets of every 'LatencyHistogram', doubling from a microsecond to just over a minute.
+metrics_buckets = [2 ** i / 1000000 for i in range(27)]
+# Every latency histogram and counter kept while metrics are turned on, by name.
+metric_histograms = {}
+metric_counters = {}
+metric_counters_lock = threading.Lock()
+# Functions timed while metrics are turned on, along with the methods of the storage and account store listed below.
+# A function listed with a counter name also counts each time it returns None or False, such as a login with the wrong password.
+metered_functions = {
+    "import_accounts": None,
+    "import_customer_records": None,
+    "export_accounts": None,
+    "export_customer_records": None,
+    "verify_login": "login_failures",
+    "cached_session": None,
+    "open_account": None,
+    "deposit": None,
+    "withdraw": None,
+    "transfer": None,
+    "transfer_many": None,
+    "pay_mortgage": None,
+    "close_account": None,
+    "set_fee_tier": None,
+    "set_interest_tier": None,
+    "set_missed_payment_flag": None,
+    "set_payment_account": None,
+    "reprice_accounts": None,
+    "month_end_mortgage_run": None,
+    "savings_interest_run": None,
+    "post_transactions": None,
+}
+metered_storage_methods = ["load", "save", "record_change", "record_removal", "compact", "checkpoint", "load_customers", "save_customers", "record_customer"]
+metered_lookup_methods = {"get": "lookup_misses", "for_customer": None, "in_category": None}
+
+# Folder the CPU profiles and allocation snapshots of each phase are written to when the application is started with '--profile', or None while profiling is off (see 'enable_profiling').
+profile_directory = None
+# Number of functions and lines of code listed for each phase in the profiling summary.
+profile_summary_lines = 20
+# Every profiled phase by name, and the phases running in each thread with the innermost last.
+profiled_phases = {}
+profiling_threads = threading.local()
+# Functions profiled as a run of a named phase while profiling is turned on, along with whether allocation snapshots are taken around each run.
+# Every menu is also profiled as a run of the "menu" phase, without snapshots (see 'profiled_run_menus').
+profiled_functions = {
+    "import_accounts": ("import", True),
+    "import_customer_records": ("import", True),
+    "export_accounts": ("export", True),
+    "export_customer_records": ("export", True),
+    "convert_storage": ("convert", True),
+    "month_end_mortgage_run": ("month-end", True),
+    "savings_interest_run": ("interest", True),
+    "post_transactions": ("post", True),
+    "reprice_accounts": ("reprice", True),
+    "handle_request": ("request", False),
+}
+
+# The 'persistence_batch' open in each thread. 'persistence_batches.changes' holds the account changes recorded in the current thread's open batch, or is missing when no batch is open.
+# The changes are keyed by account number so an account changed many times in a batch is only saved once.
+persistence_batches = threading.local()
+
+# Only one thread at a time can save to the storage, build accounts from it or change the account store's indexes.
+# It is re-entrant, since saving every account (for example when the journal is compacted) builds accounts that have not been built yet.
+storage_lock = threading.RLock()
+
+# Range of the 8-digit account numbers given to new accounts, how many random numbers are tried before the allocator checks whole blocks of numbers, and how many numbers are in each block.
+account_number_lowest = 10000000
+account_number_highest = 99999999
+account_number_probes = 32
+account_number_block = 1024
+
+# Locks held by transactions while they change accounts. Each account uses the lock at its account number modulo 'account_lock_count'.
+# A fixed set of locks is shared out between the accounts rather than one lock being kept for every account at the bank, and two transactions only wait for each other if their accounts share a lock.
+account_lock_count = 1024
+account_locks = [threading.Lock() for i in range(account_lock_count)]
+
+# Matches the whitespace JSON allows between values, used when scanning 'accounts.json' one account at a time.
+json_whitespace = re.compile(r"[ \t\n\r]*")
 
 
 
 
 # Account is the base class that all bank accounts at SNB inherit from.
-# It includes a unnique 8-digit account number, the customer name and password, the account balance divided in pounds and pence, and the category of account it falls under.
+# It includes a unnique 8-digit account number, the id of the customer it belongs to, the account balance as a 'Money' ammount, and the category of account it falls under.
+# '__slots__' is used in the account classes so that each account object stores its attributes in fixed slots rather than its own dictionary, which uses much less memory per account.
 class Account:
-    def __init__(self, number, c_name, c_pass, pounds_balance, pence_balance, category):
+    __slots__ = ("number", "customer_id", "balance", "category")
+
+    def __init__(self, number, customer_id, balance, category):
         self.number = number
-        self.c_name = c_name
-        self.c_pass = c_pass
-        self.pounds_balance = pounds_balance
-        self.pence_balance = pence_balance
-        self.category = category
+        # The customer is referred to by their id, so neither their username nor their password needs to be kept with the account.
+        self.customer_id = customer_id
+        self.balance = balance
+        # The category is interned so that every account of the same category shares one copy of the string.
+        self.category = sys.intern(category)
 
 
 
@@ -66,38 +1761,48 @@ class Account:
 
 
     # 'dict' method returns the account object as a dictionary. This is used to perform a dump to a JSON file effectively.
+    # The balance is stored as a whole number of pence.
     def dict(self):
-        return {"number": self.number, "c_name": self.c_name, "c_pass": self.c_pass, "pounds_balance": self.pounds_balance, "pence_balance": self.pence_balance, "category": self.category}
+        return {"number": self.number, "customer_id": self.customer_id, "balance": self.balance.pence, "category": self.category}
     
 
 
     # Opens the customer account menu for the account object.
+    # Like every menu it returns the next menu to show (see 'run_menus').
     def account_menu(self):
         print("----------")
         # Displays the category of account as well as the account number.
         print(f"You have selected {self.category} account: {self}")
         # Gives 5 options but options 2 and 3 differ depending on whether the object is a 'Current' or 'Savings account or if it is a 'Mortgage' account.
         print("1. View balance")
-        # 'Current' and 'Savings' accounts allow the user to deposit or withdraw money from this menu.
+        # 'Current' and 'Savings' accounts allow the user to deposit, withdraw or transfer money from this menu, which moves the last two options along by one.
         if self.category == "Current" or self.category == "Savings":
             print("2. Deposit money")
             print("3. Withdraw money")
+            print("4. Transfer money")
+            back_choice = "5"
+            exit_choice = "6"
         # 'Mortgage' accounts allow the user to view the months left to pay on the mortgage or to make a monthly payment towards the mortgage.
         elif self.category == "Mortgage":
             print("2. View months left on mortgage")
             print("3. Make a monthly payment")
-        print("4. Back to customer menu")
-        print("5. Exit SNB Application")
+            back_choice = "4"
+            exit_choice = "5"
+        print(f"{back_choice}. Back to customer menu")
+        print(f"{exit_choice}. Exit SNB Application")
         print("----------")
-        choice = input("Please select 1, 2, 3, 4 or 5: ")
+        # The choices available are every number from 1 up to the exit option, for example '1, 2, 3, 4 or 5'.
+        choices = [str(option) for option in range(1, int(exit_choice) + 1)]
+        choices_text = ", ".join(choices[:-1]) + " or " + choices[-1]
+        choice = input(f"Please select {choices_text}: ")
 
-        while choice != "1" and choice != "2" and choice != "3" and choice != "4" and choice != "5":
-            choice = input("Incorrect input, please state either 1, 2, 3, 4 or 5 (by typing 1, 2, 3, 4 or 5): ")
+        while choice not in choices:
+            choice = input(f"Incorrect input, please state either {choices_text} (by typing {choices_text}): ")
 
         # If 1 is selected by the user then the account balance is displayed through the corresponding method.
         if choice == "1":
             print("----------")
-            self.show_balance()
+            return self.show_balance
 
         # If choice 2 is selected and the account is not a 'Mortgage' account then the process to deposit money begins.
         elif choice == "2":
@@ -108,12 +1813,12 @@ class Account:
                 # The user is asked how much they would like to deposit and their selected ammount is correctly formated with the 'format_currency' function.
                 deposit_ammount = format_currency()
                 print("----------")
-                # The deposit method is then called passing the pounds and pence values as arguments.
-                self.deposit(deposit_ammount[0], deposit_ammount[1])
-            # if choice 2 is selected and the account is a 'Mortgage' account then the method to view the months left on the mortgage is called.
+                # The deposit menu method is shown next with the ammount passed as an argument.
+                return partial(self.deposit_menu, deposit_ammount)
+            # if choice 2 is selected and the account is a 'Mortgage' account then the method to view the months left on the mortgage is shown next.
             elif self.category == "Mortgage":
                 print("----------")
-                self.view_months_left()
+                return self.view_months_left
 
         # if choice 3 is selected and the account is not a 'Mortgage' account then the process to withdraw money from the account begins.
         elif choice == "3":
@@ -124,29 +1829,31 @@ class Account:
                 # The user is asked how much they would like to withdraw and their selected ammount is correctly formated with the 'format_currency' function.
                 withdraw_ammount = format_currency()
                 print("----------")
-                # The withdraw method is then called passing the pounds and pence values as arguments.
-                self.withdraw(withdraw_ammount[0], withdraw_ammount[1])
-            # if choice 3 is selected and the account is a 'Mortgage' account then the method to make a monthly payment is called.
+                # The withdraw menu method is shown next with the ammount passed as an argument.
+                return partial(self.withdraw_menu, withdraw_ammount)
+            # if choice 3 is selected and the account is a 'Mortgage' account then the method to make a monthly payment is shown next.
             elif self.category == "Mortgage":
                 print("----------")
-                self.make_monthly_payment()
+                return self.make_monthly_payment
 
-        # If choice 4 is selected then the user is taken back to the customer menu.
-        elif choice == "4":
-            customer_menu()
+        # If the back option is selected then the user is taken back to the customer menu.
+        elif choice == back_choice:
+            return customer_menu
+
+        # If the exit option is selected then the user exits the SNB Application.
+        elif choice == exit_choice:
+            return exit
 
-        # If choice 5 is selected then the user exits the SNB Application.
-        elif choice == "5":
-            exit()
+        # If choice 4 is selected and the account is not a 'Mortgage' account then the process to transfer money to another account begins.
+        elif choice == "4":
+            return self.transfer_menu
     
 
 
     # Displays the balance in the account object.
     def show_balance(self):
-        # Formats the full balance by taking the pounds and pence balance of the object separated by a '.' with a pound sign at the begining.
-        full_balance = f"£{self.pounds_balance}.{self.pence_balance:02d}"
         # Displays the formated balance and gives an option to return to the account menu or exit the SNB Application.
-        print(f"Account balance is: {full_balance}")
+        print(f"Account balance is: {self.balance}")
         print("-")
         print("1. Return to account menu")
         print("2. Exit SNB application")
@@ -157,35 +1864,24 @@ class Account:
             balance_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
         
         if balance_choice == "1":
-            self.account_menu()
+            return self.account_menu
         elif balance_choice == "2":
-            exit()
-
-
-
-    # Deposits money into an account object.
-    # Assumes that the ammount to deposit has been correctly formatted with the 'format_currency' function and takes the separate pounds and pence ammmounts as arguments.
-    def deposit(self, pounds_ammount, pence_ammount):
-        # Adds the arguments increasing the pounds and pence balance by however much is being deposited.
-        self.pounds_balance += pounds_ammount
-        self.pence_balance += pence_ammount
+            return exit
 
-        # If the account object's pence balance becomes higher than 100 then 100 is taken away from the pence balance and 1 is added to the pounds balance.
-        # This keeps the currency correct in the account.
-        if self.pence_balance >= 100:
-            self.pounds_balance += 1
-            self.pence_balance -= 100
 
-        # 'full_ammount' and 'full_balance' are variables that store the correctly formated ammount deposited and balance.
-        full_ammount = f"£{pounds_ammount}.{pence_ammount:02d}"
-        full_balance = f"£{self.pounds_balance}.{self.pence_balance:02d}"
 
-        # Displays the outcome of the deposit.
-        print(f"You have deposited {full_ammount} into your account")
-        print(f"Your new balance is now: {full_balance}")
+    # Deposits money into an account object through the 'deposit' transaction function and displays the outcome.
+    # Assumes that the ammount to deposit has been correctly formatted with the 'format_currency' function and takes the 'Money' ammount as an argument.
+    def deposit_menu(self, ammount):
+        # The transaction function increases the balance by however much is being deposited and saves the change.
+        try:
+            deposit(self.number, ammount)
+            # Displays the outcome of the deposit.
+            print(f"You have deposited {ammount} into your account")
+            print(f"Your new balance is now: {self.balance}")
+        except BankError as error:
+            print(f"Deposit unsuccessful, {error}")
 
-        # Saves the state of the account object by exporting the accounts.
-        export_accounts()
         print("----------")
         print("1. Return to account menu")
         print("2. Exit SNB application")
@@ -197,53 +1893,25 @@ class Account:
             deposit_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
         
         if deposit_choice == "1":
-            self.account_menu()
+            return self.account_menu
         elif deposit_choice == "2":
-            exit()
-
-
-
-    # Withdraws money from an account object.
-    # Assumes that the ammount to withdraw has been correctly formatted with the 'format_currency' function and takes the separate pounds and pence ammmounts as arguments.
-    def withdraw(self, pounds_ammount, pence_ammount):
-        # If the ammount of pounds requested to withdraw is more than the pounds in the account object, then the withdraw is cancelled.
-        if pounds_ammount > self.pounds_balance:
-            full_balance = f"£{self.pounds_balance}.{self.pence_balance:02d}"
-            print("Withdraw unsuccessful, not enough funds in your account")
-            print(f"Account balance: {full_balance}")
-
-        # If the pounds ammount and pounds balance is equal, and the pence ammount is greater than the pence balance then the withdraw is cancelled.
-        elif pounds_ammount == self.pounds_balance and pence_ammount > self.pence_balance:
-            full_balance = f"£{self.pounds_balance}.{self.pence_balance:02d}"
-            print("Withdraw unsuccessful, not enough funds in your account")
-            print(f"Account balance: {full_balance}")
-
-        # If the pounds ammount is less than the pounds balance and the pence ammount is greater than the pence balance then the transaction goes ahead but the account balance must be correctly formatted.
-        elif pounds_ammount < self.pounds_balance and pence_ammount > self.pence_balance:
-            # The pounds ammount is subtracted from the pounds balance, then the pounds balance is subtracted 1.
-            self.pounds_balance -= pounds_ammount
-            self.pounds_balance -= 1
-            # The pence balance is subtracted the pence ammount putting it in a negative but then it has 100 added to it.
-            # This represents how currency actually works since 100 pence represent 1 pound.
-            self.pence_balance -= pence_ammount
-            self.pence_balance += 100
-            full_ammount = f"£{pounds_ammount}.{pence_ammount:02d}"
-            full_balance = f"£{self.pounds_balance}.{self.pence_balance:02d}"
-            print(f"Withdraw of {full_ammount} successful")
-            print(f"Your new balance is now: {full_balance}")
-
-        # If the pounds ammount is smaller or equal to pounds balance and pence ammount is smaller or equal to pence balance then the transaction goes ahead.
-        elif pounds_ammount <= self.pounds_balance and pence_ammount <= self.pence_balance:
-            # Pounds and pence ammounts are subtracted from the account object's pounds and pence balance.
-            self.pounds_balance -= pounds_ammount
-            self.pence_balance -= pence_ammount
-            full_ammount = f"£{pounds_ammount}.{pence_ammount:02d}"
-            full_balance = f"£{self.pounds_balance}.{self.pence_balance:02d}"
-            print(f"Withdraw of {full_ammount} successful")
-            print(f"Your new balance is now: {full_balance}")
-        
-        # Accounts are exported to save changes.
-        export_accounts()
+            return exit
+
+
+
+    # Withdraws money from an account object through the 'withdraw' transaction function and displays the outcome.
+    # Assumes that the ammount to withdraw has been correctly formatted with the 'format_currency' function and takes the 'Money' ammount as an argument.
+    def withdraw_menu(self, ammount):
+        # The transaction function subtracts the ammount from the account object's balance and saves the change.
+        try:
+            withdraw(self.number, ammount)
+            print(f"Withdraw of {ammount} successful")
+            print(f"Your new balance is now: {self.balance}")
+        # If the ammount requested to withdraw is more than the balance of the account object, then the withdraw is cancelled.
+        except BankError as error:
+            print(f"Withdraw unsuccessful, {error}")
+            print(f"Account balance: {self.balance}")
+
         print("----------")
         print("1. Return to account menu")
         print("2. Exit SNB application")
@@ -255,9 +1923,46 @@ class Account:
             withdraw_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
         
         if withdraw_choice == "1":
-            self.account_menu()
+            return self.account_menu
         elif withdraw_choice == "2":
-            exit()
+            return exit
+
+
+
+    # Transfers money from the account object to any account at SNB through the 'transfer' transaction function and displays the outcome.
+    # The account transferred to can belong to the same customer or to another customer, and is given by its account number.
+    def transfer_menu(self):
+        print("----------")
+        to_number = input("Please type the 8-digit account number to transfer money to: ").strip()
+        print("----------")
+        print("How much money would you like to transfer?")
+        print("----------")
+        # The ammount is correctly formated with the 'format_currency' function, the same as for deposits and withdrawals.
+        ammount = format_currency()
+        print("----------")
+        # Both accounts are changed and saved together, so the money always leaves one account and arrives in the other.
+        try:
+            transfer(self.number, to_number, ammount)
+            print(f"Transfer of {ammount} to account {to_number} successful")
+            print(f"Your new balance is now: {self.balance}")
+        except BankError as error:
+            print(f"Transfer unsuccessful, {error}")
+            print(f"Account balance: {self.balance}")
+
+        print("----------")
+        print("1. Return to account menu")
+        print("2. Exit SNB application")
+        print("----------")
+        # User is given the option to go back to the account menu or exit the SNB Application.
+        transfer_choice = input("Please select 1 or 2: ")
+
+        while transfer_choice != "1" and transfer_choice != "2":
+            transfer_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
+
+        if transfer_choice == "1":
+            return self.account_menu
+        elif transfer_choice == "2":
+            return exit
 
 
 
@@ -282,23 +1987,26 @@ class Account:
         print("----------")
         access_choice = input("Please select 1, 2, 3, 4 or 5: ")
 
-        # Depending on the choice the user can view the account information, close the account, return to the admin menu, or exit the SNB Application by calling the corresponding methods.
-        # If the user chooses 2 then the method called will depend on the account object category.
+        while access_choice not in ("1", "2", "3", "4", "5"):
+            access_choice = input("Incorrect input, please state either 1, 2, 3, 4 or 5 (by typing 1, 2, 3, 4 or 5): ")
+
+        # Depending on the choice the user can view the account information, close the account, return to the admin menu, or exit the SNB Application through the corresponding methods.
+        # If the user chooses 2 then the method returned will depend on the account object category.
         if access_choice == "1":
-            self.admin_display_info()
+            return self.admin_display_info
         elif access_choice == "2":
             if self.category == "Current":
-                self.admin_alter_foreign_exchange_fees()
+                return self.admin_alter_foreign_exchange_fees
             elif self.category == "Savings":
-                self.admin_alter_interest_rate()
+                return self.admin_alter_interest_rate
             elif self.category == "Mortgage":
-                self.admin_flag_or_unflag()
+                return self.admin_flag_or_unflag
         elif access_choice == "3":
-            self.admin_close_account()
+            return self.admin_close_account
         elif access_choice == "4":
-            admin_menu()
+            return admin_menu
         elif access_choice == "5":
-            exit()
+            return exit
 
 
     
@@ -306,8 +2014,8 @@ class Account:
     def admin_display_info(self):
         print("----------")
         print(f"Account number: {self.number}")
-        print(f"Customer: {self.c_name}")
-        print(f"Balance: £{self.pounds_balance}.{self.pence_balance}")
+        print(f"Customer: {customer_name(self.customer_id)}")
+        print(f"Balance: {self.balance}")
         print(f"Account category: {self.category}")
         # Depending on the category of account different information will be displayed.
         if self.category == "Current":
@@ -315,7 +2023,7 @@ class Account:
         elif self.category == "Savings":
             print(f"Interest rate: {self.interest_rate}%")
         elif self.category == "Mortgage":
-            print(f"Monthly repayments: {self.months_remaining}")
+            print(f"Monthly repayments: {self.monthly_repayment}")
             print(f"Months remaining: {self.months_remaining}")
             print(f"Flagged for missed payments: {self.flagged_for_missed_payments}")
         print("----------")
@@ -329,9 +2037,9 @@ class Account:
             display_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
             
         if display_choice == "1":
-            self.admin_account_menu()
+            return self.admin_account_menu
         elif display_choice == "2":
-            exit()
+            return exit
 
 
 
@@ -349,13 +2057,16 @@ class Account:
         while delete_choice != "1" and delete_choice != "2":
             delete_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
 
-        # If the user chooses to delete the bank account then the bank account is removed from the accounts list.
+        # If the user chooses to delete the bank account then it is closed through the 'close_account' transaction function, which removes it from the account store and saves the closure.
+        # The account may have been closed by someone else through the SNB server since it was selected, in which case the reason is displayed instead.
         if delete_choice == "1":
-            accounts_list.remove(self)
-            # The accounts list is then exported to save the changes.
-            export_accounts()
-            print("----------")
-            print("Account deleted")
+            try:
+                close_account(self.number)
+                print("----------")
+                print("Account deleted")
+            except BankError as error:
+                print("----------")
+                print(f"Account could not be closed, {error}")
             print("1. Return to admin menu")
             print("2. Exit SNB Application")
             print("----------")
@@ -366,19 +2077,21 @@ class Account:
                 remove_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
 
             if remove_choice == "1":
-                admin_menu()
+                return admin_menu
             elif remove_choice == "2":
-                exit()
+                return exit
         elif delete_choice == "2":
-            self.admin_account_menu()
+            return self.admin_account_menu
 
 
 
 
 # Current account is a subclass of Account. It adds the foreign exchange fee attribute which is unique to current accounts at SNB.
 class Current(Account):
-    def __init__(self, number, c_name, c_pass, pounds_balance, pence_balance, category, foreign_exchange_fee):
-        super().__init__(number, c_name, c_pass, pounds_balance, pence_balance, category)
+    __slots__ = ("foreign_exchange_fee",)
+
+    def __init__(self, number, customer_id, balance, category, foreign_exchange_fee):
+        super().__init__(number, customer_id, balance, category)
         self.foreign_exchange_fee = foreign_exchange_fee
 
 
@@ -395,9 +2108,10 @@ class Current(Account):
     # 'from_dict' accesses the dictionary values through the keys specified in the method and passes those values as the data required to create an instance of the class.
     # '@classmethod' is used because this method is tied to the class itself rather than an instance of the class.
     # This is because the method creates the instance of the class, therefore when it is called the instance does not yet exist.
+    # The balance is read with 'money_from_dict' so that files saved in the older separate pounds and pence layout can still be imported.
     @classmethod
     def from_dict(cls, data):
-        return cls(data["number"], data["c_name"], data["c_pass"], data["pounds_balance"], data["pence_balance"], data["category"], data["foreign_exchange_fee"])
+        return cls(data["number"], customer_id_from_dict(data), money_from_dict(data, "balance", "pounds_balance", "pence_balance"), data["category"], data["foreign_exchange_fee"])
     
 
 
@@ -431,16 +2145,14 @@ class Current(Account):
         # Depending on the choice the foreign exchange fee can be changed in the 'Current' account object.
         # A message then displays showing the category as well as the rate as a percentage for the foreign exchange fee once it is changed.
         if alter_fef_choice == "1":
-            self.foreign_exchange_fee = foreign_exchange_fee_categories[temp_fef_categories[0]]
-            # Accounts are then exported to save the changes made.
-            export_accounts()
+            # The new category is set and saved through the 'set_fee_tier' transaction function.
+            set_fee_tier(self.number, temp_fef_categories[0])
             print("----------")
             print(f"Foreign exchange fee successfuly altered to '{temp_fef_categories[0]}' rate")
             print(f"New foreign exchange fee: {self.foreign_exchange_fee}%")
             print("----------")
         elif alter_fef_choice == "2":
-            self.foreign_exchange_fee = foreign_exchange_fee_categories[temp_fef_categories[1]]
-            export_accounts()
+            set_fee_tier(self.number, temp_fef_categories[1])
             print("----------")
             print(f"Foreign exchange fee successfuly altered to '{temp_fef_categories[1]}' rate")
             print(f"New foreign exchange fee: {self.foreign_exchange_fee}%")
@@ -460,17 +2172,19 @@ class Current(Account):
             f_category_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
         
         if f_category_choice == "1":
-            self.admin_account_menu()
+            return self.admin_account_menu
         elif f_category_choice == "2":
-            exit()
+            return exit
 
 
 
 
 # Savings account is a subclass of Account. It adds the savings interest rate attribute which all savings accounts at SNB have.
 class Savings(Account):
-    def __init__(self, number, c_name, c_pass, pounds_balance, pence_balance, category, interest_rate):
-        super().__init__(number, c_name, c_pass, pounds_balance, pence_balance, category)
+    __slots__ = ("interest_rate",)
+
+    def __init__(self, number, customer_id, balance, category, interest_rate):
+        super().__init__(number, customer_id, balance, category)
         self.interest_rate = interest_rate
     
 
@@ -487,7 +2201,7 @@ class Savings(Account):
     # The only difference is that instead of passing 'foreign_excxhange_fee' data to the class, 'interest_rate' data is passed to creata an instance of a 'Saving' class.
     @classmethod
     def from_dict(cls, data):
-        return cls(data["number"], data["c_name"], data["c_pass"], data["pounds_balance"], data["pence_balance"], data["category"], data["interest_rate"])
+        return cls(data["number"], customer_id_from_dict(data), money_from_dict(data, "balance", "pounds_balance", "pence_balance"), data["category"], data["interest_rate"])
     
 
 
@@ -521,16 +2235,14 @@ class Savings(Account):
         # Depending on the choice the interest rate can be changed in the 'Current' account object.
         # A message then displays showing the category as well as the rate as a percentage for the interest once it is changed.
         if alter_interest_choice == "1":
-            self.interest_rate = saving_interest_categories[temp_saving_interest_categories[0]]
-            # Accounts are exported to save the changes made.
-            export_accounts()
+            # The new category is set and saved through the 'set_interest_tier' transaction function.
+            set_interest_tier(self.number, temp_saving_interest_categories[0])
             print("----------")
             print(f"Interest successfuly altered to '{temp_saving_interest_categories[0]}' rate")
             print(f"New interest rate: {self.interest_rate}%")
             print("----------")
         elif alter_interest_choice == "2":
-            self.interest_rate = saving_interest_categories[temp_saving_interest_categories[1]]
-            export_accounts()
+            set_interest_tier(self.number, temp_saving_interest_categories[1])
             print("----------")
             print(f"Interest successfuly altered to '{temp_saving_interest_categories[1]}' rate")
             print(f"New interest rate: {self.interest_rate}%")
@@ -550,40 +2262,51 @@ class Savings(Account):
             i_category_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
         
         if i_category_choice == "1":
-            self.admin_account_menu()
+            return self.admin_account_menu
         elif i_category_choice == "2":
-            exit()
+            return exit
 
 
 
 
-# Mortgage account is a subclass of Account. It adds a monthly repayment divided into pounds and pence, the months remaining until the mortgage is paid off, and whether the account is flagged for a missed payment.
+# Mortgage account is a subclass of Account. It adds a monthly repayment 'Money' ammount, the months remaining until the mortgage is paid off, and whether the account is flagged for a missed payment.
+# 'payment_account' is the number of the customer's 'Current' account that the month-end mortgage run takes the monthly payment from, or None to use the customer's first 'Current' account.
+# 'borrowed_ammount' and 'repayment_term' are the 'Money' ammount borrowed and the term in months the mortgage was opened with, which give its repayment schedule.
+# They are None for mortgages opened before they were recorded.
 class Mortgage(Account):
-    def __init__(self, number, c_name, c_pass, pounds_balance, pence_balance, category, monthly_repayment_pounds, monthly_repayment_pence, months_remaining, flagged_for_missed_payments):
-        super().__init__(number, c_name, c_pass, pounds_balance, pence_balance, category)
-        self.monthly_repayment_pounds = monthly_repayment_pounds
-        self.monthly_repayment_pence = monthly_repayment_pence
+    __slots__ = ("monthly_repayment", "months_remaining", "flagged_for_missed_payments", "payment_account", "borrowed_ammount", "repayment_term")
+
+    def __init__(self, number, customer_id, balance, category, monthly_repayment, months_remaining, flagged_for_missed_payments, payment_account=None, borrowed_ammount=None, repayment_term=None):
+        super().__init__(number, customer_id, balance, category)
+        self.monthly_repayment = monthly_repayment
         self.months_remaining = months_remaining
         self.flagged_for_missed_payments = flagged_for_missed_payments
+        self.payment_account = payment_account
+        self.borrowed_ammount = borrowed_ammount
+        self.repayment_term = repayment_term
 
 
 
     # 'dict' in the 'Mortgage' class inherits the dictionary from its parent class and updates that dictionary with its unique 'Mortgage' class attributes.
     def dict(self):
         object_dictionary = super().dict()
-        object_dictionary.update({"monthly_repayment_pounds": self.monthly_repayment_pounds})
-        object_dictionary.update({"monthly_repayment_pence": self.monthly_repayment_pence})
+        object_dictionary.update({"monthly_repayment": self.monthly_repayment.pence})
         object_dictionary.update({"months_remaining": self.months_remaining})
         object_dictionary.update({"flagged_for_missed_payment": self.flagged_for_missed_payments})
+        object_dictionary.update({"payment_account": self.payment_account})
+        object_dictionary.update({"borrowed_ammount": None if self.borrowed_ammount is None else self.borrowed_ammount.pence})
+        object_dictionary.update({"repayment_term": self.repayment_term})
         return object_dictionary
     
 
 
     # 'from_dict' in the 'Mortgage' class performs the same function as 'from_dict' in the 'Current' class but again recieves slightly different data.
-    # The only difference is that instead of passing 'foreign_excxhange_fee' data to the class, 'monthly_repayment_pounds', 'monthly_repayment_pence', 'months_remaining', and 'flagged_for_missed_payment' data is passed to creata an instance of a 'Mortgage' class.
+    # The only difference is that instead of passing 'foreign_excxhange_fee' data to the class, 'monthly_repayment', 'months_remaining', and 'flagged_for_missed_payment' data is passed to creata an instance of a 'Mortgage' class.
+    # 'payment_account', 'borrowed_ammount' and 'repayment_term' are not in files saved before they were added, in which case they are None.
     @classmethod
     def from_dict(cls, data):
-        return cls(data["number"], data["c_name"], data["c_pass"], data["pounds_balance"], data["pence_balance"], data["category"], data["monthly_repayment_pounds"], data["monthly_repayment_pence"], data["months_remaining"], data["flagged_for_missed_payment"])
+        borrowed_ammount = None if data.get("borrowed_ammount") is None else Money(data["borrowed_ammount"])
+        return cls(data["number"], customer_id_from_dict(data), money_from_dict(data, "balance", "pounds_balance", "pence_balance"), data["category"], money_from_dict(data, "monthly_repayment", "monthly_repayment_pounds", "monthly_repayment_pence"), data["months_remaining"], data["flagged_for_missed_payment"], data.get("payment_account"), borrowed_ammount, data.get("repayment_term"))
     
 
 
@@ -597,23 +2320,24 @@ class Mortgage(Account):
         eligible_inlist = False
 
         # Checks if there is at least one account registered to the user that is eligible to make the monthly payment (has to be a 'Current' account with a high enough balance to cover the cost of the monthly payment).
-        for a in accounts_list:
-            if a.c_name == c_username and a.c_pass == c_pword and a.category == "Current" and float(f"{a.pounds_balance}.{a.pence_balance}") > float(f"{self.monthly_repayment_pounds}.{self.monthly_repayment_pence}"):
+        # Only the logged in customer's 'Current' accounts are looked at through the account store's customer index.
+        for a in account_store.for_customer(c_customer_id, "Current"):
+            if a.balance >= self.monthly_repayment:
                 eligible_accounts = True
                 break
         
         # If an eligible account exists then the monthly mortgage payment is displayed for the 'Mortgage' account as well as a list of accounts that the user is able to make a payment from.
         if eligible_accounts == True:
-            print(f"Monthly mortgage payment for Account: {self} is £{self.monthly_repayment_pounds}.{self.monthly_repayment_pence}")
+            print(f"Monthly mortgage payment for Account: {self} is {self.monthly_repayment}")
             print("PLease select one of your eligible SNB current accounts to make a monthly mortgage payment from")
             print(f"Eligible current accounts registered to {c_username}:")
             print("-")
-            for a in accounts_list:
-                if a.c_name == c_username and a.c_pass == c_pword and a.category == "Current" and float(f"{a.pounds_balance}.{a.pence_balance}") >= float(f"{self.monthly_repayment_pounds}.{self.monthly_repayment_pence}"):
+            for a in account_store.for_customer(c_customer_id, "Current"):
+                if a.balance >= self.monthly_repayment:
                     # All eligible accounts are also added to the 'c_current_accounts' list.
                     c_current_accounts.append(a)
                     # Eligible accounts display their number as well as their balance.
-                    print(f"{a}: Balance = £{a.pounds_balance}.{a.pence_balance}")
+                    print(f"{a}: Balance = {a.balance}")
             print("----------")
             # The user is asked to input one of the 8-digit account numbers displayed from the eligible accounts printed.
             eligible_account_choice = input("Please select the account you want to make a payment from by typing the corresponding account number: ")
@@ -621,32 +2345,21 @@ class Mortgage(Account):
             # While loop runs until a match is made between the 'eligible_acount_choice' and an account in the list of eligible accounts stored in 'c_current_accounts'.
             while eligible_inlist == False:
                 for ac in c_current_accounts:
-                    # If a match is made then the monhtly repayment ammount is subtracted from the chosen 'Current' account balance.
+                    # If a match is made then the payment is made through the 'pay_mortgage' transaction function.
+                    # The monhtly repayment ammount is subtracted from the chosen 'Current' account balance and from the 'Mortgage' balance left to pay, the months remaining gets 1 subtracted, and both accounts are saved together.
+                    # The payment can still be refused, for example if the current account was emptied through the SNB server since the list was shown, in which case the reason is displayed.
                     if eligible_account_choice == str(ac):
-                        ac.pounds_balance -= self.monthly_repayment_pounds
-                        ac.pence_balance -= self.monthly_repayment_pence
-                        # If after the subtraction the chosen 'Current' account pence balance is less than 0, then pence gets added 100 and the pounds balance gets 1 subtracted.
-                        if ac.pence_balance < 0:
-                            ac.pence_balance += 100
-                            ac.pound_balance -= 1
-                        
-                        # The 'Mortgage' account balance which represents the ammount left to pay off is also subtracted the monthly payment ammount now that it has been paid.
-                        self.pounds_balance -= self.monthly_repayment_pounds
-                        self.pence_balance -= self.monthly_repayment_pence
-                        # If after the subtraction the 'Mortgage' account pence balance is less than 0, then pence gets added 100 and the pounds balance gets 1 subtracted.
-                        if self.pence_balance < 0:
-                            self.pence_balance += 100
-                            self.pounds_balance -= 1
-                        # The months remaining attribute also gets 1 subtracted because there is one less month to pay.
-                        self.months_remaining -= 1
-                        # Accounts are exported to save the changes made.
-                        export_accounts()
-                        # Message displays informing the user that the monthly mortgage payment was successfull along with the new 'Current' account balance, the 'Mortgage' account balance left to pay, and the months remaining until the mortgage is fully paid off.
-                        print("----------")
-                        print("Monthly mortgage payment successfully processed")
-                        print(f"Current account balance: £{ac.pounds_balance}.{ac.pence_balance}")
-                        print(f"Mortgage account balance left to pay: £{self.pounds_balance}.{self.pence_balance}")
-                        print(f"Months remaining until mortgage is fully paid off: {self.months_remaining}")
+                        try:
+                            pay_mortgage(self.number, ac.number)
+                            # Message displays informing the user that the monthly mortgage payment was successfull along with the new 'Current' account balance, the 'Mortgage' account balance left to pay, and the months remaining until the mortgage is fully paid off.
+                            print("----------")
+                            print("Monthly mortgage payment successfully processed")
+                            print(f"Current account balance: {ac.balance}")
+                            print(f"Mortgage account balance left to pay: {self.balance}")
+                            print(f"Months remaining until mortgage is fully paid off: {self.months_remaining}")
+                        except BankError as error:
+                            print("----------")
+                            print(f"Monthly mortgage payment unsuccessful, {error}")
                         # 'eligible_inlist' is set to True which will exit the while loop.
                         eligible_inlist = True
                         # 'break' is used to exit the for loop
@@ -663,7 +2376,7 @@ class Mortgage(Account):
         elif eligible_accounts == False:
             print("You have no eligible accounts that are able to make this payment")
             print("You need a valid current account registered at SNB with enough funds to cover the cost of the mortgage payment")
-            print(f"Your monthly mortgage payment on this account is £{self.monthly_repayment_pounds}.{self.monthly_repayment_pence}")
+            print(f"Your monthly mortgage payment on this account is {self.monthly_repayment}")
 
         # The user is given the option to return to the account menu or exit the SNB Application.
         print("----------")
@@ -676,15 +2389,24 @@ class Mortgage(Account):
             monthly_payment_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
         
         if monthly_payment_choice == "1":
-            self.account_menu()
+            return self.account_menu
         elif monthly_payment_choice == "2":
-            exit()
+            return exit
 
 
 
     # Displays the months left until the 'Mortgage' account is fully paid off.
+    # For mortgages that recorded the ammount borrowed and the repayment term, the next 'schedule_months_shown' payments of the repayment schedule are displayed too.
     def view_months_left(self):
         print(f"Months remaining until mortgage is paid off: {self.months_remaining}")
+        if self.borrowed_ammount is not None and 0 < self.months_remaining <= self.repayment_term:
+            schedule = amortization_schedule(self.borrowed_ammount.pence, self.repayment_term, fixed_mortgage_interest)
+            upcoming = schedule[self.repayment_term - self.months_remaining:][:schedule_months_shown]
+            print("-")
+            print(f"Borrowed: {self.borrowed_ammount} over {self.repayment_term} months")
+            print("Upcoming payments:")
+            for month, payment, interest, principal, principal_left, balance_left in upcoming:
+                print(f"Month {month}: {Money(payment)} ({Money(principal)} borrowed ammount, {Money(interest)} interest). Left to pay after: {Money(balance_left)}")
         print("----------")
         print("1. Return to account menu")
         print("2. Exit SNB application")
@@ -696,9 +2418,9 @@ class Mortgage(Account):
             view_months_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
         
         if view_months_choice == "1":
-            self.account_menu()
+            return self.account_menu
         elif view_months_choice == "2":
-            exit()
+            return exit
 
 
 
@@ -723,16 +2445,13 @@ class Mortgage(Account):
         # If user chooses option 1 then if the account is not flagged it will flag the account and set the 'flagged_for_missed_payments' attribute to True.
         if flag_choice == "1":
             if self.flagged_for_missed_payments == False:
-                self.flagged_for_missed_payments = True
-                # Accounts are exported to save changes made.
-                export_accounts()
+                # The flag is set and saved through the 'set_missed_payment_flag' transaction function.
+                set_missed_payment_flag(self.number, True)
                 print("----------")
                 print("Account successfully flagged for missing payments")
             # If the account is flagged it will unflag the account and set the 'flagged_for_missed_payments' attribute to False.
             elif self.flagged_for_missed_payments == True:
-                self.flagged_for_missed_payments = False
-                # Accounts are exported to save changes made.
-                export_accounts()
+                set_missed_payment_flag(self.number, False)
                 print("----------")
                 print("Account successfully unflagged for missing payments")
 
@@ -747,20 +2466,388 @@ class Mortgage(Account):
                 second_flag_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
             
             if second_flag_choice == "1":
-                self.admin_account_menu()
+                return self.admin_account_menu
             elif second_flag_choice == "2":
-                exit()
+                return exit
         # Returns to admin menu.
         elif flag_choice == "2":
-            self.admin_account_menu()
+            return self.admin_account_menu
+
+
+
+
+# ColumnarAccounts is an optional compact way of holding a large number of accounts in memory.
+# Rather than one object per account, each attribute is kept in its own typed 'array' column and a row number identifies each account.
+# Customer ids are stored once in a customer table and each row refers to its customer by position in that table.
+# Accounts are read and changed through lightweight 'AccountView' objects, or turned back into full account objects with 'materialize'.
+class ColumnarAccounts:
+    # Each account category is stored as a small integer code.
+    category_codes = {"Current": 0, "Savings": 1, "Mortgage": 2}
+    category_names = ["Current", "Savings", "Mortgage"]
+    # Names of the columns saved in each format version of the binary 'accounts.snb' file, in the order they are saved.
+    column_names = {
+        1: ["balances", "repayments", "numbers", "months", "customers", "categories", "rates", "flags"],
+        2: ["balances", "repayments", "numbers", "months", "payment_accounts", "customers", "categories", "rates", "flags"],
+        3: ["balances", "repayments", "borrowed", "numbers", "months", "payment_accounts", "terms", "customers", "categories", "rates", "flags"],
+        4: ["balances", "repayments", "borrowed", "numbers", "months", "payment_accounts", "terms", "customers", "categories", "rates", "flags"],
+    }
+
+    def __init__(self):
+        self.numbers = array("i")
+        self.balances = array("q")
+        self.categories = array("b")
+        self.customers = array("i")
+        # The foreign exchange fee of a 'Current' account or the interest rate of a 'Savings' account.
+        self.rates = array("b")
+        # Columns only used by 'Mortgage' accounts, left as 0 for other categories.
+        self.repayments = array("q")
+        self.months = array("i")
+        self.flags = array("b")
+        # The designated payment account of each 'Mortgage' account, with 0 meaning none has been chosen.
+        self.payment_accounts = array("i")
+        # The ammount borrowed in pence and the repayment term in months of each 'Mortgage' account, with 0 meaning they were not recorded.
+        self.borrowed = array("q")
+        self.terms = array("i")
+        self.customer_keys = []
+        self.customer_rows = {}
+        self.row_by_number = {}
+        # The format version of the binary file the columns were read from.
+        self.version = binary_version
+
+
+
+    # The columns in the order they are saved in the binary 'accounts.snb' file.
+    # The 8 byte columns come first so that every value in the file sits at a position that is a multiple of its own size.
+    # Files of older format versions were saved before some of the columns were added.
+    def columns(self, version=binary_version):
+        return [getattr(self, name) for name in self.column_names[version]]
+
+
+
+    # Position in the binary file where each column starts, by column name.
+    def file_starts(self):
+        starts = {}
+        position = binary_header.size
+        for name in self.column_names[binary_version]:
+            starts[name] = position
+            position += len(self) * getattr(self, name).itemsize
+        return starts
+
+
+
+    # Lays out the columns as the contents of a binary 'accounts.snb' file.
+    # The file starts with a 16 byte header (the letters 'SNBA', the format version and the number of accounts), followed by the raw little-endian values of each column in turn.
+    # The customer table of customer ids is stored last as JSON.
+    def to_bytes(self):
+        parts = [binary_header.pack(b"SNBA", binary_version, len(self))]
+        for column in self.columns():
+            if sys.byteorder == "big":
+                column = array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        parts.append(json.dumps(self.customer_keys, separators=(",", ":")).encode("utf-8"))
+        return b"".join(parts)
+
+
+
+    # Reads the contents of a binary 'accounts.snb' file back into columns, raising a 'ValueError' if the file is not laid out correctly.
+    # Each column is read in one step rather than account by account.
+    # The format version of the file is kept in 'version', and columns missing from older versions are filled with zeros.
+    @classmethod
+    def from_bytes(cls, contents):
+        columns = cls()
+        try:
+            magic, version, count = binary_header.unpack_from(contents, 0)
+        except struct.error:
+            raise ValueError("accounts file is too short to be an SNB binary accounts file")
+        if magic != b"SNBA" or version not in cls.column_names:
+            raise ValueError("accounts file is not an SNB binary accounts file")
+        columns.version = version
+        for column in columns.columns():
+            if not any(column is saved for saved in columns.columns(version)):
+                column.frombytes(bytes(count * column.itemsize))
+        position = binary_header.size
+        for column in columns.columns(version):
+            size = count * column.itemsize
+            if position + size > len(contents):
+                raise ValueError("accounts file is shorter than its header says")
+            column.frombytes(contents[position:position + size])
+            if sys.byteorder == "big":
+                column.byteswap()
+            position += size
+        # Files saved before version 4 hold a customer name and password for each customer, which are turned into customer ids with 'legacy_customer_id'.
+        customer_keys = json.loads(contents[position:])
+        columns.customer_keys = customer_keys if version >= 4 else [legacy_customer_id(c_name) for c_name, c_pass in customer_keys]
+        if any(customer >= len(columns.customer_keys) for customer in set(columns.customers)) or any(category >= len(cls.category_names) for category in set(columns.categories)):
+            raise ValueError("accounts file refers to a customer or category that does not exist")
+        columns.customer_rows = {key: row for row, key in enumerate(columns.customer_keys)}
+        columns.row_by_number = dict(zip(columns.numbers.tolist(), range(count)))
+        return columns
+
+
+
+    # Builds the columns from any collection of account objects, such as the account store.
+    @classmethod
+    def from_accounts(cls, accounts):
+        columns = cls()
+        for account in accounts:
+            columns.append(account)
+        return columns
+
+
+
+    def __len__(self):
+        return len(self.numbers)
 
 
 
+    # Iterating gives a view of every row in order.
+    def __iter__(self):
+        for row in range(len(self.numbers)):
+            yield AccountView(self, row)
 
-# Starts the banking application displaying the starting menu as well as calling the functions to import the customer logins and customer accounts.
+
+
+    # Copies one row of another set of columns onto the end of these columns.
+    def append_row(self, other, row):
+        customer_key = other.customer_keys[other.customers[row]]
+        if customer_key not in self.customer_rows:
+            self.customer_rows[customer_key] = len(self.customer_keys)
+            self.customer_keys.append(customer_key)
+        self.row_by_number[other.numbers[row]] = len(self.numbers)
+        for column, other_column in zip(self.columns(), other.columns()):
+            column.append(other_column[row])
+        self.customers[-1] = self.customer_rows[customer_key]
+
+
+
+    # Adds an account object as a new row at the end of the columns.
+    def append(self, account):
+        customer_key = account.customer_id
+        if customer_key not in self.customer_rows:
+            self.customer_rows[customer_key] = len(self.customer_keys)
+            self.customer_keys.append(customer_key)
+        self.row_by_number[account.number] = len(self.numbers)
+        self.numbers.append(account.number)
+        self.balances.append(account.balance.pence)
+        self.categories.append(self.category_codes[account.category])
+        self.customers.append(self.customer_rows[customer_key])
+        if account.category == "Current":
+            self.rates.append(account.foreign_exchange_fee)
+        elif account.category == "Savings":
+            self.rates.append(account.interest_rate)
+        else:
+            self.rates.append(0)
+        if account.category == "Mortgage":
+            self.repayments.append(account.monthly_repayment.pence)
+            self.months.append(account.months_remaining)
+            self.flags.append(account.flagged_for_missed_payments)
+            self.payment_accounts.append(account.payment_account or 0)
+            self.borrowed.append(0 if account.borrowed_ammount is None else account.borrowed_ammount.pence)
+            self.terms.append(account.repayment_term or 0)
+        else:
+            self.repayments.append(0)
+            self.months.append(0)
+            self.flags.append(0)
+            self.payment_accounts.append(0)
+            self.borrowed.append(0)
+            self.terms.append(0)
+
+
+
+    # Removes the row of an account by moving the last row into its place, so no other rows need to shift.
+    # Because rows can move, views taken before a removal should not be used after it.
+    def remove(self, number):
+        row = self.row_by_number.pop(number)
+        last = len(self.numbers) - 1
+        for column in self.columns():
+            column[row] = column[last]
+            column.pop()
+        if row != last:
+            self.row_by_number[self.numbers[row]] = row
+
+
+
+    # Returns a view of the account with the given number, or None if it is not in the columns.
+    def get(self, number):
+        row = self.row_by_number.get(number)
+        if row is None:
+            return None
+        return AccountView(self, row)
+
+
+
+
+# AccountView is a lightweight stand-in for one row of 'ColumnarAccounts'.
+# It exposes the same attributes as the account classes, reading them from (and writing balances and mortgage details back to) the columns.
+class AccountView:
+    __slots__ = ("columns", "row")
+
+    def __init__(self, columns, row):
+        self.columns = columns
+        self.row = row
+
+
+
+    def __repr__(self):
+        return f"{self.number}"
+
+
+
+    @property
+    def number(self):
+        return self.columns.numbers[self.row]
+
+
+
+    @property
+    def customer_id(self):
+        return self.columns.customer_keys[self.columns.customers[self.row]]
+
+
+
+    @property
+    def category(self):
+        return ColumnarAccounts.category_names[self.columns.categories[self.row]]
+
+
+
+    @property
+    def balance(self):
+        return Money(self.columns.balances[self.row])
+
+
+
+    @balance.setter
+    def balance(self, ammount):
+        self.columns.balances[self.row] = ammount.pence
+
+
+
+    @property
+    def foreign_exchange_fee(self):
+        return self.columns.rates[self.row]
+
+
+
+    @property
+    def interest_rate(self):
+        return self.columns.rates[self.row]
+
+
+
+    @property
+    def monthly_repayment(self):
+        return Money(self.columns.repayments[self.row])
+
+
+
+    @property
+    def months_remaining(self):
+        return self.columns.months[self.row]
+
+
+
+    @months_remaining.setter
+    def months_remaining(self, months):
+        self.columns.months[self.row] = months
+
+
+
+    @property
+    def flagged_for_missed_payments(self):
+        return bool(self.columns.flags[self.row])
+
+
+
+    @flagged_for_missed_payments.setter
+    def flagged_for_missed_payments(self, flagged):
+        self.columns.flags[self.row] = flagged
+
+
+
+    @property
+    def payment_account(self):
+        return self.columns.payment_accounts[self.row] or None
+
+
+
+    @payment_account.setter
+    def payment_account(self, number):
+        self.columns.payment_accounts[self.row] = number or 0
+
+
+
+    @property
+    def borrowed_ammount(self):
+        return Money(self.columns.borrowed[self.row]) if self.columns.borrowed[self.row] else None
+
+
+
+    @property
+    def repayment_term(self):
+        return self.columns.terms[self.row] or None
+
+
+
+    # Returns the row as an account dictionary in the same layout as the account classes' 'dict' method.
+    def dict(self):
+        object_dictionary = {"number": self.number, "customer_id": self.customer_id, "balance": self.columns.balances[self.row], "category": self.category}
+        if self.category == "Current":
+            object_dictionary.update({"foreign_exchange_fee": self.foreign_exchange_fee})
+        elif self.category == "Savings":
+            object_dictionary.update({"interest_rate": self.interest_rate})
+        elif self.category == "Mortgage":
+            object_dictionary.update({"monthly_repayment": self.columns.repayments[self.row]})
+            object_dictionary.update({"months_remaining": self.months_remaining})
+            object_dictionary.update({"flagged_for_missed_payment": self.flagged_for_missed_payments})
+            object_dictionary.update({"payment_account": self.payment_account})
+            object_dictionary.update({"borrowed_ammount": self.columns.borrowed[self.row] or None})
+            object_dictionary.update({"repayment_term": self.repayment_term})
+        return object_dictionary
+
+
+
+    # Creates a full 'Current', 'Savings' or 'Mortgage' object from the row.
+    # The object is built straight from the columns rather than through an account dictionary, since every account of a binary file is built this way the first time it is used.
+    def materialize(self):
+        columns = self.columns
+        row = self.row
+        customer_id = columns.customer_keys[columns.customers[row]]
+        category = ColumnarAccounts.category_names[columns.categories[row]]
+        balance = Money(columns.balances[row])
+        if category == "Current":
+            return Current(columns.numbers[row], customer_id, balance, category, columns.rates[row])
+        elif category == "Savings":
+            return Savings(columns.numbers[row], customer_id, balance, category, columns.rates[row])
+        borrowed_ammount = Money(columns.borrowed[row]) if columns.borrowed[row] else None
+        return Mortgage(columns.numbers[row], customer_id, balance, category, Money(columns.repayments[row]), columns.months[row], bool(columns.flags[row]), columns.payment_accounts[row] or None, borrowed_ammount, columns.terms[row] or None)
+
+
+
+
+# Starts the banking application by calling the functions to import the customer logins and customer accounts, then showing the starting menu.
 def start_banking_app():
-    import_accounts()
     import_customer_records()
+    import_accounts()
+    run_menus(welcome_menu)
+
+
+
+# Runs the menus of the SNB Application, starting with 'first_menu', until the user exits.
+# Each menu is a step of the application: it shows its options, reads the user's choice and returns the next menu to show, rather than calling it.
+# A menu is returned as a function (such as 'customer_menu'), an account's method (such as 'account.account_menu'), or a 'partial' when it needs an argument chosen in the menu before it.
+# Returning the next menu instead of calling it means every menu has finished before the next one starts, so however long the user banks for the stack stays the same depth and no menu's variables are kept.
+# The 'exit' function is returned like any other menu and ends the application when it is called.
+def run_menus(first_menu):
+    menu = first_menu
+    while menu is not None:
+        menu = menu()
+
+
+
+# Displays the starting menu and returns the menu for the user's choice.
+def welcome_menu():
     print("----------")
     print("Welcome to SNB! The bank ready to meet all your financial needs.")
     print("-")
@@ -779,23 +2866,27 @@ def start_banking_app():
     # This takes the input given by the user and matches what the user's choice is with an action corresponding to that choice.
     # In this example each choice corresponds to a different function that performs a different action in the application.
     if choice == "1":
-        register_new_customer()
+        return register_new_customer
     elif choice == "2":
-        customer_login()  
+        return customer_login
     elif choice == "3":
-        admin_login()
+        return admin_login
     elif choice == "4":
-        exit()
+        return exit
 
 
 
-# Imports account objects from JSON file.
-# All the bank account instances are stored in a JSON file called 'accounts.json'. Each account is a dictionary containing its data in values stored in key:value pairs.
+# Imports account objects from the selected storage.
+# By default all the bank account instances are stored in a JSON file called 'accounts.json'. Each account is a dictionary containing its data in values stored in key:value pairs.
+# The customer logins must be imported first, since accounts saved with a customer name and password by an earlier version are given the customer id of the login with that name.
+# Such accounts are saved again with customer ids straight away, and the older copies of the accounts file holding the passwords are deleted.
 def import_accounts():
     try:
-        # Opens and loads the account dictionaries into a list.
-        with open("accounts.json", "r", encoding="utf-8") as file:
-            accounts_dicts = json.load(file)
+        # Opens the file and indexes where each account is, skipping validation if the file is unchanged since it was last written.
+        if account_storage.load(account_store):
+            with storage_lock:
+                account_storage.save(account_store)
+                account_storage.discard_plaintext_accounts()
     # Error handling displays an error informing the user that the file cannot be located in the roor folder of the project.
     # SystemExit is then raised to exit the program.
     # Accounts are imported at the begining of the program therefore the program will not properly start if this error is present.
@@ -803,39 +2894,139 @@ def import_accounts():
         print("----------")
         print("--ERROR--")
         print("Customer bank account records not found")
-        print("Please make sure the 'accounts.json' file is located in the same folder as the Python file")
+        print(f"Please make sure the '{account_storage.path}' file is located in the same folder as the Python file")
         print("Once this condition is fulfilled try running the application again")
         print("----------")
         raise SystemExit
-    # Loops through all the account dictionaries checking if the 'category' value matches 'Current', 'Savings', or 'Mortgage'.
-    # If there is a match it will create an instance of the corresponding account type using the 'from_dict' class method and add this instance to the accounts list.
-    for accounts in accounts_dicts:
-        if accounts["category"] == "Current":
-            accounts_list.append(Current.from_dict(accounts))
-        elif accounts["category"] == "Savings":
-            accounts_list.append(Savings.from_dict(accounts))
-        elif accounts["category"] == "Mortgage":
-            accounts_list.append(Mortgage.from_dict(accounts))
+    # If the file and all of its saved previous versions are damaged then the program cannot start either.
+    except ValueError:
+        print("----------")
+        print("--ERROR--")
+        print("Customer bank account records are damaged and no earlier saved version could be read")
+        print("----------")
+        raise SystemExit
+
+
+
+# Returns a function that builds the account at a row of an 'AccountsIndex' from the 'accounts.json' text it describes.
+def json_account_builder(accounts_text, accounts_index):
+    def build_account(row):
+        return account_from_dict(json.loads(accounts_text[accounts_index.starts[row]:accounts_index.ends[row]]))
+    return build_account
+
+
 
+# Checks the 'category' value of an account dictionary matches 'Current', 'Savings', or 'Mortgage'.
+# If there is a match it will create and return an instance of the corresponding account type using the 'from_dict' class method, otherwise None is returned.
+def account_from_dict(data):
+    if data["category"] == "Current":
+        return Current.from_dict(data)
+    elif data["category"] == "Savings":
+        return Savings.from_dict(data)
+    elif data["category"] == "Mortgage":
+        return Mortgage.from_dict(data)
+    return None
 
 
-# Imports customer records (Logins) from JSON file
+
+# Imports customer records (Logins) from the selected storage.
 def import_customer_records():
+    global last_customer_id
     try:
-        # Customer logins are stored in 'customer_records.json' as password:username pairs.
+        # Customer logins are stored in 'customer_records.json' as username:credential pairs.
         # The logins are loaded in from the json file and are used to update the 'customer_records' dictionary.
         # This creates a single dictionary with all the customer logins which is populated at the start of the program.
-        with open("customer_records.json", "r", encoding="utf-8") as file:
-            customer_records.update(json.load(file))
+        # Logins saved with plain text passwords by an earlier version are saved again with hashed passwords straight away, and the plain text copies are deleted.
+        if account_storage.load_customers(customer_records):
+            with storage_lock:
+                account_storage.save_customers(customer_records)
+                account_storage.discard_plaintext_customers()
+        customer_names.update((credential.customer_id, c_name) for c_name, credential in customer_records.items())
+        last_customer_id = max(customer_names, default=0)
     # Error handling displays an error if the file is not found in the root folder of the SNB Application. 'SystemExit' is then raised to exit the program.
     except FileNotFoundError:
         print("----------")
         print("--ERROR--")
         print("Customer records not found")
-        print("Please make sure the 'customer_records.json' file is located in the same folder as the Python file")
+        print("Please make sure the 'customer_records.json' file (or the 'snb.db' database when using SQLite storage) is located in the same folder as the Python file")
         print("Once this condition is fulfilled try running the application again")
         print("----------")
         raise SystemExit
+    except ValueError as error:
+        print("----------")
+        print("--ERROR--")
+        print("Customer records are damaged and no earlier saved version could be read")
+        print(error)
+        print("----------")
+        raise SystemExit
+
+
+
+# Converts customer logins from the older layout of plain text 'password:username' pairs into 'username:Credential' pairs, numbering the customers from 1 in the order they were saved.
+# Usernames were not unique in the older layout, so a 'ValueError' naming the username is raised if two customers share one, as they could no longer both log in.
+# Each password is hashed once, which takes about a quarter of a second per customer.
+def migrate_customer_records(plaintext_records):
+    records = {}
+    for c_pass, c_name in plaintext_records.items():
+        if c_name in records:
+            raise ValueError(f"More than one customer has the username '{c_name}', please give each of them a different username before starting the application")
+        records[c_name] = Credential.from_password(len(records) + 1, c_pass)
+    return records
+
+
+
+# Gives a customer id to every login in 'records' saved before customers had ids, numbering them after the highest id already given.
+# Returns True if any login was given an id.
+def assign_customer_ids(records):
+    missing = [credential for credential in records.values() if credential.customer_id is None]
+    next_id = max((credential.customer_id for credential in records.values() if credential.customer_id is not None), default=0) + 1
+    for credential in missing:
+        credential.customer_id = next_id
+        next_id += 1
+    return bool(missing)
+
+
+
+# Returns the customer id to give a new customer, one more than the highest id given so far.
+# The server calls this while holding 'storage_lock', so two registrations are never given the same id.
+def next_customer_id():
+    global last_customer_id
+    last_customer_id += 1
+    return last_customer_id
+
+
+
+# Returns the customer id for an account saved by an earlier version with a customer name and password instead of a customer id.
+# Usernames are unique, so the account is given the id of the login with its customer name.
+# Accounts whose customer has no login could not be accessed by any customer before, so they are given the id 0, which no customer has.
+def legacy_customer_id(c_name):
+    credential = customer_records.get(c_name)
+    return 0 if credential is None else credential.customer_id
+
+
+
+# Returns the customer id of an account dictionary, converting the customer name and password of accounts saved by an earlier version.
+def customer_id_from_dict(data):
+    if "customer_id" in data:
+        return data["customer_id"]
+    return legacy_customer_id(data["c_name"])
+
+
+
+# Returns the username of the customer with the given id, for showing who an account belongs to.
+def customer_name(customer_id):
+    return customer_names.get(customer_id, "(no customer login)")
+
+
+
+# Checks a customer's username and password against their saved credential.
+# An unknown username is checked against 'missing_credential' so that it takes as long as a wrong password.
+def verify_login(c_name, c_pass):
+    credential = customer_records.get(c_name)
+    if credential is None:
+        missing_credential.verify(c_pass)
+        return False
+    return credential.verify(c_pass)
 
 
 
@@ -856,25 +3047,29 @@ def register_new_customer():
         lname = input("Please enter your last name with no spaces: ")
     
     # Combines the user's first and last name separated with an underscore to give a username.
+    # Usernames must be unique because they are used as the key in the customer records dictionary, and realistically a bank can have two customers with exactly the same name.
+    # If the username is already taken the lowest number that makes it unique is added to the end, for example 'john_smith_2'.
     name = fname + "_" + lname
+    suffix = 2
+    while name in customer_records:
+        name = f"{fname}_{lname}_{suffix}"
+        suffix += 1
 
     print("----------")
     password = input("Please enter a password for banking on this application: ")
 
-    # Checks if the password is valid by ruling out whether the password has any spaces and whether the password is already taken by another customer.
+    # Checks if the password is valid by ruling out whether the password has any spaces.
     while papproved == False:
         if " " in password or password == "":
             password = input("Please enter your password with no spaces: ")
-        # Password needs to be unique because it is used as the key in the customer records dictionary to store customer logins.
-        # The password was chosen as the unique key because realistically a bank can have two customers with exactly the same name.
-        elif password in customer_records:
-            password = input("Password already in use please enter a different password: ")
         else:
             papproved = True
 
-    # 'customer_records' is updated with the new login and the whole dictionary is exported to the 'customer_records.json' file to fully save the new customer.
-    customer_records.update({password: name})
-    export_customer_records()
+    # 'customer_records' is updated with the new login (with the password hashed) and the new customer is saved to the selected storage.
+    customer_id = next_customer_id()
+    customer_records.update({name: Credential.from_password(customer_id, password)})
+    customer_names.update({customer_id: name})
+    record_new_customer(name)
 
     # Displays the customer username and password so that the user can refer back to this information when they want to log in to their account.
     print("----------")
@@ -886,7 +3081,7 @@ def register_new_customer():
     print("-")
     
     # The function to open a bank account is called as part of registering a new customer so that the new customer has a bank account to access.
-    open_account(name, password)
+    open_account_menu(customer_id)
 
     # Once the bank account is created the user can choose to either log in to their account or exit the SNB application.
     print("----------")
@@ -899,14 +3094,14 @@ def register_new_customer():
         login_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
 
     if login_choice == "1":
-        customer_login()
+        return customer_login
     elif login_choice == "2":
-        exit()
+        return exit
 
 
 
-# Opens a new bank account, taking the user's username and password as arguments.
-def open_account(user, passw):
+# Opens a new bank account through the menus, taking the customer id of the user as an argument.
+def open_account_menu(customer_id):
     # Gives the choice between opening one of the three type of accounts available at SNB.
     print("----------")
     print("What type of account are you looking to open:")
@@ -919,45 +3114,25 @@ def open_account(user, passw):
     while account_selection != "1" and account_selection != "2" and account_selection != "3":
         account_selection = input("Incorrect input, please select 1, 2 or 3: ")
 
-    # A unique account number is generated by calling the 'generate_unique_ac_number' function which returns this number. The unique number is then passed to 'account_number'.
-    account_number = generate_unique_ac_number()
-
-    # Depending on the user's selection of account type a corresponding account type is created.
-    # 'Current' and 'Savings' accounts are created using the unique account number created, customer username and password, a balance of 0 pounds and pence, and their respective category.
-    # The final attribute is retrieved from the list of different foreign exchange fee and interest rates. Both types of accounts recieve the 'standard' rate when intially created.
+    # Depending on the user's selection of account type a corresponding account is opened through the 'open_account' transaction function.
+    # This gives the account a unique account number, adds it to the account store and saves it.
+    # 'Current' and 'Savings' accounts are opened with a balance of £0.00 and the 'standard' foreign exchange fee or interest rate.
     if account_selection == "1":
-        current_account = Current(account_number, user, passw, 0, 0, "Current", foreign_exchange_fee_categories["standard"])
+        result = open_account(customer_id, "Current")
     elif account_selection == "2":
-        savings_account = Savings(account_number, user, passw, 0, 0, "Savings", saving_interest_categories["standard"])
+        result = open_account(customer_id, "Savings")
     elif account_selection == "3":
-        # Creating a 'Mortgage' account requires further inputs by the user which are contained in a separate function called 'open_mortgage'.
-        mortgage_account = open_mortgage(user, passw, account_number)
+        # Creating a 'Mortgage' account requires further inputs by the user which are contained in a separate function called 'open_mortgage_menu'.
+        result = open_mortgage_menu(customer_id)
 
-    # Depending on the choice the user made on which type of account to create, the corresponding account object is added to the accounts list.
-    if account_selection == "1":
-        accounts_list.append(current_account)
-    elif account_selection == "2":
-        accounts_list.append(savings_account)
-    elif account_selection =="3":
-        accounts_list.append(mortgage_account)
-    # Once the accounts list is updated, the list is exported to save the changes made.
-    export_accounts()
-    
-    # Depending on the choice made by the user, the corresponding account information is displayed which includes the unique account number.
-    if account_selection == "1":
-        print(f"{current_account.category} account successfully created")
-        print(f"{current_account.category} account number: {current_account}")
-    elif account_selection == "2":
-        print(f"{savings_account.category} account successfully created")
-        print(f"{savings_account.category} account number: {savings_account}")
-    elif account_selection == "3":
-        print(f"{mortgage_account.category} account successfully created")
-        print(f"{mortgage_account.category} account number: {mortgage_account}")
+    # The new account information is displayed which includes the unique account number.
+    print(f"{result.account.category} account successfully created")
+    print(f"{result.account.category} account number: {result.account}")
 
 
 
-# Opens a 'Mortgage' account taking the user's username, password, and unique account number generated as arguments.
-def open_mortgage(user, passw, ac_num):
+# Opens a 'Mortgage' account through the menus, taking the user's username and password as arguments.
+def open_mortgage_menu(customer_id):
     # The two is_valid variables are used to check for conditions fulfilled in the while loops of the function.
     is_valid = False
     second_is_valid = False
@@ -965,12 +3140,11 @@ def open_mortgage(user, passw, ac_num):
     # To open a 'Mortgage' account first the user must input how much the value of the property they want to purchase is.
     print("----------")
     print("How much do you need to borrow to purchase your property?")
-    # The full ammount for the property is inputted and correctly formatted into pounds and pence with the 'format_currency' function.
-    # The format currency function returns two values, one is pounds and one is pence, therefore 'borrow_ammount_full' becomes a list.
+    # The full ammount for the property is inputted and correctly formatted into a 'Money' ammount with the 'format_currency' function.
     borrow_ammount_full = format_currency()
-    # The minimum a customer is allowed to borrow for a 'Mortgage' account at SNB is £10,000 so this checks that the pounds value is more than 10,000
+    # The minimum a customer is allowed to borrow for a 'Mortgage' account at SNB is £10,000 so this checks that the ammount is at least 10,000 pounds.
     # If the value is less than 10,000 then an error message is displayed and a new ammount is requested.
-    while borrow_ammount_full[0] < 10000:
+    while borrow_ammount_full < minimum_mortgage_ammount:
         print("The minimum ammount you can borrow is £10,000")
         borrow_ammount_full = format_currency()
     # Asks the customer to input over how many months they want to pay off their mortgage.
@@ -982,8 +3156,8 @@ def open_mortgage(user, passw, ac_num):
         try:
             while second_is_valid == False:
                 repayment_term = int(input("Months: "))
-                if repayment_term > 500 or repayment_term < 6:
-                    print("repayment terms must range between 6 and 500 months")
+                if repayment_term > maximum_mortgage_term or repayment_term < minimum_mortgage_term:
+                    print(f"repayment terms must range between {minimum_mortgage_term} and {maximum_mortgage_term} months")
                     second_is_valid = False
                 else:
                     second_is_valid = True
@@ -991,19 +3165,16 @@ def open_mortgage(user, passw, ac_num):
         except ValueError:
             print("Incorrect input please enter a whole number with no spaces")
     print("----------")
-    # Turns the ammount to borrow back into a float and stores it in 'full_ammount_float'.
-    full_ammount_float = float(f"{borrow_ammount_full[0]}.{borrow_ammount_full[1]}")
-    # 'monthly' is the full ammount divided by the repayment terms, then multiplied by 1.05 to represent interest added on. This interest of 5% is fixed for all mortgage accounts at SNB.
-    # 'ceil' function was used instead of the round function to account for fees the bank can charge on top of the fixed interest rate. All monthly payments are rounded to whole pounds.
-    monthly = ceil((full_ammount_float / repayment_term) * fixed_mortgage_interest)
-
-    # The full ammount to be paid back to the bank.
-    real_full_ammount = monthly * repayment_term
+    # The monthly repayment and the full ammount to be paid back to the bank are worked out by 'mortgage_quote'.
+    monthly, real_full_ammount = mortgage_quote(borrow_ammount_full, repayment_term)
 
     # Message informing the user about how much they will have to pay and for how long.
-    print(f"SNB can offer you a mortgage with monthly repayments of £{monthly} for a term of {repayment_term} months")
-    print(f"The full ammount repayable to the bank will be £{real_full_ammount}")
-    print("This includes the '5%' fixed interest rate for all SNB mortgage accounts, as well as any added fees")
+    print(f"SNB can offer you a mortgage with monthly repayments of {monthly} for a term of {repayment_term} months")
+    print(f"The full ammount repayable to the bank will be {real_full_ammount}")
+    print(f"This includes {real_full_ammount - borrow_ammount_full} of interest at the '{fixed_mortgage_interest}%' fixed interest rate for all SNB mortgage accounts, as well as any added fees")
+    # The first payment of the repayment schedule shows how it is split between the ammount borrowed and interest.
+    month, payment, interest, principal, principal_left, balance_left = amortization_schedule(borrow_ammount_full.pence, repayment_term, fixed_mortgage_interest)[0]
+    print(f"Your first payment repays {Money(principal)} of the ammount borrowed and {Money(interest)} of interest, with more of each payment going to the ammount borrowed as the mortgage is paid off")
     print("Would you like to proceed with opening this mortgage account?")
     print("1. Yes")
     print("2. No (Exit SNB Application)")
@@ -1014,63 +3185,1769 @@ def open_mortgage(user, passw, ac_num):
     while create_choice != "1" and create_choice != "2":
         create_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
 
-    # If the user proceeds with creating the 'Mortgage' account then it is created, setting the balance to the full ammount to be paid back, adding the ammount to be paid monthly, and setting 'flagged_for_missed_payments' to False.
+    # If the user proceeds with creating the 'Mortgage' account then it is opened through the 'open_account' transaction function and the result is returned.
     if create_choice == "1":
-        mortgage_account = Mortgage(ac_num, user, passw, real_full_ammount, 0, "Mortgage", monthly, 0, repayment_term, False)
-        # The function returns the 'Mortgage' account object if the user chooses to create it.
-        return mortgage_account
+        return open_account(customer_id, "Mortgage", borrow_ammount_full, repayment_term)
     elif create_choice == "2":
         exit()
 
 
 
-# Generates a unique 8-digit account number for use in creating bank accounts at SNB.
-# The account number has to be unique so a customer can refer to their bank account with their unique number.
-def generate_unique_ac_number():
-    # Temporary list of account numbers is created
-    temp_ac_numbers = []
-    # The 'randint' function is called to generate a random integer between 10000000 and 99999999.
-    account_number = randint(10000000, 99999999)
+# The transaction functions below make every change to accounts at SNB without any menus, so the bank can also be run by other programs (such as 'SNB_benchmarks.py').
+# Each function checks the transaction is allowed, changes the accounts, saves the change and returns a 'TransactionResult'.
+# If the transaction is not allowed a 'BankError' is raised and no account is changed.
+# Every transaction holds the locks of its accounts (see 'locked_accounts') from checking them until they are saved, so transactions can safely be made from several threads at once.
+# Accounts are given by their account number, either as an integer or as the string typed in by the user.
+
+# Holds the locks of every account given while a transaction checks, changes and saves them, so no other thread can change them at the same time.
+# Used as 'with locked_accounts(source, destination):'. See 'AccountLocks'.
+def locked_accounts(*accounts):
+    return AccountLocks(accounts)
+
+
+
+# Returns the account with the given number, raising 'AccountNotFoundError' if no such account exists.
+def find_account(number):
+    account = account_store.get(number)
+    if account is None:
+        raise AccountNotFoundError(f"no account with the number {number} exists at SNB")
+    return account
+
+
+
+# Raises 'AccountTypeError' unless the account is one of the given categories.
+# 'action' describes the transaction in the error message, for example "Deposits".
+def check_category(account, categories, action):
+    if account.category not in categories:
+        raise AccountTypeError(f"{action} cannot be made with a {account.category} account")
+
+
+
+# Raises 'InvalidAmountError' unless an ammount of money to move is more than £0.00.
+def check_ammount(ammount):
+    if ammount.pence <= 0:
+        raise InvalidAmountError("the ammount must be more than £0.00")
+
+
+
+# Works out the monthly repayment in pence for a mortgage of 'borrowed' pence over 'repayment_term' months at an 'interest_rate' percentage.
+# The monthly payment is the ammount borrowed divided by the repayment term, then increased by the interest rate to represent interest added on.
+# The payment is rounded up instead of rounded to account for fees the bank can charge on top of the fixed interest rate. All monthly payments are rounded up to whole pounds.
+# Only whole numbers are used, so an ammount that divides exactly is never rounded up a pound by a floating point error.
+def monthly_repayment_pence(borrowed, repayment_term, interest_rate):
+    pounds = -(-borrowed * (100 + interest_rate) // (100 * repayment_term * 100))
+    return pounds * 100
+
+
+
+# Works out the monthly repayment and the full ammount repayable in pence for a mortgage, returned as a pair.
+# Quotes are remembered by ammount borrowed, term and interest rate, so quoting the same mortgage again (as when many customers ask for common ammounts) does not work it out again.
+@lru_cache(maxsize=65536)
+def mortgage_terms(borrowed, repayment_term, interest_rate):
+    monthly = monthly_repayment_pence(borrowed, repayment_term, interest_rate)
+    return monthly, monthly * repayment_term
+
+
+
+# Works out every monthly payment of a mortgage of 'borrowed' pence over 'repayment_term' months at an 'interest_rate' percentage, returned as a tuple with one entry per month.
+# Each entry is (month, payment, interest, principal, principal left, balance left) in pence, where 'principal' is the part of the payment repaying the ammount borrowed and 'balance left' is the ammount left to pay after the payment, the same as the balance of the 'Mortgage' account.
+# The interest (everything repayable beyond the ammount borrowed) is spread over the months by the rule of 78s, so earlier payments hold more interest and later payments repay more of the ammount borrowed.
+# Month 'm' of an 'n' month term takes (n - m + 1) parts of the interest out of n * (n + 1) / 2 parts in total.
+# The interest paid up to each month is rounded down to the penny, so the monthly interest always adds up to exactly the total interest with no pennies lost to rounding.
+# Schedules are remembered by ammount borrowed, term and interest rate, like 'mortgage_terms'.
+@lru_cache(maxsize=1024)
+def amortization_schedule(borrowed, repayment_term, interest_rate):
+    monthly, full_ammount = mortgage_terms(borrowed, repayment_term, interest_rate)
+    interest_total = full_ammount - borrowed
+    parts = repayment_term * (repayment_term + 1) // 2
+    schedule = []
+    interest_paid = 0
+    for month in range(1, repayment_term + 1):
+        parts_paid = month * repayment_term - month * (month - 1) // 2
+        interest = interest_total * parts_paid // parts - interest_paid
+        interest_paid += interest
+        principal_left = borrowed - (month * monthly - interest_paid)
+        schedule.append((month, monthly, interest, monthly - interest, principal_left, full_ammount - month * monthly))
+    return tuple(schedule)
+
+
+
+# Works out the monthly repayment and the full ammount repayable for a mortgage, returned as two 'Money' ammounts.
+# This interest of 5% is fixed for all mortgage accounts at SNB (see 'monthly_repayment_pence').
+def mortgage_quote(borrow_ammount, repayment_term):
+    if borrow_ammount < minimum_mortgage_ammount:
+        raise InvalidAmountError(f"the minimum ammount you can borrow is {minimum_mortgage_ammount}")
+    if repayment_term < minimum_mortgage_term or repayment_term > maximum_mortgage_term:
+        raise InvalidTermError(f"repayment terms must range between {minimum_mortgage_term} and {maximum_mortgage_term} months")
+    monthly, full_ammount = mortgage_terms(borrow_ammount.pence, repayment_term, fixed_mortgage_interest)
+    return Money(monthly), Money(full_ammount)
+
+
+
+# Quotes every combination of the ammounts borrowed and repayment terms given, as for printing a sheet of mortgage rates.
+# Returns a list of (ammount borrowed, term, monthly repayment, full ammount repayable) with the ammounts as 'Money', ordered by term and then ammount.
+# The sheet is worked out directly rather than through the remembered quotes, so a large sheet does not push out the quotes customers have asked for.
+def mortgage_rate_sheet(borrow_ammounts, repayment_terms, interest_rate=fixed_mortgage_interest):
+    for borrow_ammount in borrow_ammounts:
+        if borrow_ammount < minimum_mortgage_ammount:
+            raise InvalidAmountError(f"the minimum ammount you can borrow is {minimum_mortgage_ammount}")
+    for repayment_term in repayment_terms:
+        if repayment_term < minimum_mortgage_term or repayment_term > maximum_mortgage_term:
+            raise InvalidTermError(f"repayment terms must range between {minimum_mortgage_term} and {maximum_mortgage_term} months")
+    sheet = []
+    for repayment_term in repayment_terms:
+        # The divisor is the same for every ammount on the same term, so each quote is one multiplication and one division.
+        divisor = 100 * repayment_term * 100
+        for borrow_ammount in borrow_ammounts:
+            monthly = -(-borrow_ammount.pence * (100 + interest_rate) // divisor) * 100
+            sheet.append((borrow_ammount, repayment_term, Money(monthly), Money(monthly * repayment_term)))
+    return sheet
+
+
+
+# Writes a sheet of mortgage quotes from 'mortgage_rate_sheet' as CSV to the screen, or to the file at 'output_path' if given.
+# 'ammounts' are written in pounds and pence (such as '150000.00') and default to 'rate_sheet_ammounts', and 'terms' default to 'rate_sheet_terms'.
+def mortgage_rate_sheet_command(ammounts, terms, output_path):
+    borrow_ammounts = rate_sheet_ammounts if not ammounts else [Money.from_text(ammount) for ammount in ammounts]
+    sheet = mortgage_rate_sheet(borrow_ammounts, terms or rate_sheet_terms)
+    file = sys.stdout if output_path is None else open(output_path, "w", newline="")
+    try:
+        writer = csv.writer(file)
+        writer.writerow(["borrowed", "term", "monthly_repayment", "full_ammount_repayable"])
+        for borrow_ammount, repayment_term, monthly, full_ammount in sheet:
+            writer.writerow([borrow_ammount.plain(), repayment_term, monthly.plain(), full_ammount.plain()])
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+
+# Opens a new account for a customer. 'category' is "Current", "Savings" or "Mortgage".
+# 'Current' and 'Savings' accounts start with a balance of £0.00 and the 'standard' foreign exchange fee or interest rate.
+# A 'Mortgage' account also needs the ammount borrowed and the repayment term in months, and its balance starts as the full ammount repayable.
+# 'number' can be an account number reserved earlier with 'account_number_allocator.reserve', otherwise a free number is allocated.
+# Either way the number is released once the account is in the account store, or if the account could not be opened.
+def open_account(customer_id, category, borrow_ammount=None, repayment_term=None, number=None):
+    if category == "Mortgage":
+        monthly, full_ammount = mortgage_quote(borrow_ammount, repayment_term)
+    elif category != "Current" and category != "Savings":
+        raise AccountTypeError(f"SNB does not offer {category} accounts")
+    if number is None:
+        number = account_number_allocator.allocate()
+    elif number in account_store.by_number:
+        raise BankError(f"account number {number} is already in use")
+    try:
+        if category == "Current":
+            account = Current(number, customer_id, Money(0), "Current", foreign_exchange_fee_categories["standard"])
+            ammount = Money(0)
+        elif category == "Savings":
+            account = Savings(number, customer_id, Money(0), "Savings", saving_interest_categories["standard"])
+            ammount = Money(0)
+        else:
+            account = Mortgage(number, customer_id, full_ammount, "Mortgage", monthly, repayment_term, False, None, borrow_ammount, repayment_term)
+            ammount = borrow_ammount
+        account_store.append(account)
+    finally:
+        account_number_allocator.release((number,))
+    record_account_change(account)
+    return TransactionResult("open_account", (account,), ammount)
+
+
+
+# Deposits money into a 'Current' or 'Savings' account.
+def deposit(number, ammount):
+    account = find_account(number)
+    check_category(account, ("Current", "Savings"), "Deposits")
+    check_ammount(ammount)
+    with locked_accounts(account):
+        account.balance += ammount
+        record_account_change(account)
+    return TransactionResult("deposit", (account,), ammount)
+
+
+
+# Withdraws money from a 'Current' or 'Savings' account, as long as the account holds enough money.
+def withdraw(number, ammount):
+    account = find_account(number)
+    check_category(account, ("Current", "Savings"), "Withdrawals")
+    check_ammount(ammount)
+    with locked_accounts(account):
+        if ammount > account.balance:
+            raise InsufficientFundsError("not enough funds in your account")
+        account.balance -= ammount
+        record_account_change(account)
+    return TransactionResult("withdraw", (account,), ammount)
+
+
+
+# Moves money from one 'Current' or 'Savings' account to another, as long as the first account holds enough money.
+# Both accounts are saved together so the transfer is saved for both accounts or for neither.
+def transfer(from_number, to_number, ammount):
+    source = find_account(from_number)
+    destination = find_account(to_number)
+    if source is destination:
+        raise SameAccountError("money cannot be transferred to the account it is sent from")
+    check_category(source, ("Current", "Savings"), "Transfers")
+    check_category(destination, ("Current", "Savings"), "Transfers")
+    check_ammount(ammount)
+    with locked_accounts(source, destination):
+        if ammount > source.balance:
+            raise InsufficientFundsError("not enough funds in your account")
+        source.balance -= ammount
+        destination.balance += ammount
+        record_account_change(source, destination)
+    return TransactionResult("transfer", (source, destination), ammount)
+
+
+
+# Makes several transfers together, given as a list of (from number, to number, ammount), so that either every transfer is made or none are.
+# Each transfer is checked the same way as 'transfer', and the balances are worked through in order so a later transfer can spend money received by an earlier one.
+# If any transfer is not allowed a 'BankError' naming it is raised and no account is changed.
+# Every account involved is locked for the whole batch and saved in a single write, so the batch is saved for every account or for none.
+def transfer_many(transfers):
+    legs = []
+    for position, (from_number, to_number, ammount) in enumerate(transfers, start=1):
+        try:
+            source = find_account(from_number)
+            destination = find_account(to_number)
+            if source is destination:
+                raise SameAccountError("money cannot be transferred to the account it is sent from")
+            check_category(source, ("Current", "Savings"), "Transfers")
+            check_category(destination, ("Current", "Savings"), "Transfers")
+            check_ammount(ammount)
+        except BankError as error:
+            raise type(error)(f"transfer {position}: {error}")
+        legs.append((position, source, destination, ammount))
+    # Each account is only listed once, in the order it first appears.
+    accounts = list({account.number: account for position, source, destination, ammount in legs for account in (source, destination)}.values())
+    with locked_accounts(*accounts):
+        balances = {account.number: account.balance for account in accounts}
+        for position, source, destination, ammount in legs:
+            if ammount > balances[source.number]:
+                raise InsufficientFundsError(f"transfer {position}: not enough funds in account {source.number}")
+            balances[source.number] -= ammount
+            balances[destination.number] += ammount
+        for account in accounts:
+            account.balance = balances[account.number]
+        if accounts:
+            record_account_change(*accounts)
+    return TransactionResult("transfer_many", tuple(accounts), Money(sum(ammount.pence for position, source, destination, ammount in legs)))
+
+
+
+# Makes the monthly payment of a 'Mortgage' account from a 'Current' account belonging to the same customer.
+# The payment due (see 'mortgage_payment_due') is taken from the 'Current' account and from the 'Mortgage' balance left to pay, and one month is taken off the months remaining.
+# A mortgage with no months or no balance left to pay is already paid off, so 'MortgagePaidOffError' is raised and no money is taken.
+def pay_mortgage(mortgage_number, from_number):
+    mortgage = find_account(mortgage_number)
+    source = find_account(from_number)
+    check_category(mortgage, ("Mortgage",), "Mortgage payments")
+    check_category(source, ("Current",), "Mortgage payments")
+    if source.customer_id != mortgage.customer_id:
+        raise AccountOwnerError("mortgage payments can only be made from a current account belonging to the same customer")
+    with locked_accounts(mortgage, source):
+        if mortgage.months_remaining <= 0 or mortgage.balance <= Money(0):
+            raise MortgagePaidOffError("this mortgage has already been paid off")
+        payment = mortgage_payment_due(mortgage)
+        if payment > source.balance:
+            raise InsufficientFundsError("not enough funds in your account to cover the monthly mortgage payment")
+        take_mortgage_payment(mortgage, source, payment)
+        record_account_change(source, mortgage)
+    return TransactionResult("pay_mortgage", (mortgage, source), payment)
+
+
+
+# Gives the payment due this month on a mortgage that is not yet paid off: the monthly repayment, or the balance left to pay if that is smaller.
+def mortgage_payment_due(mortgage):
+    if mortgage.balance < mortgage.monthly_repayment:
+        return mortgage.balance
+    return mortgage.monthly_repayment
+
+
+
+# Takes one month's 'payment' from 'source' and from the balance left to pay on 'mortgage', taking a month off the months remaining.
+# A payment that clears the balance pays off the mortgage, so no months are left to pay.
+# The accounts must be locked by the caller.
+def take_mortgage_payment(mortgage, source, payment):
+    source.balance -= payment
+    mortgage.balance -= payment
+    mortgage.months_remaining -= 1
+    if mortgage.balance <= Money(0):
+        mortgage.months_remaining = 0
+
+
+
+# Closes an account, removing it from the account store.
+def close_account(number):
+    account = find_account(number)
+    with locked_accounts(account):
+        account_store.remove(account)
+        record_account_removal(account)
+    return TransactionResult("close_account", (account,), Money(0))
+
+
+
+# Changes the foreign exchange fee of a 'Current' account to one of the 'foreign_exchange_fee_categories', such as "premium".
+def set_fee_tier(number, tier):
+    account = find_account(number)
+    check_category(account, ("Current",), "Foreign exchange fee changes")
+    if tier not in foreign_exchange_fee_categories:
+        raise InvalidTierError(f"'{tier}' is not a foreign exchange fee category")
+    with locked_accounts(account):
+        account.foreign_exchange_fee = foreign_exchange_fee_categories[tier]
+        record_account_change(account)
+    return TransactionResult("set_fee_tier", (account,), Money(0))
+
+
+
+# Changes the interest rate of a 'Savings' account to one of the 'saving_interest_categories', such as "premium".
+def set_interest_tier(number, tier):
+    account = find_account(number)
+    check_category(account, ("Savings",), "Interest rate changes")
+    if tier not in saving_interest_categories:
+        raise InvalidTierError(f"'{tier}' is not an interest rate category")
+    with locked_accounts(account):
+        account.interest_rate = saving_interest_categories[tier]
+        record_account_change(account)
+    return TransactionResult("set_interest_tier", (account,), Money(0))
+
+
+
+# Flags (or with 'flagged' as False, unflags) a 'Mortgage' account for missed payments.
+def set_missed_payment_flag(number, flagged):
+    account = find_account(number)
+    check_category(account, ("Mortgage",), "Missed payment flags")
+    with locked_accounts(account):
+        account.flagged_for_missed_payments = flagged
+        record_account_change(account)
+    return TransactionResult("set_missed_payment_flag", (account,), Money(0))
+
+
+
+# Chooses the 'Current' account that the month-end mortgage run takes a mortgage's monthly payment from.
+# 'from_number' must belong to the same customer as the mortgage.
+def set_payment_account(mortgage_number, from_number):
+    mortgage = find_account(mortgage_number)
+    source = find_account(from_number)
+    check_category(mortgage, ("Mortgage",), "Payment account changes")
+    check_category(source, ("Current",), "Mortgage payments")
+    if source.customer_id != mortgage.customer_id:
+        raise AccountOwnerError("mortgage payments can only be made from a current account belonging to the same customer")
+    with locked_accounts(mortgage):
+        mortgage.payment_account = source.number
+        record_account_change(mortgage)
+    return TransactionResult("set_payment_account", (mortgage, source), Money(0))
+
+
+
+# Finds the accounts at SNB that match every filter given, for the admin account browser, and returns a generator that gives them one at a time.
+# Filters left as None match any account: a list of 'account_numbers', the 'category', the 'customer_id', the lowest and highest balance ('min_balance' and 'max_balance' as 'Money'), the 'fee_tier' of a 'Current' account, the 'interest_tier' of a 'Savings' account and whether a 'Mortgage' account is 'flagged' for missed payments.
+# Accounts are given in order of balance when 'sort_by_balance' is "ascending" or "descending".
+# Otherwise they are given in the order they joined the index the candidates were taken from, which is the order they were opened unless their tier or flag has since been changed.
+# The candidates are taken from the smallest of the account store's indexes that the filters use, and the other filters are checked against each candidate.
+# Only the accounts that are given are built, and balances are read without building accounts, so the first page of results does not need every account at the bank to be built.
+# Raises an 'InvalidTierError' if a tier does not exist.
+def query_accounts(category=None, customer_id=None, min_balance=None, max_balance=None, fee_tier=None, interest_tier=None, flagged=None, sort_by_balance=None, account_numbers=None):
+    if fee_tier is not None and fee_tier not in foreign_exchange_fee_categories:
+        raise InvalidTierError(f"'{fee_tier}' is not a foreign exchange fee category")
+    if interest_tier is not None and interest_tier not in saving_interest_categories:
+        raise InvalidTierError(f"'{interest_tier}' is not an interest rate category")
+    if sort_by_balance not in (None, "ascending", "descending"):
+        raise ValueError(f"'{sort_by_balance}' is not a balance sort order")
+
+    # Each filter with an index gives the account numbers that match it, with mortgages that are not flagged found from the 'Mortgage' category.
+    with storage_lock:
+        index_sets = []
+        if account_numbers is not None:
+            index_sets.append(dict.fromkeys(account_numbers))
+        if category is not None:
+            index_sets.append(account_store.by_category.get(category, {}))
+        if customer_id is not None:
+            index_sets.append(account_store.by_customer.get(customer_id, {}))
+        if fee_tier is not None:
+            index_sets.append(account_store.by_tier.get(("Current", foreign_exchange_fee_categories[fee_tier]), {}))
+        if interest_tier is not None:
+            index_sets.append(account_store.by_tier.get(("Savings", saving_interest_categories[interest_tier]), {}))
+        if flagged is not None:
+            index_sets.append(account_store.flagged if flagged else account_store.by_category.get("Mortgage", {}))
+        if not index_sets:
+            index_sets.append(account_store.by_number)
+        # The numbers in the smallest set are copied so that accounts opened or closed while the results are read do not disturb the loop.
+        index_sets.sort(key=len)
+        numbers = list(index_sets[0])
+    other_sets = index_sets[1:]
+    lowest = None if min_balance is None else min_balance.pence
+    highest = None if max_balance is None else max_balance.pence
+
+    # Checks a candidate against the other filters, returning its balance in pence if it matches or None if it does not.
+    # The balance is only read when it is needed to filter or sort the accounts.
+    def matching_balance(number):
+        if not all(number in numbers_set for numbers_set in other_sets):
+            return None
+        if flagged is False and number in account_store.flagged:
+            return None
+        if lowest is None and highest is None and sort_by_balance is None:
+            return 0
+        balance = account_store.balance_pence(number)
+        if balance is None or (lowest is not None and balance < lowest) or (highest is not None and balance > highest):
+            return None
+        return balance
+
+    def results():
+        if sort_by_balance is None:
+            for number in numbers:
+                if matching_balance(number) is not None:
+                    account = account_store.get(number)
+                    if account is not None:
+                        yield account
+            return
+        # Ordering by balance needs the balance of every matching account, but the accounts are only built as they are taken off the heap.
+        sign = 1 if sort_by_balance == "ascending" else -1
+        ordered = []
+        for number in numbers:
+            balance = matching_balance(number)
+            if balance is not None:
+                ordered.append((sign * balance, number))
+        heapify(ordered)
+        while ordered:
+            account = account_store.get(heappop(ordered)[1])
+            if account is not None:
+                yield account
+
+    return results()
+
+
+
+# Returns the 'Current' account a mortgage's monthly payment is taken from in the month-end mortgage run, or None if the customer has no 'Current' account.
+# This is the mortgage's designated payment account if it still exists and belongs to the customer, otherwise the customer's first 'Current' account.
+# The customer's accounts are checked against the category index so that only the chosen account is built.
+def mortgage_payment_account(mortgage):
+    if mortgage.payment_account is not None:
+        source = account_store.get(mortgage.payment_account)
+        if source is not None and source.category == "Current" and source.customer_id == mortgage.customer_id:
+            return source
+    current_numbers = account_store.by_category.get("Current", {})
+    for number in account_store.by_customer.get(mortgage.customer_id, {}):
+        if number in current_numbers:
+            return account_store.materialize(number)
+    return None
+
+
+
+# Takes the monthly payment of every 'Mortgage' account at SNB in a single pass, as the bank does at the end of each month.
+# Each payment is taken from the mortgage's payment account (see 'mortgage_payment_account') the same way as 'pay_mortgage'.
+# If the payment account is missing or does not hold enough money then no payment is taken and the mortgage is flagged for missed payments.
+# Mortgages that are already paid off are left as they are.
+# Changes are saved in batches of 'posting_batch_size' mortgages, and a 'MortgageRunSummary' of the run is returned.
+# A customer's mortgages are paid in the order they were opened, so when several share a payment account the earlier ones are paid first.
+def month_end_mortgage_run():
+    summary = MortgageRunSummary()
+    mortgage_numbers = list(account_store.by_category.get("Mortgage", {}))
+    for start in range(0, len(mortgage_numbers), posting_batch_size):
+        with persistence_batch():
+            for number in mortgage_numbers[start:start + posting_batch_size]:
+                mortgage = account_store.materialize(number)
+                summary.mortgages += 1
+                if mortgage.months_remaining <= 0 or mortgage.balance <= Money(0):
+                    summary.already_paid_off += 1
+                    continue
+                repayment = mortgage_payment_due(mortgage)
+                source = mortgage_payment_account(mortgage)
+                if source is None:
+                    paying_accounts = (mortgage,)
+                else:
+                    paying_accounts = (mortgage, source)
+                with locked_accounts(*paying_accounts):
+                    if source is not None and source.balance >= repayment:
+                        take_mortgage_payment(mortgage, source, repayment)
+                        summary.paid += 1
+                        summary.collected_pence += repayment.pence
+                        if mortgage.months_remaining == 0:
+                            summary.paid_off += 1
+                        record_account_change(source, mortgage)
+                    else:
+                        summary.missed += 1
+                        summary.missed_pence += repayment.pence
+                        if not mortgage.flagged_for_missed_payments:
+                            mortgage.flagged_for_missed_payments = True
+                            summary.newly_flagged += 1
+                            record_account_change(mortgage)
+    return summary
+
+
+
+# Runs the month-end mortgage run from the command line and displays its summary.
+def month_end_mortgage_run_command():
+    import_customer_records()
+    import_accounts()
+    start = time.perf_counter()
+    summary = month_end_mortgage_run()
+    elapsed = time.perf_counter() - start
+    export_accounts()
+    account_storage.close()
+    print("----------")
+    print("Month-end mortgage run")
+    print("-")
+    print(f"Mortgages: {summary.mortgages}")
+    print(f"Payments taken: {summary.paid} ({summary.collected})")
+    print(f"Payments missed: {summary.missed} ({summary.missed_ammount})")
+    print(f"Newly flagged for missed payments: {summary.newly_flagged}")
+    print(f"Mortgages paid off this month: {summary.paid_off}")
+    print(f"Mortgages already paid off: {summary.already_paid_off}")
+    print(f"Completed in {elapsed:.2f} seconds")
+    print("----------")
+
+
+
+# Divides two whole numbers and rounds the result to the nearest whole number, with halves rounded to the even neighbour (banker's rounding).
+# Rounding halves to even means that over many accounts as many halfpennies are rounded down as up, so the bank neither gains nor loses from rounding.
+def divide_half_even(numerator, denominator):
+    quotient, remainder = divmod(numerator, denominator)
+    if remainder * 2 > denominator or (remainder * 2 == denominator and quotient % 2 == 1):
+        quotient += 1
+    return quotient
+
+
+
+# Gives the growth of a balance over 'periods' interest periods as a fraction, returned as its numerator and denominator.
+# With 'periods_per_year' periods a year the balance is multiplied by (1 + rate / (100 * periods_per_year)) each period, so over several periods the growth is that raised to the power of 'periods'.
+# Both parts are whole numbers, so compounding is exact however many periods are caught up on, and is worked out once rather than period by period.
+def compound_growth(interest_rate, periods_per_year, periods):
+    denominator = 100 * periods_per_year
+    return (denominator + interest_rate) ** periods, denominator ** periods
+
+
+
+# Works out how many interest periods of 'frequency' ("daily" or "monthly") have passed between two dates.
+# Monthly interest is due once for every start of a month passed, whatever day of the month the runs are made on.
+def interest_periods_between(start, end, frequency):
+    if frequency == "daily":
+        periods = (end - start).days
+    else:
+        periods = (end.year - start.year) * 12 + end.month - start.month
+    return max(periods, 0)
+
+
+
+# Adds interest to every 'Savings' account at SNB for 'periods' interest periods of 'frequency' in a single pass.
+# The interest on each balance is compounded exactly and rounded to the nearest penny only once at the end, with halves rounded to even (see 'divide_half_even').
+# The growth for each interest rate is worked out once for the whole run, so each account only costs one multiplication and one division.
+# Every account credited is saved in one persistence batch, and an 'InterestRunSummary' of the run is returned.
+def savings_interest_run(periods, frequency="daily"):
+    summary = InterestRunSummary(periods)
+    if periods <= 0:
+        return summary
+    periods_per_year = interest_periods_per_year[frequency]
+    growth = {}
+    with persistence_batch():
+        for number in list(account_store.by_category.get("Savings", {})):
+            account = account_store.materialize(number)
+            summary.accounts += 1
+            if account.interest_rate not in growth:
+                growth[account.interest_rate] = compound_growth(account.interest_rate, periods_per_year, periods)
+            numerator, denominator = growth[account.interest_rate]
+            with locked_accounts(account):
+                balance = account.balance.pence
+                interest = divide_half_even(balance * numerator, denominator) - balance
+                if interest > 0:
+                    account.balance += Money(interest)
+                    summary.credited += 1
+                    summary.interest_pence += interest
+                    record_account_change(account)
+    return summary
+
+
+
+# Gives the date savings interest was last accrued up to from 'interest_accrual_path', or None if interest has never been accrued.
+# The date is given along with whether the run that accrued it finished saving the interest it credited (see 'savings_interest_run_command').
+def load_interest_accrual_date():
+    try:
+        with open(interest_accrual_path, "r") as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        return None, True
+    return date.fromisoformat(data["accrued_to"]), data.get("finished", True)
+
+
+
+# Saves the date savings interest has been accrued up to in 'interest_accrual_path', and whether the interest credited up to that date has been saved.
+# The file is written to a temporary file first, forced onto the disk and renamed over the old one, so it is never left half written and is not lost in a crash.
+def save_interest_accrual_date(accrued_to, finished):
+    with open(interest_accrual_path + ".tmp", "w") as file:
+        json.dump({"accrued_to": accrued_to.isoformat(), "finished": finished}, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(interest_accrual_path + ".tmp", interest_accrual_path)
+    sync_folder(os.path.dirname(os.path.abspath(interest_accrual_path)))
+
+
+
+# Runs the savings interest run from the command line and displays its summary.
+# Unless 'periods' is given, interest is accrued for every period that has passed since the last run, or for one period if interest has never been accrued.
+# Running it again on the same day (or month, for monthly interest) adds no more interest.
+# The new accrual date is saved before any interest is credited and marked finished once the credited balances are saved.
+# If the run is stopped in between, the next run still sees the new date, so the interest is never credited twice. It warns that the earlier run did not finish so its balances can be checked.
+def savings_interest_run_command(frequency, periods):
+    import_customer_records()
+    import_accounts()
+    today = date.today()
+    accrued_to, finished = load_interest_accrual_date()
+    if not finished:
+        print("----------")
+        print("--WARNING--")
+        print(f"The interest run up to {accrued_to.isoformat()} was stopped before it finished saving the interest it credited")
+        print("Its interest has not been credited again. Please check the savings balances, and use '--periods' to credit any interest that is missing")
+        print("----------")
+    if periods is None:
+        periods = 1 if accrued_to is None else interest_periods_between(accrued_to, today, frequency)
+    save_interest_accrual_date(today, False)
+    start = time.perf_counter()
+    summary = savings_interest_run(periods, frequency)
+    elapsed = time.perf_counter() - start
+    export_accounts()
+    account_storage.close()
+    save_interest_accrual_date(today, True)
+    print("----------")
+    print(f"Savings interest run ({frequency})")
+    print("-")
+    print(f"Interest periods: {summary.periods}")
+    print(f"Savings accounts: {summary.accounts}")
+    print(f"Accounts credited: {summary.credited}")
+    print(f"Interest paid: {summary.interest}")
+    print(f"Completed in {elapsed:.2f} seconds")
+    print("----------")
+
+
+
+# Moves every 'Current' or 'Savings' account that matches the filters to a new foreign exchange fee or interest rate tier, such as moving all 'standard' savings accounts to 'premium'.
+# 'filters' are the keyword arguments of 'query_accounts' (such as {"interest_tier": "standard"}) and 'account_numbers' can limit the repricing to a list of accounts, for example read from a file.
+# The matching accounts are found through the account store's indexes in a single pass, and every change is saved together when the pass ends.
+# With 'dry_run' nothing is changed, but the summary still counts what would have been.
+# Returns a 'RepricingSummary', and raises an 'AccountTypeError' for a 'Mortgage' category or an 'InvalidTierError' for a tier that does not exist.
+def reprice_accounts(category, new_tier, filters=None, account_numbers=None, dry_run=False):
+    if category == "Current":
+        tiers, attribute = foreign_exchange_fee_categories, "foreign_exchange_fee"
+    elif category == "Savings":
+        tiers, attribute = saving_interest_categories, "interest_rate"
+    else:
+        raise AccountTypeError(f"only Current and Savings accounts have tiers, not {category} accounts")
+    if new_tier not in tiers:
+        raise InvalidTierError(f"'{new_tier}' is not a {'foreign exchange fee' if category == 'Current' else 'interest rate'} category")
+    summary = RepricingSummary(category, new_tier, dry_run)
+    new_rate = tiers[new_tier]
+    # Rates that are not one of the tiers (which can only come from editing the saved file) are counted under the rate itself.
+    tier_names = {rate: name for name, rate in tiers.items()}
+    # Numbers listed more than once are only counted once, and the listed numbers that cannot be repriced are counted from the indexes without building their accounts.
+    if account_numbers is not None:
+        account_numbers = list(dict.fromkeys(account_numbers))
+        category_numbers = account_store.by_category.get(category, {})
+        for number in account_numbers:
+            if number not in account_store:
+                summary.not_found += 1
+            elif number not in category_numbers:
+                summary.other_category += 1
+    with persistence_batch():
+        for account in query_accounts(**dict(filters or {}, category=category, account_numbers=account_numbers)):
+            with locked_accounts(account):
+                old_tier = tier_names.get(getattr(account, attribute), f"{getattr(account, attribute)}%")
+                summary.accounts += 1
+                summary.before[old_tier] = summary.before.get(old_tier, 0) + 1
+                summary.after[new_tier] = summary.after.get(new_tier, 0) + 1
+                if getattr(account, attribute) == new_rate:
+                    continue
+                summary.changed += 1
+                if not dry_run:
+                    setattr(account, attribute, new_rate)
+                    record_account_change(account)
+    return summary
+
+
+
+# Reads a list of account numbers from a file with one number on each line, for 'reprice_accounts'. Blank lines are ignored.
+# Raises a 'ValueError' naming the first line that is not an account number.
+def read_account_numbers(path):
+    numbers = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, 1):
+            text = line.strip()
+            if not text:
+                continue
+            if not text.isdigit():
+                raise ValueError(f"line {line_number} of '{path}' is not an account number: {text!r}")
+            numbers.append(int(text))
+    return numbers
+
+
+
+# Runs a bulk repricing from the command line and displays its summary, including how many of the matching accounts were in each tier before and after.
+# Accounts can be chosen by their current tier ('from_tier'), balance, customer username and a file listing their numbers, and every account of the category is repriced if none of these are given.
+# A dry run shows the same summary without changing or saving any account.
+def reprice_accounts_command(category, new_tier, from_tier, min_balance, max_balance, c_name, numbers_path, dry_run):
+    import_customer_records()
+    import_accounts()
+    filters = {}
+    try:
+        if from_tier is not None:
+            filters["fee_tier" if category == "Current" else "interest_tier"] = from_tier
+        if min_balance is not None:
+            filters["min_balance"] = Money.from_text(min_balance)
+        if max_balance is not None:
+            filters["max_balance"] = Money.from_text(max_balance)
+        if c_name is not None:
+            if c_name not in customer_records:
+                raise ValueError(f"no customer has the username '{c_name}'")
+            filters["customer_id"] = customer_records[c_name].customer_id
+        account_numbers = None if numbers_path is None else read_account_numbers(numbers_path)
+        start = time.perf_counter()
+        summary = reprice_accounts(category, new_tier, filters, account_numbers, dry_run)
+        elapsed = time.perf_counter() - start
+    except (BankError, ValueError) as error:
+        account_storage.close()
+        raise SystemExit(f"Repricing failed: {error}")
+    if not dry_run:
+        export_accounts()
+    account_storage.close()
+    tiers = foreign_exchange_fee_categories if category == "Current" else saving_interest_categories
+    print("----------")
+    print(f"Repricing {category} accounts to '{new_tier}'" + (" (dry run, nothing was changed)" if dry_run else ""))
+    print("-")
+    print(f"Accounts matched: {summary.accounts}")
+    print(f"Accounts {'to be moved' if dry_run else 'moved'} to '{new_tier}': {summary.changed}")
+    print(f"Accounts already '{new_tier}': {summary.unchanged}")
+    if numbers_path is not None:
+        print(f"Listed numbers not found: {summary.not_found}")
+        print(f"Listed numbers of other categories: {summary.other_category}")
+    print("-")
+    print(f"{'Tier':<12}{'Before':>10}{'After':>10}")
+    for tier in list(tiers) + [tier for tier in summary.before if tier not in tiers]:
+        print(f"{tier:<12}{summary.before.get(tier, 0):>10}{summary.after.get(tier, 0):>10}")
+    print(f"Completed in {elapsed:.2f} seconds")
+    print("----------")
+
+
+
+# Records a change made to one or more accounts (including newly opened accounts) in the selected storage.
+# This is called everytime an account is created or a change occurs in an account, and costs the same however many accounts exist at SNB.
+# Accounts changed together by one transaction, such as both accounts in a mortgage payment, are passed in the same call.
+# While a 'persistence_batch' is open in the same thread the accounts are only noted, and are saved when the batch ends.
+# The account store's rate and flag indexes are brought up to date straight away either way.
+def record_account_change(*accounts):
+    for account in accounts:
+        account_store.reindex(account)
+    changes = getattr(persistence_batches, "changes", None)
+    if changes is not None:
+        for account in accounts:
+            changes[account.number] = account
+        return
+    with storage_lock:
+        account_storage.record_change(*accounts)
+
+
+
+# Groups every account change made inside a 'with persistence_batch():' block so they are saved to the storage together when the block ends.
+# Saving a whole batch at once means one journal write, one database transaction or one flush of the binary file instead of one for every transaction.
+# Changes already made to accounts are still saved if the block ends with an error, since they cannot be undone in the account store.
+# A batch opened inside another batch joins the outer one. Each thread has its own batch, so changes made by other threads at the same time are saved as usual.
+@contextmanager
+def persistence_batch():
+    if getattr(persistence_batches, "changes", None) is not None:
+        yield
+        return
+    persistence_batches.changes = {}
+    try:
+        yield
+    finally:
+        changes = persistence_batches.changes
+        persistence_batches.changes = None
+        if changes:
+            with storage_lock:
+                account_storage.record_change(*changes.values())
+
+
+
+# Records a newly registered customer login in the selected storage.
+def record_new_customer(c_name):
+    with storage_lock:
+        account_storage.record_customer(customer_records, c_name)
+
+
+
+# Records that an account has been closed in the selected storage.
+# A change to the account waiting in an open 'persistence_batch' is dropped so the account is not saved again after it is closed.
+def record_account_removal(account):
+    changes = getattr(persistence_batches, "changes", None)
+    if changes is not None:
+        changes.pop(account.number, None)
+    with storage_lock:
+        account_storage.record_removal(account)
+
+
+
+# Transactions that can be posted from a batch posting file, by the name used in its 'type' column.
+posting_operations = {"deposit": deposit, "withdraw": withdraw}
+
+
+
+# Reads the transactions in a batch posting file one at a time, giving the line number and a dictionary of each.
+# Files ending in '.csv' need a header line naming the 'type', 'account' and 'amount' columns, any other file is read as JSON lines with the same keys.
+# Blank lines are skipped, and a line that is not valid JSON is given as its 'JSONDecodeError' instead.
+def read_postings(file, path):
+    if path.endswith(".csv"):
+        reader = csv.DictReader(file)
+        for posting in reader:
+            yield reader.line_num, posting
+    else:
+        for line_number, line in enumerate(file, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as error:
+                    yield line_number, error
+
+
+
+# Applies one transaction from a batch posting file through the matching transaction function.
+# Returns a row of the result report: the line number, account, type, ammount, "posted" or "rejected", the new balance (if posted), and the reason (if rejected).
+def apply_posting(line_number, posting):
+    if isinstance(posting, json.JSONDecodeError):
+        return [line_number, "", "", "", "rejected", "", f"line is not valid JSON: {posting}"]
+    # A line of valid JSON that holds something other than an object, such as a list or a number, has no columns to read.
+    if not isinstance(posting, dict):
+        return [line_number, "", "", "", "rejected", "", "line is not a JSON object"]
+    account = str(posting.get("account", "")).strip()
+    operation = str(posting.get("type", "")).strip().lower()
+    ammount_text = str(posting.get("amount", "")).strip()
+    try:
+        if operation not in posting_operations:
+            raise BankError(f"'{operation}' is not a transaction type that can be posted")
+        try:
+            ammount = Money.from_text(ammount_text)
+        except ValueError as error:
+            raise InvalidAmountError(str(error))
+        result = posting_operations[operation](account, ammount)
+    except BankError as error:
+        return [line_number, account, operation, ammount_text, "rejected", "", str(error)]
+    return [line_number, account, operation, ammount_text, "posted", result.account.balance.plain(), ""]
+
+
+
+# Posts every transaction in a batch posting file (such as an end-of-day payments file) against the account store, writing a result line for each to 'report'.
+# Each transaction is checked the same way as when it is made through the menus, so for example a withdrawal without enough funds is rejected and the lines after it are still posted.
+# Transactions are applied in batches of 'posting_batch_size' and each batch is saved to the storage in one go, so the cost of saving does not grow with the number of transactions.
+# A batch's report lines are only written once the batch has been saved.
+# Returns the number of transactions posted and the number rejected.
+def post_transactions(path, report):
+    writer = csv.writer(report)
+    writer.writerow(["line", "account", "type", "amount", "status", "balance", "reason"])
+    posted = 0
+    rejected = 0
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        postings = read_postings(file, path)
+        while True:
+            results = []
+            with persistence_batch():
+                for line_number, posting in postings:
+                    results.append(apply_posting(line_number, posting))
+                    if len(results) >= posting_batch_size:
+                        break
+            if not results:
+                break
+            for row in results:
+                if row[4] == "posted":
+                    posted += 1
+                else:
+                    rejected += 1
+            writer.writerows(results)
+    return posted, rejected
+
+
+
+# Posts a batch posting file from the command line and writes the result report to 'report_path', or to the screen if no path is given.
+def post_transactions_file(path, report_path):
+    import_customer_records()
+    import_accounts()
+    start = time.perf_counter()
+    if report_path is None:
+        posted, rejected = post_transactions(path, sys.stdout)
+    else:
+        with open(report_path, "w", encoding="utf-8", newline="") as report:
+            posted, rejected = post_transactions(path, report)
+    elapsed = time.perf_counter() - start
+    export_accounts()
+    account_storage.close()
+    print(f"Posted {posted} transactions, rejected {rejected}, in {elapsed:.2f} seconds ({(posted + rejected) / max(elapsed, 1e-9):.0f} per second)", file=sys.stderr)
+
+
+
+# The functions below serve the transaction functions to many customers at the same time over the network.
+# Clients send one JSON request per line, such as {"id": 1, "method": "deposit", "params": {"account": 12345678, "amount": "10.50"}}.
+# Each request gets one JSON reply per line with the same "id", holding either a "result" or an "error" with the error's "type" and "message".
+# Ammounts are sent as pounds and pence text, the same as in batch posting files, so no floating point numbers are involved.
+
+# Raises 'LoginError' unless a customer is logged in to the session.
+def require_login(session):
+    if not session.logged_in:
+        raise LoginError("please log in first")
+
+
+
+# Returns the account with the given number if it belongs to the customer logged in to the session, raising 'AccountOwnerError' if it belongs to another customer.
+def session_account(session, number):
+    require_login(session)
+    account = find_account(number)
+    if account.customer_id != session.customer_id:
+        raise AccountOwnerError(f"account {number} does not belong to you")
+    return account
+
+
+
+# Reads the ammount named 'key' from the parameters of a request, raising 'InvalidAmountError' if it is not a valid ammount in pounds and pence.
+def request_ammount(params, key="amount"):
+    try:
+        return Money.from_text(str(params.get(key, "")))
+    except ValueError as error:
+        raise InvalidAmountError(str(error))
+
+
+
+# Describes an account in a reply, with its ammounts as pounds and pence text.
+def account_summary(account):
+    summary = {"number": account.number, "category": account.category, "balance": account.balance.plain()}
+    if account.category == "Mortgage":
+        summary.update({"monthly_repayment": account.monthly_repayment.plain(), "months_remaining": account.months_remaining})
+    return summary
+
+
+
+# Logs the session in as a customer and gives it a token, forgetting any token the session had before.
+# Sessions whose tokens have expired are cleared out of 'session_cache' at each login, as checking the password already takes far longer.
+# Logins run in worker threads (see 'SNBServer'), so the cache is copied before it is looked through and each expired session is only cleared by one thread.
+def start_session(session, c_name, customer_id):
+    end_session(session)
+    now = time.monotonic()
+    for token, cached in list(session_cache.items()):
+        if cached.expires < now and session_cache.pop(token, None) is not None:
+            cached.token = None
+    session.c_name = c_name
+    session.customer_id = customer_id
+    session.token = secrets.token_urlsafe(24)
+    session.expires = now + session_lifetime
+    session_cache[session.token] = session
+    return {"username": c_name, "token": session.token}
+
+
+
+# Logs the session out, so its token can no longer be used.
+def end_session(session):
+    if session.token is not None:
+        session_cache.pop(session.token, None)
+    session.c_name = None
+    session.customer_id = None
+    session.token = None
+    session.expires = None
+
+
+
+# Returns the logged in session with the given token, so a request can be made without checking the customer's password again.
+# Each use keeps the token valid for another 'session_lifetime' seconds. Raises 'LoginError' if the token is unknown or has expired.
+def cached_session(token):
+    session = session_cache.get(token) if isinstance(token, str) else None
+    now = time.monotonic()
+    if session is None or session.expires < now:
+        if session is not None:
+            end_session(session)
+        raise LoginError("your session has expired, please log in again")
+    session.expires = now + session_lifetime
+    return session
+
+
+
+# Logs the session in as a customer, checking the username and password the same way as 'customer_login'.
+# The reply holds a token which can be sent with later requests instead of logging in again.
+def server_login(session, params):
+    c_name = params.get("username")
+    c_pass = params.get("password")
+    if not isinstance(c_name, str) or not isinstance(c_pass, str) or not verify_login(c_name, c_pass):
+        raise LoginError("incorrect username or password")
+    return start_session(session, c_name, customer_records[c_name].customer_id)
+
+
+
+def server_logout(session, params):
+    end_session(session)
+    return {}
+
+
+
+# Registers a new customer and logs the session in as them, with the same rules as 'register_new_customer'.
+def server_register(session, params):
+    c_name = params.get("username")
+    c_pass = params.get("password")
+    for value in (c_name, c_pass):
+        if not isinstance(value, str) or value == "" or " " in value:
+            raise RegistrationError("usernames and passwords must be text with no spaces")
+    # The password is hashed before taking 'storage_lock', so registrations in other worker threads only wait for the username check and the save.
+    # The customer id is only given once the username is known to be free.
+    credential = Credential.from_password(None, c_pass)
+    with storage_lock:
+        if c_name in customer_records:
+            raise RegistrationError("username already in use please choose a different username")
+        credential.customer_id = next_customer_id()
+        customer_records.update({c_name: credential})
+        customer_names.update({credential.customer_id: c_name})
+        record_new_customer(c_name)
+    return start_session(session, c_name, credential.customer_id)
+
+
+
+# Lists the accounts of the logged in customer.
+def server_accounts(session, params):
+    require_login(session)
+    return {"accounts": [account_summary(account) for account in account_store.for_customer(session.customer_id)]}
+
+
+
+# Opens an account for the logged in customer. A "Mortgage" also needs the "amount" borrowed and the repayment "term" in months.
+def server_open_account(session, params):
+    require_login(session)
+    category = params.get("category")
+    if category == "Mortgage":
+        repayment_term = params.get("term")
+        if not isinstance(repayment_term, int):
+            raise InvalidTermError("the repayment term must be a whole number of months")
+        result = open_account(session.customer_id, category, request_ammount(params), repayment_term)
+    else:
+        result = open_account(session.customer_id, category)
+    return account_summary(result.account)
+
+
+
+def server_deposit(session, params):
+    account = session_account(session, params.get("account"))
+    return account_summary(deposit(account.number, request_ammount(params)).account)
+
+
+
+def server_withdraw(session, params):
+    account = session_account(session, params.get("account"))
+    return account_summary(withdraw(account.number, request_ammount(params)).account)
+
+
+
+# Transfers money from one of the logged in customer's accounts to any account at SNB.
+def server_transfer(session, params):
+    source = session_account(session, params.get("from"))
+    result = transfer(source.number, params.get("to"), request_ammount(params))
+    return account_summary(result.account)
 
-    # Loops through the list of all bank accounts adding each account number to the temporary account numbers list.
-    for a in accounts_list:
-        temp_ac_numbers.append(a.number)
-    # Checks if the account number generated exists in the temporary list that was just populated.
-    # If it is in the list then the function calls itself and the account number becomes the return value of the function called.
-    # This creates a recursive function which continues to call itself until a unique number is found.
-    if account_number in temp_ac_numbers:
-       account_number = generate_unique_ac_number()
-    # Once a unique account number is found, the if statement does not run and the function returns the unique account number generated.
-    return account_number
 
 
+# Makes a list of "transfers" together, each with "from", "to" and "amount", so that either every transfer is made or none are.
+# Every account transferred from must belong to the logged in customer.
+def server_transfer_many(session, params):
+    transfers = params.get("transfers")
+    if not isinstance(transfers, list) or not all(isinstance(leg, dict) for leg in transfers):
+        raise InvalidAmountError("'transfers' must be a list of transfers, each with 'from', 'to' and 'amount'")
+    legs = [(session_account(session, leg.get("from")).number, leg.get("to"), request_ammount(leg)) for leg in transfers]
+    # Only the customer's own accounts are described in the reply, not the accounts of other customers they sent money to.
+    accounts = transfer_many(legs).accounts
+    return {"accounts": [account_summary(account) for account in accounts if account.customer_id == session.customer_id]}
 
-# Exports account objects to JSON file
-# Bank account instances are saved into the 'acounts.json' file everytime an account is created, a change occurs in an account, or the SNB Application is exited.
+
+
+# Makes the monthly payment of one of the logged in customer's mortgages from one of their 'Current' accounts.
+def server_pay_mortgage(session, params):
+    mortgage = session_account(session, params.get("mortgage"))
+    source = session_account(session, params.get("account"))
+    return {"accounts": [account_summary(account) for account in pay_mortgage(mortgage.number, source.number).accounts]}
+
+
+
+# Gives the metrics kept since the server started, as the dictionary written to a '.json' metrics file, or as Prometheus text if the "format" param is "prometheus".
+# Metrics are only kept when the server is started with '--metrics'.
+def server_metrics(session, params):
+    if not metrics_enabled:
+        raise BankError("metrics are not turned on, start the server with '--metrics' to keep them")
+    if params.get("format") == "prometheus":
+        return {"text": metrics_prometheus_text()}
+    return metrics_snapshot()
+
+
+
+# Methods that check or hash a password, which the SNB server runs in worker threads.
+password_methods = {"login", "register"}
+
+# Methods that can be requested from the SNB server, and the function that handles each one.
+server_methods = {
+    "login": server_login,
+    "logout": server_logout,
+    "register": server_register,
+    "accounts": server_accounts,
+    "open_account": server_open_account,
+    "deposit": server_deposit,
+    "withdraw": server_withdraw,
+    "transfer": server_transfer,
+    "transfer_many": server_transfer_many,
+    "pay_mortgage": server_pay_mortgage,
+    "metrics": server_metrics,
+}
+
+
+
+# Checks that a request is a JSON object naming one of the 'server_methods' with an object of 'params'.
+# Returns the error reply for the request if it is not, or None if it is.
+def request_error(request):
+    if not isinstance(request, dict) or not isinstance(request.get("params", {}), dict):
+        return {"id": None, "error": {"type": "RequestError", "message": "requests must be JSON objects with a 'method' and an object of 'params'"}}
+    if not isinstance(request.get("method"), str) or request["method"] not in server_methods:
+        return {"id": request.get("id"), "error": {"type": "RequestError", "message": f"unknown method {request.get('method')!r}"}}
+    return None
+
+
+
+# Runs one request from a client and returns the reply.
+# A 'BankError' (such as not having enough funds) is returned as an error reply rather than ending the connection.
+# Any other error is a fault in the SNB server rather than in the request, so it is printed for whoever runs the server and returned as an 'InternalError' reply to this request alone.
+def handle_request(session, request):
+    error_reply = request_error(request)
+    if error_reply is not None:
+        return error_reply
+    request_id = request.get("id")
+    method = server_methods[request["method"]]
+    try:
+        # A request sent with a "token" uses the logged in session the token was given to, instead of the connection's own session.
+        if "token" in request:
+            session = cached_session(request["token"])
+        return {"id": request_id, "result": method(session, request.get("params", {}))}
+    except BankError as error:
+        return {"id": request_id, "error": {"type": type(error).__name__, "message": str(error)}}
+    except Exception:
+        traceback.print_exc()
+        return {"id": request_id, "error": {"type": "InternalError", "message": "the request could not be completed"}}
+
+
+
+# SNBServer serves the transaction functions to many connected clients at the same time, each connection with its own 'Session'.
+# Requests are run one at a time by the event loop, so transactions never interleave and the shared account store needs no locks.
+# Every request that arrives while the event loop is busy is run in the same 'persistence_batch', so their changes are saved to the storage together.
+# Replies are only sent once the changes they describe are saved.
+# Logins and registrations are the exception: they hash a password, which takes about a quarter of a second, so each is run in a worker thread and the event loop carries on serving other connections meanwhile.
+class SNBServer:
+    def __init__(self):
+        # Requests waiting to be run, as (session, request, future) where the future receives the reply.
+        self.queue = []
+        self.run_scheduled = False
+        self.connections = 0
+
+
+
+    # Queues a request to be run with the others that arrive at the same time and waits for its reply.
+    # Requests that are not valid are answered straight away without being queued.
+    # Requests in 'password_methods' do not change any accounts, so they are run in a worker thread instead of being queued.
+    async def submit(self, session, request):
+        error_reply = request_error(request)
+        if error_reply is not None:
+            return error_reply
+        loop = asyncio.get_running_loop()
+        if request["method"] in password_methods:
+            return await loop.run_in_executor(None, handle_request, session, request)
+        future = loop.create_future()
+        self.queue.append((session, request, future))
+        if not self.run_scheduled:
+            self.run_scheduled = True
+            loop.call_soon(self.run_queued)
+        return await future
+
+
+
+    # Runs every queued request in one 'persistence_batch' and then hands out the replies.
+    # A request that fails is given its own error reply by 'handle_request', so it never affects the other requests in the batch.
+    # If the changes cannot be saved then every request in the batch fails, since none of their replies could be trusted.
+    def run_queued(self):
+        queue = self.queue
+        self.queue = []
+        self.run_scheduled = False
+        replies = []
+        try:
+            with persistence_batch():
+                for session, request, future in queue:
+                    replies.append(handle_request(session, request))
+        except Exception as error:
+            for session, request, future in queue:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (session, request, future), reply in zip(queue, replies):
+            if not future.done():
+                future.set_result(reply)
+
+
+
+    # Reads requests from one connection until the client disconnects, replying to each in turn.
+    async def serve_connection(self, reader, writer):
+        session = Session()
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    reply = {"id": None, "error": {"type": "RequestError", "message": "request is not valid JSON"}}
+                else:
+                    try:
+                        reply = await self.submit(session, request)
+                    # The batch the request was run in could not be saved, which is reported to the client instead of closing the connection without a reply.
+                    except Exception:
+                        traceback.print_exc()
+                        reply = {"id": request.get("id") if isinstance(request, dict) else None, "error": {"type": "InternalError", "message": "the changes made by the request could not be saved"}}
+                writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+
+
+    # Listens on a TCP port, or on a Unix socket if 'unix_path' is given, until the process is interrupted or terminated.
+    async def run(self, host, port, unix_path=None):
+        if unix_path is not None:
+            listener = await asyncio.start_unix_server(self.serve_connection, path=unix_path)
+        else:
+            listener = await asyncio.start_server(self.serve_connection, host, port)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        addresses = ", ".join(str(sock.getsockname()) for sock in listener.sockets)
+        print(f"SNB server listening on {addresses}", flush=True)
+        if metrics_enabled and metrics_path is not None:
+            metrics_writer = asyncio.create_task(self.write_metrics_regularly())
+        async with listener:
+            await stop.wait()
+        if metrics_enabled and metrics_path is not None:
+            metrics_writer.cancel()
+
+
+
+    # Writes the metrics to 'metrics_path' every 'metrics_interval' seconds while the server runs, so they can be scraped from the file.
+    async def write_metrics_regularly(self):
+        while True:
+            await asyncio.sleep(metrics_interval)
+            write_metrics(metrics_path)
+
+
+
+# Starts the SNB server from the command line, saving every change to the storage when it is stopped.
+def serve_command(host, port, unix_path):
+    import_customer_records()
+    import_accounts()
+    try:
+        asyncio.run(SNBServer().run(host, port, unix_path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        export_accounts()
+        account_storage.close()
+    print("SNB server stopped")
+
+
+
+# Turns on the timers and counters of the hot paths: importing and exporting, the storage, account lookups, logins, every transaction and every request to the SNB server.
+# Each function in 'metered_functions' (and each method in 'metered_storage_methods' and 'metered_lookup_methods') is replaced by one that times it with a 'LatencyHistogram' of the same name.
+# Functions are only replaced once this is called, so while metrics are off the application runs exactly as it would without them.
+def enable_metrics():
+    global metrics_enabled
+    if metrics_enabled:
+        return
+    metrics_enabled = True
+    module = globals()
+    for name, miss_counter in metered_functions.items():
+        module[name] = metered(name, module[name], miss_counter)
+    # Only methods defined by each class itself are replaced, so a method inherited from 'AccountStorage' is not timed twice.
+    for storage_class in (AccountStorage, JsonAccountStorage, BinaryAccountStorage, SqliteAccountStorage):
+        for method in metered_storage_methods:
+            if method in vars(storage_class):
+                setattr(storage_class, method, metered(f"storage_{method}", vars(storage_class)[method]))
+    for method, miss_counter in metered_lookup_methods.items():
+        setattr(AccountStore, method, metered(f"lookup_{method}", vars(AccountStore)[method], miss_counter))
+    # The posting operations and server methods were looked up when the application started, so they are pointed at the timed functions too.
+    for operation, function in posting_operations.items():
+        posting_operations[operation] = module[function.__name__]
+    for method, function in server_methods.items():
+        if method != "metrics":
+            server_methods[method] = metered(f"server_{method}", function)
+
+
+
+# Gives a function which calls 'function' and records how long it took in the latency histogram called 'name'.
+# A 'BankError' raised by the function is counted as '<name>_errors', and if 'miss_counter' is given a result of None or False is counted under that name.
+def metered(name, function, miss_counter=None):
+    histogram = metric_histograms.setdefault(name, LatencyHistogram())
+    perf_counter = time.perf_counter
+
+    @wraps(function)
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except BankError:
+            count_metric(f"{name}_errors")
+            raise
+        finally:
+            histogram.observe(perf_counter() - start)
+        if miss_counter is not None and (result is None or result is False):
+            count_metric(miss_counter)
+        return result
+    return timed
+
+
+
+# Adds one to the counter called 'name'.
+def count_metric(name):
+    with metric_counters_lock:
+        metric_counters[name] = metric_counters.get(name, 0) + 1
+
+
+
+# Gives every latency histogram and counter as a dictionary, which is how the metrics are written to a '.json' file.
+# Each histogram gives its count, total seconds, estimated median and 99th percentile, and the number of timings up to each bucket bound.
+def metrics_snapshot():
+    histograms = {}
+    for name, histogram in sorted(metric_histograms.items()):
+        counts, total = histogram.read()
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(metrics_buckets + ["+Inf"], counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        histograms[name] = {"count": cumulative, "sum": total, "p50": LatencyHistogram.percentile(counts, 50), "p99": LatencyHistogram.percentile(counts, 99), "buckets": buckets}
+    with metric_counters_lock:
+        counters = dict(sorted(metric_counters.items()))
+    return {"histograms": histograms, "counters": counters}
+
+
+
+# Gives every latency histogram and counter in the Prometheus text format, with each histogram named 'snb_<name>_seconds' and each counter 'snb_<name>_total'.
+def metrics_prometheus_text():
+    snapshot = metrics_snapshot()
+    lines = []
+    for name, histogram in snapshot["histograms"].items():
+        lines.append(f"# TYPE snb_{name}_seconds histogram")
+        for bound, cumulative in histogram["buckets"].items():
+            lines.append(f'snb_{name}_seconds_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"snb_{name}_seconds_sum {histogram['sum']}")
+        lines.append(f"snb_{name}_seconds_count {histogram['count']}")
+    for name, value in snapshot["counters"].items():
+        lines.append(f"# TYPE snb_{name}_total counter")
+        lines.append(f"snb_{name}_total {value}")
+    return "\n".join(lines) + "\n"
+
+
+
+# Writes the metrics to 'path', as JSON if it ends in '.json' and as Prometheus text otherwise.
+# The file is written under another name first and then renamed, so anything scraping it never reads half of it.
+def write_metrics(path):
+    contents = json.dumps(metrics_snapshot(), indent = 4) if path.endswith(".json") else metrics_prometheus_text()
+    with open(path + ".tmp", "w") as file:
+        file.write(contents)
+    os.replace(path + ".tmp", path)
+
+
+
+# Turns on profiling, writing the results to 'directory' when 'write_profiles' is called.
+# Each function in 'profiled_functions' is replaced by one that profiles it as a run of its phase, and the menus are run by 'profiled_run_menus' instead of 'run_menus'.
+# Memory is traced from this point on, so profiling should be turned on before the accounts are imported.
+# Functions are only replaced once this is called, so while profiling is off the application runs exactly as it would without it.
+def enable_profiling(directory):
+    global profile_directory
+    if profile_directory is not None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    profile_directory = directory
+    tracemalloc.start()
+    module = globals()
+    for name, (phase, snapshots) in profiled_functions.items():
+        module[name] = profiled(phase, snapshots, module[name])
+    module["run_menus"] = profiled_run_menus
+
+
+
+# Gives a function which calls 'function' as a run of the phase called 'phase'. See 'run_profiled_phase'.
+def profiled(phase, snapshots, function):
+    @wraps(function)
+    def profiled_function(*args, **kwargs):
+        return run_profiled_phase(phase, snapshots, function, *args, **kwargs)
+    return profiled_function
+
+
+
+# Runs the menus the same way as 'run_menus', profiling each menu as a run of the "menu" phase.
+def profiled_run_menus(first_menu):
+    menu = first_menu
+    while menu is not None:
+        menu = run_profiled_phase("menu", False, menu)
+
+
+
+# Calls 'function' as a run of the phase called 'name', profiling the CPU time it takes and the memory it uses.
+# A phase run inside another (such as the export made when exiting from a menu) is profiled on its own, with the outer phase's profiler paused until it finishes.
+# With 'snapshots' True the allocations left by the run are also found by comparing snapshots of every allocation taken before and after it.
+# Snapshots take much longer than the rest of profiling when there are many accounts, so they are only taken around bulk phases such as imports and exports and not around each menu.
+# 'tracemalloc' traces the memory of the whole process, and resetting its peak for one run would lose the peak of a run in another thread.
+# So memory is only measured for runs in the main thread (every phase except the server's logins and registrations, which run in worker threads), while the CPU time of every run is profiled.
+def run_profiled_phase(name, snapshots, function, *args, **kwargs):
+    phase = profiled_phases.get(name)
+    if phase is None:
+        phase = profiled_phases.setdefault(name, ProfiledPhase(name))
+    running = getattr(profiling_threads, "phases", None)
+    if running is None:
+        running = profiling_threads.phases = []
+    measure_memory = threading.current_thread() is threading.main_thread()
+    if running:
+        outer = running[-1]
+        outer.profiler().disable()
+        if measure_memory:
+            outer.peak = max(outer.peak, tracemalloc.get_traced_memory()[1])
+    running.append(phase)
+    if measure_memory:
+        before = tracemalloc.take_snapshot() if snapshots else None
+        start_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    profiler = phase.profiler()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        profiler.disable()
+        phase.seconds += time.perf_counter() - start
+        phase.calls += 1
+        if measure_memory:
+            memory, peak = tracemalloc.get_traced_memory()
+            phase.measured += 1
+            phase.peak = max(phase.peak, peak)
+            phase.net += memory - start_memory
+            if snapshots:
+                phase.add_allocations(before, tracemalloc.take_snapshot())
+        running.pop()
+        if running:
+            running[-1].profiler().enable()
+
+
+
+# Writes the CPU profile of each phase to '<phase>.prof' and the allocation snapshot of its latest run to '<phase>.tracemalloc' in 'profile_directory'.
+# 'summary.txt' lists for each phase how often it ran, how long it took and the memory it used, followed by the functions that took the most time and the lines of code that left the most memory allocated.
+# The memory figures are for the whole process, which the summary notes at the top since they also count memory allocated by worker threads while the server is profiled.
+# The '.prof' files can be opened with the 'pstats' module, and the '.tracemalloc' files with 'tracemalloc.Snapshot.load'.
+def write_profiles():
+    with open(os.path.join(profile_directory, "summary.txt"), "w") as summary:
+        summary.write("Memory is traced for the whole process and only measured for runs in the main thread. While the server is profiled, the memory of a run also counts whatever worker threads (logging customers in) allocated at the same time.\n\n")
+        for name, phase in profiled_phases.items():
+            if not phase.profilers:
+                continue
+            if phase.measured:
+                memory = f"peak memory {phase.peak / 1048576:.1f} MiB, {phase.net / 1048576:+.1f} MiB left allocated over {phase.measured} runs in the main thread"
+            else:
+                memory = "memory not measured as it only ran in worker threads"
+            summary.write(f"Phase '{name}': {phase.calls} runs in {phase.seconds:.3f} s, {memory}\n")
+            summary.write(f"Functions taking the most time (the full profile is in '{name}.prof'):\n")
+            stats = pstats.Stats(*phase.profilers.values(), stream = summary)
+            stats.dump_stats(os.path.join(profile_directory, f"{name}.prof"))
+            stats.sort_stats("cumulative").print_stats(profile_summary_lines)
+            if phase.snapshot is not None:
+                phase.snapshot.dump(os.path.join(profile_directory, f"{name}.tracemalloc"))
+                summary.write(f"Lines of code leaving the most memory allocated (a snapshot of the latest run is in '{name}.tracemalloc'):\n")
+                for line, (size, count) in sorted(phase.allocations.items(), key = lambda item: item[1][0], reverse = True)[:profile_summary_lines]:
+                    summary.write(f"{size / 1024:+12.1f} KiB in {count:+8} blocks: {line}\n")
+            summary.write("\n")
+    print(f"Profiles of {len(profiled_phases)} phases written to '{profile_directory}'")
+
+
+
+# Exports account objects to the selected storage.
+# Bank account instances are fully saved when the accounts journal is compacted, and this function makes sure every change is saved when the SNB Application is exited or a command finishes.
 def export_accounts():
-    # list of all account instances represented as dictionaries is created by looping through the accounts list and calling the 'dict' instance method.
-    accounts_dicts = [account.dict() for account in accounts_list]
+    account_storage.checkpoint()
+
+
+
+# Converts the saved accounts and customer logins from one storage format to another, for example from "json" to "sqlite".
+# The accounts are imported from the source format and every account is saved in the destination format, leaving the source files as they were.
+# Converting from "json" to "sqlite" is the one-off migration of 'accounts.json' and 'customer_records.json' into the 'snb.db' database.
+# The customer logins are loaded into 'customer_records' before the accounts, so accounts saved with customer names and passwords by an earlier version can be given customer ids.
+def convert_storage(source_format, destination_format):
+    store = AccountStore()
+    records = customer_records
+    source = create_account_storage(source_format)
+    destination = create_account_storage(destination_format)
+    source.load_customers(records)
+    source.load(store)
+    destination.save(store)
+    destination.save_customers(records)
+    source.close()
+    destination.close()
+    print(f"Converted {len(store)} accounts and {len(records)} customer logins from '{source.path}' to '{destination.path}'")
+
+
+
+# Gives the JSON text of an account laid out the same as 'json.dumps' with an indent of 4, indented again to sit inside the list of accounts in 'accounts.json'.
+# Account dictionaries only hold single values, so the item separator can carry the line breaks and indentation.
+# This lets the faster built-in JSON encoder be used, which 'json.dumps' does not use when 'indent' is given.
+def account_json_text(account):
+    text = json.dumps(account.dict(), separators = (",\n        ", ": "))
+    return "{\n        " + text[1:-1] + "\n    }"
+
+
+
+# Gives the balance in pence, the foreign exchange fee or interest rate (0 for a 'Mortgage') and the missed payment flag (0 or 1) of an account.
+# These are the values kept for each account in an 'AccountsIndex' so accounts can be filtered and sorted without being built.
+def account_query_values(account):
+    if account.category == "Current":
+        return account.balance.pence, account.foreign_exchange_fee, 0
+    if account.category == "Savings":
+        return account.balance.pence, account.interest_rate, 0
+    return account.balance.pence, 0, int(account.flagged_for_missed_payments)
+
+
+
+# Gives the same values as 'account_query_values' from an account dictionary read from 'accounts.json', in either the current or the older layout.
+def account_dict_query_values(data):
+    balance = money_from_dict(data, "balance", "pounds_balance", "pence_balance").pence
+    if data["category"] == "Current":
+        return balance, data["foreign_exchange_fee"], 0
+    if data["category"] == "Savings":
+        return balance, data["interest_rate"], 0
+    return balance, 0, int(bool(data["flagged_for_missed_payment"]))
+
+
 
-    # The list of account dictionaries is dumped into the 'acounts.json' file in a format which makes each account easily retrievable by calling the 'import_accounts' function.
-    with open("accounts.json", "w", encoding="utf-8") as file:
-        json.dump(accounts_dicts, file, indent = 4)
+# Lays out the accounts given by 'AccountStore.snapshot_records' as the text of 'accounts.json', exactly as 'json.dumps' with an indent of 4 would.
+# The position of each account in the text is recorded in the returned 'AccountsIndex'.
+def render_accounts_snapshot(records):
+    accounts_index = AccountsIndex()
+    texts = []
+    # Every account is preceded by either the opening "[\n    " or a separating ",\n    ", both 6 characters long.
+    position = 6
+    for number, customer_id, category, query_values, text in records:
+        accounts_index.add(number, customer_id, category, position, position + len(text), *query_values)
+        texts.append(text)
+        position += len(text) + 6
+    if not texts:
+        return "[]", accounts_index
+    return "[\n    " + ",\n    ".join(texts) + "\n]", accounts_index
 
 
 
-# Exports customer records (Logins) to JSON file
+# Exports customer records (Logins) to the selected storage.
 # Because the customer logins are stored in a dictionary they can be dumped straight into the 'customer_records.json' file.
-# This function is called everytime a new customer is registered and everytime the SNB Application is exited.
+# This function is called everytime the SNB Application is exited.
 def export_customer_records():
-    with open("customer_records.json", "w", encoding="utf-8") as file:
-        json.dump(customer_records, file, indent = 4)
+    account_storage.save_customers(customer_records)
+
+
+
+# Writes a snapshot file (such as 'accounts.json') so that a crash at any point never leaves a half written file in its place.
+# 'contents' can be text or, for binary files, bytes.
+# The data is first written to a temporary file in the same folder and forced onto the disk, then renamed over the live file in a single step.
+# The previous 'snapshot_generations' versions of the file are kept as 'name.1', 'name.2' and so on, with 'name.1' being the most recent.
+# A checksum of the new file is stored next to it in 'name.sha256' so the next import can tell the file has not changed since it was written.
+# The checksum is also returned so that files derived from the snapshot can be labelled with it.
+def write_snapshot(path, contents):
+    if isinstance(contents, str):
+        contents = contents.encode("utf-8")
+    folder = os.path.dirname(os.path.abspath(path))
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(contents)
+        file.flush()
+        os.fsync(file.fileno())
+
+    # Older generations are shifted up by one, dropping the oldest.
+    for generation in range(snapshot_generations - 1, 0, -1):
+        if os.path.exists(f"{path}.{generation}"):
+            os.replace(f"{path}.{generation}", f"{path}.{generation + 1}")
+    # The live file is linked (or copied where links are not supported) rather than moved, so there is never a moment when it does not exist.
+    if snapshot_generations > 0 and os.path.exists(path):
+        if os.path.exists(f"{path}.1"):
+            os.remove(f"{path}.1")
+        try:
+            os.link(path, f"{path}.1")
+        except OSError:
+            shutil.copyfile(path, f"{path}.1")
+
+    os.replace(temp_path, path)
+    checksum = hashlib.sha256(contents).hexdigest()
+    write_checksum(path, checksum)
+    sync_folder(folder)
+    return checksum
+
+
+
+# Deletes the backup generations kept of a snapshot file by 'write_snapshot', for when they hold data that should no longer be kept (such as plain text passwords).
+def discard_snapshot_backups(path):
+    for generation in range(1, snapshot_generations + 1):
+        if os.path.exists(f"{path}.{generation}"):
+            os.remove(f"{path}.{generation}")
+
+
+
+# Atomically writes the checksum file that sits next to a snapshot.
+def write_checksum(path, checksum):
+    with open(path + ".sha256.tmp", "w", encoding="utf-8") as file:
+        file.write(checksum)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".sha256.tmp", path + ".sha256")
+
+
+
+# Forces the renames made in a folder onto the disk. Not every operating system allows a folder to be opened this way, in which case nothing is done.
+def sync_folder(folder):
+    try:
+        folder_descriptor = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(folder_descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(folder_descriptor)
+
+
+
+# Reads a snapshot file written by 'write_snapshot' and returns the data loaded from it by the 'load' function.
+# 'load' is given the contents of the file and its checksum if that matches the one stored when it was written, or None if it does not.
+# If it matches then the file is known to be unchanged and 'load' can skip validating it, otherwise 'load' raises a 'ValueError' if the data is not in the expected layout.
+# If the live file is damaged the previous generations are tried in turn, from newest to oldest.
+# 'FileNotFoundError' is raised if the live file does not exist and 'ValueError' if neither it nor any earlier generation can be read.
+def read_snapshot(path, load):
+    candidates = [path] + [f"{path}.{generation}" for generation in range(1, snapshot_generations + 1)]
+    for candidate in candidates:
+        try:
+            with open(candidate, "rb") as file:
+                contents = file.read()
+        except FileNotFoundError:
+            if candidate == path:
+                raise
+            continue
+        checksum = hashlib.sha256(contents).hexdigest()
+        if candidate != path or read_checksum(path) != checksum:
+            checksum = None
+        try:
+            data = load(contents, checksum)
+        except ValueError:
+            print(f"Warning: '{candidate}' is damaged, trying the previous saved version")
+            continue
+        return data
+    raise ValueError(f"No readable version of '{path}' was found")
+
+
+
+# Loads the contents of 'customer_records.json', validating them unless the file is unchanged since it was written.
+def load_customer_records_snapshot(contents, checksum):
+    data = json.loads(contents)
+    if checksum is None:
+        validate_customer_records_snapshot(data)
+    return data
+
+
+
+# Scans the text of 'accounts.json' one account at a time, recording each account's number, customer, category and where its JSON text starts and ends.
+# Each account is validated as it is scanned if 'validate' is True.
+# Accounts with an unknown category are left out, the same as when every account was built on import.
+def scan_accounts_text(text, validate):
+    decoder = json.JSONDecoder()
+    accounts_index = AccountsIndex()
+    position = json_whitespace.match(text, 0).end()
+    if not text.startswith("[", position):
+        raise ValueError("accounts snapshot is not a list")
+    position = json_whitespace.match(text, position + 1).end()
+    while not text.startswith("]", position):
+        account, end = decoder.raw_decode(text, position)
+        if validate:
+            validate_account_dict(account)
+        if account.get("category") in ColumnarAccounts.category_codes:
+            # Accounts saved with a customer name and password by an earlier version are given a customer id, and the file is marked to be saved again.
+            if "customer_id" not in account:
+                accounts_index.legacy_customers = True
+            accounts_index.add(account["number"], customer_id_from_dict(account), account["category"], position, end, *account_dict_query_values(account))
+        position = json_whitespace.match(text, end).end()
+        # Accounts are separated by commas, and the list must end with a closing bracket.
+        if text.startswith(",", position):
+            position = json_whitespace.match(text, position + 1).end()
+        elif not text.startswith("]", position):
+            raise ValueError(f"unexpected text in accounts snapshot at position {position}")
+    return accounts_index
+
+
+
+# Returns the checksum stored next to a snapshot file, or None if there isn't one.
+def read_checksum(path):
+    try:
+        with open(path + ".sha256", "r", encoding="utf-8") as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+
+# Checks that an account dictionary read from 'accounts.json' has every value its category of account needs.
+# Ammounts of money can either be in the current whole pence layout or the older separate pounds and pence layout.
+# Raises a 'ValueError' describing the first problem found.
+def validate_account_dict(account):
+    required_keys = {"Current": ["foreign_exchange_fee"], "Savings": ["interest_rate"], "Mortgage": ["months_remaining", "flagged_for_missed_payment"]}
+    money_keys = {"Current": [("balance", "pounds_balance", "pence_balance")], "Savings": [("balance", "pounds_balance", "pence_balance")], "Mortgage": [("balance", "pounds_balance", "pence_balance"), ("monthly_repayment", "monthly_repayment_pounds", "monthly_repayment_pence")]}
+    if not isinstance(account, dict) or account.get("category") not in required_keys:
+        raise ValueError(f"invalid account entry: {account!r}")
+    # Accounts saved by earlier versions have a customer name and password instead of a customer id.
+    customer_keys = ["customer_id"] if "customer_id" in account else ["c_name", "c_pass"]
+    for key in ["number"] + customer_keys + required_keys[account["category"]]:
+        if key not in account:
+            raise ValueError(f"account {account.get('number')} is missing '{key}'")
+    if not isinstance(account["number"], int):
+        raise ValueError(f"account {account['number']} has a non-integer number")
+    for key, pounds_key, pence_key in money_keys[account["category"]]:
+        fields = [key] if key in account else [pounds_key, pence_key]
+        for field in fields:
+            if not isinstance(account.get(field), int):
+                raise ValueError(f"account {account['number']} has a missing or non-integer '{field}'")
+    for key in ("payment_account", "borrowed_ammount", "repayment_term"):
+        if account.get(key) is not None and not isinstance(account[key], int):
+            raise ValueError(f"account {account['number']} has a non-integer '{key}'")
+
+
+
+# Checks that the data read from 'customer_records.json' is a dictionary of 'username:credential' pairs, or of 'password:username' string pairs in the older layout.
+def validate_customer_records_snapshot(data):
+    if not isinstance(data, dict) or not all(isinstance(k, str) for k in data):
+        raise ValueError("customer records snapshot is not a dictionary of logins")
+    if all(isinstance(v, str) for v in data.values()):
+        return
+    for c_name, credential in data.items():
+        if not isinstance(credential, dict) or not isinstance(credential.get("salt"), str) or not isinstance(credential.get("hash"), str) or not isinstance(credential.get("iterations"), int):
+            raise ValueError(f"customer records snapshot has an invalid credential for '{c_name}'")
 
 
 
 # Lets the user attempt to log in to a customer account.
 def customer_login():
     # Customer username and customer password entered in the log in are set as global variables to be used in other functions.
+    # Once the login is correct the customer's id is set as a global variable too, which is used to find the customer's accounts.
     global c_username
     global c_pword
+    global c_customer_id
     # 'customer_access' is set to False by default and only turns True when a correct username password combination is inputted.
     customer_access = False
     # 'counter' keeps track of how many attempts remaining a user has to try and log in.
@@ -1086,8 +4963,8 @@ def customer_login():
     # The username password combination must be correct in 3 attempts following the first wrong attempt.
     # The for loop gives the user 3 more attempts to try and get their username password combination right, otherwise customer access remains 'False'.
     for i in range(3):
-        # Checks if the password entered (c_pword) matches a key in the 'customer_records' dictionary and if the username entered (c_username) matches the value in 'customer_records' accessed by using 'c_pword' as the key.
-        if c_pword in customer_records and c_username == customer_records[c_pword]:
+        # Checks the password entered (c_pword) against the hashed credential saved in 'customer_records' for the username entered (c_username).
+        if verify_login(c_username, c_pword):
             # If the condition is met, 'customer_access' is set to True and the for loop breaks.
             customer_access = True
             break
@@ -1105,12 +4982,13 @@ def customer_login():
     
     # Once the for loop is exited, if 'customer_access' is now True then the user is granted access to the customer menu.
     if customer_access == True:
-        customer_menu()
-    # If customer_access remains False then a message displays informing the user that they have exceeded the maximum login attempts and the 'exit' function is called to exit the SNB Application.
+        c_customer_id = customer_records[c_username].customer_id
+        return customer_menu
+    # If customer_access remains False then a message displays informing the user that they have exceeded the maximum login attempts and the 'exit' function is returned to exit the SNB Application.
     elif customer_access == False:
         print("You have exceeded the maximum number of login attempts.")
         print("The app will now close")
-        exit()
+        return exit
 
 
 
@@ -1128,10 +5006,10 @@ def customer_menu():
         
         if choice == "1":
             # Calls the 'show_accounts' function which displays all the accounts linked to the specific customer that is logged in.
-            show_accounts()
+            return show_accounts
         # Opens another new bank account that will be linked to the logged in customer by passing the customer username and password as arguments.
         elif choice == "2":
-            open_account(c_username, c_pword)
+            open_account_menu(c_customer_id)
             print("----------")
             print("1. Back to customer menu")
             print("2. Exit SNB Application")
@@ -1139,51 +5017,45 @@ def customer_menu():
             # Gives the option to return to the customer menu or exit the SNB Application after opening a new bank account.
             oa_choice = input("Please select 1 or 2: ")
 
-            while oa_choice != "1" and choice != "2":
+            while oa_choice != "1" and oa_choice != "2":
                 oa_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
             
             if oa_choice == "1":
                 print("----------")
-                customer_menu()
+                return customer_menu
             elif oa_choice == "2":
-                exit()
+                return exit
         elif choice == "3":
-            exit()
+            return exit
 
 
 
 # Displays all the bank accounts linked to the logged in customer.
 # From the list of accounts the customer can select which account they want to access by typing the corresponding number.
 def show_accounts():
-    # List of accounts registered to the specific customer logged in.
-    c_accounts = []
     # Used to exit the while loop in this function.
     inlist = False
 
     print("----------")
     print(f"Accounts registered to {c_username}:")
     print("-")
-    # Loops through every account in the accounts list and adds the account to the customer accounts list if the customer name (c_name) and customer password (c_pass) on the account matches the username and password of the logged in customer.
-    # It also prints the account if the conditions are fulfilled.
-    for a in accounts_list:
-        if a.c_name == c_username and a.c_pass == c_pword:
-            c_accounts.append(a)
-            print(a, a.category)
+    # The account store's customer index gives the accounts whose customer id matches the id of the logged in customer.
+    # Each of these accounts is then printed.
+    c_accounts = account_store.for_customer(c_customer_id)
+    for a in c_accounts:
+        print(a, a.category)
     print("----------")
     # Takes an input from the user which asks to input the account number of the account they want to access.
     account_choice = input("Please select the account you want to access by typing the corresponding account number: ")
 
     # Loops until a valid account number is inputted.
     while inlist == False:
-        # Checks every account in customer accounts to see if the 'acount_choice' input matches the string representation of each account.
-        for ac in c_accounts:
-            if account_choice == str(ac):
-                # If there is a match the function which opens the account menu for that specific account is called.
-                ac.account_menu()
-                inlist = True
-            else:
-                # If no match is made 'inlist' stays false.
-                inlist = False
+        # Looks up the 'account_choice' input in the account store and checks that the account belongs to the logged in customer.
+        ac = account_store.get(account_choice)
+        if ac is not None and ac.customer_id == c_customer_id:
+            # If there is a match the account menu for that specific account is shown next.
+            inlist = True
+            return ac.account_menu
         # If no match is made then a message is displayed informing the user of their incorrect input and they are asked to try again.
         if inlist == False:
             print("Incorrect input")
@@ -1223,12 +5095,12 @@ def admin_login():
     
     # Opens the admin menu if the username and password entered correctly match.
     if admin_access == True:
-        admin_menu()
+        return admin_menu
     # Exits the application if tries are exceeded.
     elif admin_access == False:
         print("You have exceeded the maximum number of login attempts.")
         print("The app will now close")
-        exit()
+        return exit
 
 
 
@@ -1244,97 +5116,180 @@ def admin_menu():
     while admin_choice != "1" and admin_choice != "2":
         admin_choice = input("Incorrect input, please state either 1 or 2 (by typing 1 or 2): ")
 
-    # If the user choses option 1, the 'admin_show_accounts' funtion is called which displays all bank accounts at SNB.
+    # If the user choses option 1, the 'admin_show_accounts' funtion is shown next which displays all bank accounts at SNB.
     if admin_choice == "1":
-        admin_show_accounts()
+        return admin_show_accounts
     #If the user choses option 2 they exit the SNB Application.
     elif admin_choice == "2":
-        exit()
+        return exit
 
 
 
-# Shows all bank accounts from all customers at SNB.
-# Allows the user to select an account and access the admin options for that account.
+# Shows the bank accounts at SNB one page at a time, starting with every account in the order they were opened.
+# The admin can move between pages, filter and sort the accounts (see 'query_accounts'), or select an account and access the admin options for that account.
+# Accounts are only taken from the results as their page is shown, and are kept so earlier pages can be shown again without repeating the query.
 def admin_show_accounts():
-    # 'a_inlist' is used to determine when to break the while loop in this function.
-    a_inlist = False
+    filters = {}
+    results = query_accounts()
+    shown = []
+    page = 0
+
+    # Loops until the admin selects an account.
+    while True:
+        # One account more than the page holds is taken so that the admin is only offered the next page if there is one.
+        wanted = (page + 1) * admin_page_size + 1
+        if len(shown) < wanted:
+            shown.extend(islice(results, wanted - len(shown)))
+        page_accounts = shown[page * admin_page_size:(page + 1) * admin_page_size]
 
-    print("----------")
-    print("Customer accounts at SNB:")
-    print("-")
-    # Loops through all accounts in the accounts list and prints each ones number, category and the name of the customer it belongs to.
-    for a in accounts_list:
-        print(f"{a} - {a.category} account belonging to {a.c_name}")
-    print("----------")
-    # Asks the user to select an account by typing the corresponding account number.
-    show_choice = input("Please select the account you want to access by typing the corresponding account number: ")
-
-    # While loop makes sure that if the account number inputted does not match any accounts then an error is given and the user is asked to try again.
-    while a_inlist == False:
-        # Loops through all accounts and if the 'show_choice' input matches a string representation of the account, then the user is taken to the admin account menu for that specific account.
-        for a in accounts_list:
-            if show_choice == str(a):
-                a.admin_account_menu()
-                a_inlist = True
-            else:
-                a_inlist = False
-        if a_inlist == False:
+        print("----------")
+        print(f"Customer accounts at SNB, page {page + 1}:")
+        print(f"Showing: {describe_account_filters(filters)}")
+        print("-")
+        # Prints each account's number, category, balance and the name of the customer it belongs to.
+        for a in page_accounts:
+            print(f"{a} - {a.category} account belonging to {customer_name(a.customer_id)} - Balance: {a.balance}")
+        if not page_accounts:
+            print("No accounts match")
+        print("----------")
+        options = []
+        if len(shown) > (page + 1) * admin_page_size:
+            print("N. Next page")
+            options.append("N")
+        if page > 0:
+            print("P. Previous page")
+            options.append("P")
+        print("F. Filter and sort accounts")
+        options.append("F")
+        print("----------")
+        # Asks the user to select an account by typing the corresponding account number, or to choose one of the options above.
+        show_choice = input(f"Please select the account you want to access by typing the corresponding account number, or type {', '.join(options)}: ").strip()
+
+        # While loop makes sure that if the input does not match an account number or an option then an error is given and the user is asked to try again.
+        # Any account at SNB can be selected by its number, not only those on the page shown.
+        a = account_store.get(show_choice)
+        while a is None and show_choice.upper() not in options:
             print("Incorrect input")
-            show_choice = input("Please type one of the 8-digit account numbers displayed from the list above: ")
+            show_choice = input(f"Please type an 8-digit account number or one of {', '.join(options)}: ").strip()
+            a = account_store.get(show_choice)
+
+        if a is not None:
+            return a.admin_account_menu
+        if show_choice.upper() == "N":
+            page += 1
+        elif show_choice.upper() == "P":
+            page -= 1
+        elif show_choice.upper() == "F":
+            filters = admin_choose_account_filters()
+            results = query_accounts(**filters)
+            shown = []
+            page = 0
+
+
+
+# Asks the admin for each filter and sort order of the admin account browser in turn, any of which can be left blank.
+# Returns the choices as the keyword arguments of 'query_accounts'.
+def admin_choose_account_filters():
+    filters = {}
+    print("----------")
+    print("Leave any of the following blank to show accounts of every kind")
+    category = admin_input_option("Category", ["Current", "Savings", "Mortgage"])
+    if category is not None:
+        filters["category"] = category
+
+    # The customer is typed as their username and found by the customer id of their login.
+    c_name = input("Customer username: ").strip()
+    while c_name and c_name not in customer_records:
+        c_name = input("No customer has that username, please type another or leave it blank: ").strip()
+    if c_name:
+        filters["customer_id"] = customer_records[c_name].customer_id
+
+    min_balance = admin_input_balance("Lowest balance: £")
+    if min_balance is not None:
+        filters["min_balance"] = min_balance
+    max_balance = admin_input_balance("Highest balance: £")
+    if max_balance is not None:
+        filters["max_balance"] = max_balance
+
+    fee_tier = admin_input_option("Foreign exchange fee category of current accounts", list(foreign_exchange_fee_categories))
+    if fee_tier is not None:
+        filters["fee_tier"] = fee_tier
+    interest_tier = admin_input_option("Interest rate category of savings accounts", list(saving_interest_categories))
+    if interest_tier is not None:
+        filters["interest_tier"] = interest_tier
+    flagged = admin_input_option("Mortgages flagged for missed payments", ["yes", "no"])
+    if flagged is not None:
+        filters["flagged"] = flagged == "yes"
+    sort_by_balance = admin_input_option("Sort by balance", ["ascending", "descending"])
+    if sort_by_balance is not None:
+        filters["sort_by_balance"] = sort_by_balance
+    return filters
+
+
+
+# Asks the admin to type one of 'options' (ignoring upper and lower case) or leave it blank.
+# Returns the option as written in 'options', or None if it was left blank.
+def admin_input_option(label, options):
+    typed_options = {option.lower(): option for option in options}
+    choice = input(f"{label} ({', '.join(options)}): ").strip().lower()
+    while choice and choice not in typed_options:
+        choice = input(f"Incorrect input, please type one of {', '.join(options)} or leave it blank: ").strip().lower()
+    return typed_options.get(choice)
+
+
+
+# Asks the admin for an ammount in pounds and pence, or for it to be left blank.
+# Returns the ammount as 'Money', or None if it was left blank.
+def admin_input_balance(prompt):
+    while True:
+        typed = input(prompt).strip()
+        if not typed:
+            return None
+        try:
+            return Money.from_text(typed)
+        except ValueError:
+            print("Please enter a valid currency input in pounds and pence with no spaces (e.g. 123.45)")
 
 
 
-# Correctly formats currency inputs into pounds and pence.
+# Describes the filters and sort order chosen in 'admin_choose_account_filters' for the heading of the admin account browser.
+def describe_account_filters(filters):
+    if not filters:
+        return "every account"
+    descriptions = []
+    if "category" in filters:
+        descriptions.append(f"{filters['category']} accounts")
+    if "customer_id" in filters:
+        descriptions.append(f"belonging to {customer_name(filters['customer_id'])}")
+    if "min_balance" in filters:
+        descriptions.append(f"balance at least {filters['min_balance']}")
+    if "max_balance" in filters:
+        descriptions.append(f"balance at most {filters['max_balance']}")
+    if "fee_tier" in filters:
+        descriptions.append(f"'{filters['fee_tier']}' foreign exchange fee")
+    if "interest_tier" in filters:
+        descriptions.append(f"'{filters['interest_tier']}' interest rate")
+    if "flagged" in filters:
+        descriptions.append("flagged for missed payments" if filters["flagged"] else "not flagged for missed payments")
+    if "sort_by_balance" in filters:
+        descriptions.append(f"sorted by balance ({filters['sort_by_balance']})")
+    return ", ".join(descriptions)
+
+
+
+# Reads a currency input in pounds and pence as a 'Money' ammount.
+# The typed text is read with 'Money.from_text', the same as the ammounts in a batch posting file, so the digits typed are used exactly and never rounded through a float.
 def format_currency():
-    # Checks for a condition to be met so the while loop can be exited.
-    valid = False
-
-    # while makes sure that the ammount entered is more than 0 and is a float value.
-    while valid == False:
-        # Error handling makes sure the value entered is a float, otherwise an error message is displayed.
+    # while makes sure that the ammount entered is a valid ammount of pounds and pence (with at most 2 figures of pence) and is more than 0.
+    while True:
+        # Error handling displays an error message if the text entered is not a valid ammount.
         try:
-            ammount = float(input("Ammount: £"))
-            if ammount > 0:
-                valid = True
-            else:
-                print("Please enter a valid currency input in pounds and pence with no spaces (e.g. 123.45)")
+            ammount = Money.from_text(input("Ammount: £"))
         except ValueError:
-            print("Please enter a valid currency input in pounds and pence with no spaces (e.g. 123.45)")
-
-    # The 'ammount value is formated into a string and split where the decimal point appears.
-    # This creates a 'seperated' list with index [0] corresponding to the pounds value and index [1] corresponding to the pence value.
-    separated = str(ammount).split(".")
-
-    # Checks to see if the length of the pence value is greater than 2 characters, in which case a messsage displays to input a valid currency input.
-    # This is because the length of the pence value cannot be greater than 2 so if the user has inputted a float value with more than 2 figures following the decimal point then the value cannot be accepted.
-    while len(separated[1]) > 2:
-        valid = False
+            ammount = None
+        if ammount is not None and ammount > Money(0):
+            return ammount
         print("Please enter a valid currency input in pounds and pence with no spaces (e.g. 123.45)")
-        while valid == False:
-            try:
-                ammount = float(input("Ammount: £"))
-                if ammount > 0:
-                    valid = True
-                else:
-                    print("Please enter a valid currency input in pounds and pence with no spaces (e.g. 123.45)")
-            except ValueError:
-                print("Please enter a valid currency input in pounds and pence with no spaces (e.g. 123.45)")
-
-        # The new inputed ammount is separated so that the check on the length of 'separated[1]' (pence value) can take place again.
-        separated = str(ammount).split(".")       
-
-    # Once the ammount is valid, it is formated to 2 decimal points.
-    # An example of why this is done is so that if a user inputs 10.1 then the 'f_ammount' will format this to 10.10.
-    f_ammount = f"{ammount:.2f}"
-    # The formated ammount is formated into a string and split at the decimal point giving the final pounds and pence values.
-    separated = str(f_ammount).split(".")
-        
-    # These pounds and pence values are passed to the 'pounds' and 'pence' variables
-    pounds = separated[0]
-    pence = separated[1]
-
-    # Finally the function returns the pounds and pence variables as two integers.
-    return int(pounds), int(pence)
 
 
 
@@ -1352,5 +5307,100 @@ def exit():
 
 
 
-# Launches the SNB Application.
-start_banking_app()
\ No newline at end of file
+# Reads the options the application is started with, selects the storage and then launches the SNB Application.
+# Running the file with no options starts the application as normal.
+# 'convert' converts the saved accounts between storage formats, for example: python SNB_banking_application.py convert json sqlite
+# 'post' posts a file of deposits and withdrawals, for example: python SNB_banking_application.py post payments.csv --report results.csv
+# 'month-end' takes the monthly payment of every mortgage: python SNB_banking_application.py month-end
+# 'interest' adds interest to every savings account, for example: python SNB_banking_application.py interest --frequency monthly
+# 'rate-sheet' quotes mortgages for a range of ammounts and terms, for example: python SNB_banking_application.py rate-sheet --terms 120 240
+# 'serve' serves many customers at the same time over the network, for example: python SNB_banking_application.py serve --port 8750
+# 'reprice' moves accounts to a new fee or interest tier in bulk, for example: python SNB_banking_application.py reprice savings premium --from-tier standard --dry-run
+# '--metrics' times the hot paths of the application or any command and writes the timings to a file when it finishes, for example: python SNB_banking_application.py --metrics metrics.prom month-end
+# '--profile' profiles the time and memory of each phase of the application or any command, for example: python SNB_banking_application.py --profile profiles month-end
+def main():
+    global metrics_path
+    parser = argparse.ArgumentParser(description="SNB Banking Application")
+    parser.add_argument("--storage", choices=account_storage_formats, default=account_storage_format, help="format the accounts are stored in")
+    parser.add_argument("--metrics", help="time the hot paths and write the timings to this file when finished, as JSON if it ends in .json and as Prometheus text otherwise")
+    parser.add_argument("--profile", help="profile the time and memory of each phase, such as import, menu and export, and write the profiles and a summary to this folder when finished")
+    subparsers = parser.add_subparsers(dest="command")
+    convert_parser = subparsers.add_parser("convert", help="convert the saved accounts and customer logins from one storage format to another")
+    convert_parser.add_argument("source", choices=account_storage_formats)
+    convert_parser.add_argument("destination", choices=account_storage_formats)
+    post_parser = subparsers.add_parser("post", help="post the deposits and withdrawals in a CSV or JSON lines file")
+    post_parser.add_argument("path")
+    post_parser.add_argument("--report", help="file to write the result of each transaction to (the screen if not given)")
+    subparsers.add_parser("month-end", help="take the monthly payment of every mortgage")
+    interest_parser = subparsers.add_parser("interest", help="add interest to every savings account")
+    interest_parser.add_argument("--frequency", choices=list(interest_periods_per_year), default="daily", help="how often interest is compounded (default: daily)")
+    interest_parser.add_argument("--periods", type=int, help="number of interest periods to accrue (default: every period since the last run)")
+    rate_sheet_parser = subparsers.add_parser("rate-sheet", help="quote mortgages for a range of ammounts and terms as CSV")
+    rate_sheet_parser.add_argument("--ammounts", nargs="+", help="ammounts borrowed in pounds and pence")
+    rate_sheet_parser.add_argument("--terms", nargs="+", type=int, help="repayment terms in months")
+    rate_sheet_parser.add_argument("--output", help="file to write the sheet to (the screen if not given)")
+    serve_parser = subparsers.add_parser("serve", help="serve many customers at the same time over the network")
+    serve_parser.add_argument("--host", default=server_host, help=f"address to listen on (default: {server_host})")
+    serve_parser.add_argument("--port", type=int, default=server_port, help=f"port to listen on (default: {server_port})")
+    serve_parser.add_argument("--unix", help="listen on this Unix socket instead of a port")
+    reprice_parser = subparsers.add_parser("reprice", help="move current or savings accounts to a new foreign exchange fee or interest rate category in bulk")
+    reprice_parser.add_argument("category", type=str.capitalize, choices=["Current", "Savings"])
+    reprice_parser.add_argument("tier", help="category to move the accounts to, such as premium")
+    reprice_parser.add_argument("--from-tier", help="only reprice accounts currently in this category")
+    reprice_parser.add_argument("--min-balance", help="only reprice accounts with at least this balance in pounds and pence")
+    reprice_parser.add_argument("--max-balance", help="only reprice accounts with at most this balance in pounds and pence")
+    reprice_parser.add_argument("--customer", help="only reprice the accounts of the customer with this username")
+    reprice_parser.add_argument("--numbers", help="only reprice the accounts listed in this file, one account number per line")
+    reprice_parser.add_argument("--dry-run", action="store_true", help="show what would be repriced without changing any account")
+    arguments = parser.parse_args()
+
+    if arguments.metrics is None and arguments.profile is None:
+        run_command(arguments)
+        return
+    if arguments.metrics is not None:
+        enable_metrics()
+        metrics_path = arguments.metrics
+    if arguments.profile is not None:
+        enable_profiling(arguments.profile)
+    try:
+        run_command(arguments)
+    finally:
+        if metrics_path is not None:
+            write_metrics(metrics_path)
+        if profile_directory is not None:
+            write_profiles()
+
+
+
+# Runs the command chosen in the options read by 'main', or the SNB Application itself if no command was given.
+def run_command(arguments):
+    global account_storage
+    if arguments.command == "convert":
+        convert_storage(arguments.source, arguments.destination)
+        return
+    if arguments.command == "rate-sheet":
+        mortgage_rate_sheet_command(arguments.ammounts, arguments.terms, arguments.output)
+        return
+    account_storage = create_account_storage(arguments.storage)
+    if arguments.command == "post":
+        post_transactions_file(arguments.path, arguments.report)
+        return
+    if arguments.command == "month-end":
+        month_end_mortgage_run_command()
+        return
+    if arguments.command == "interest":
+        savings_interest_run_command(arguments.frequency, arguments.periods)
+        return
+    if arguments.command == "serve":
+        serve_command(arguments.host, arguments.port, arguments.unix)
+        return
+    if arguments.command == "reprice":
+        reprice_accounts_command(arguments.category, arguments.tier, arguments.from_tier, arguments.min_balance, arguments.max_balance, arguments.customer, arguments.numbers, arguments.dry_run)
+        return
+    start_banking_app()
+
+
+
+# Launches the SNB Application when the file is run, but not when it is imported (for example by 'SNB_benchmarks.py').
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,1006 @@
+# Benchmarks for the SNB Banking Application.
+
+# These are run from the command line, for example:
+# python SNB_benchmarks.py memory --accounts 100000
+# python SNB_benchmarks.py sqlite --accounts 1000000
+# python SNB_benchmarks.py quotes --quotes 100000
+# python SNB_benchmarks.py server --clients 200 --sessions 20000
+# python SNB_benchmarks.py transfers --threads 8 --transfers 20000
+# python SNB_benchmarks.py numbers --span 1000000 --allocations 20000
+# python SNB_benchmarks.py queries --accounts 1000000
+# python SNB_benchmarks.py reprice --accounts 1000000
+# python SNB_benchmarks.py soak --actions 100000
+# python SNB_benchmarks.py suite --sizes 1000 100000 10000000 --output results.json
+
+# Each benchmark builds its own synthetic accounts in memory (or in a temporary folder) so the real 'accounts.json' and 'customer_records.json' files are never touched.
+
+
+
+
+# 'argparse' is imported to choose which benchmark to run and with how many accounts.
+import argparse
+# 'asyncio' is imported to run many client sessions against the SNB server at the same time.
+import asyncio
+# 'contextlib' is imported to throw away what the menus print while scripted sessions are replayed.
+import contextlib
+# 'gc' is imported to clear away temporary objects before memory is measured.
+import gc
+# 'hashlib' is imported to hash the passwords of synthetic customers.
+import hashlib
+# 'json' is imported to turn synthetic accounts into the same JSON text the application reads from 'accounts.json'.
+import json
+# 'multiprocessing' is imported to replay each synthetic book in a fresh process of its own.
+import multiprocessing
+# 'os' and 'tempfile' are imported to keep benchmark databases in a temporary folder.
+import os
+# 'random' is imported to generate synthetic accounts.
+import random
+# 'resource' is imported to read the peak memory of the process replaying a book.
+import resource
+import tempfile
+# 'subprocess' and 'sys' are imported to run the SNB server in its own process while it is measured.
+import subprocess
+import sys
+# 'threading' is imported to make transfers from several threads at the same time.
+import threading
+# 'time' is imported to time each operation.
+import time
+# 'ProcessPoolExecutor' is imported to run a function in a new process and pass back what it returns or raises.
+from concurrent.futures import ProcessPoolExecutor
+# 'islice' is imported to take the first page of results from a query, as the admin account browser does.
+from itertools import islice
+# 'tracemalloc' is imported to measure how much memory each layout of accounts uses, and how much each phase of the suite uses at most.
+import tracemalloc
+
+import SNB_banking_application as snb
+
+
+
+
+# Generates a list of 'count' synthetic account dictionaries in the current 'accounts.json' layout.
+# Each customer is given 'per_customer' accounts, spread across the 'Current', 'Savings' and 'Mortgage' categories.
+# The same 'seed' always produces the same accounts so that runs can be compared with each other.
+def generate_account_dicts(count, per_customer=6, seed=1):
+    generator = random.Random(seed)
+    numbers = generator.sample(range(10000000, 100000000), count)
+    return [synthetic_account(generator, i, number, per_customer) for i, number in enumerate(numbers)]
+
+
+
+# Gives the dictionary of the synthetic account at position 'i', numbered 'number', drawing its balance and terms from 'generator'.
+# Account 'i' belongs to customer 'i // per_customer + 1' and is a 'Current', 'Savings' or 'Mortgage' account in turn.
+def synthetic_account(generator, i, number, per_customer):
+    category = ["Current", "Savings", "Mortgage"][i % 3]
+    account = {"number": number, "customer_id": i // per_customer + 1, "balance": generator.randint(0, 5000000), "category": category}
+    if category == "Current":
+        account.update({"foreign_exchange_fee": generator.choice(list(snb.foreign_exchange_fee_categories.values()))})
+    elif category == "Savings":
+        account.update({"interest_rate": generator.choice(list(snb.saving_interest_categories.values()))})
+    elif category == "Mortgage":
+        months = generator.randint(6, 500)
+        account.update({"monthly_repayment": generator.randint(10000, 500000), "months_remaining": months, "flagged_for_missed_payment": False})
+    return account
+
+
+
+
+# Gives a hashed credential for the customer of each synthetic account, as the 'customer_records' dictionary holds them.
+# The customer with id 1 has the username 'customer_1' and the password 'pass_1', and so on.
+# Passwords are hashed with only 'iterations' PBKDF2 iterations so that thousands of customers can be set up quickly.
+# The application checks each password with the iterations it was saved with, so logins are as quick as the iterations given.
+def generate_credentials(accounts_dicts, iterations):
+    return {f"customer_{customer_id}": synthetic_credential(customer_id, iterations) for customer_id in sorted({d["customer_id"] for d in accounts_dicts})}
+
+
+
+# Gives the hashed credential of the synthetic customer with the given id, whose password is 'pass_' followed by the id.
+def synthetic_credential(customer_id, iterations):
+    salt = os.urandom(16)
+    password = f"pass_{customer_id}".encode("utf-8")
+    return snb.Credential(customer_id, salt, iterations, hashlib.pbkdf2_hmac("sha256", password, salt, iterations))
+
+
+
+# A stand-in for the account objects as they were before '__slots__' and 'Money' were introduced.
+# Every object has its own attribute dictionary, the balance is two separate integers, and each account holds its own copy of the customer's name and password strings.
+class DictBackedAccount:
+    def __init__(self, data):
+        self.number = data["number"]
+        self.c_name = f"customer_{data['customer_id']}"
+        self.c_pass = f"pass_{data['customer_id']}"
+        self.pounds_balance, self.pence_balance = divmod(data["balance"], 100)
+        self.category = data["category"]
+        for key in ("foreign_exchange_fee", "interest_rate", "months_remaining", "flagged_for_missed_payment"):
+            if key in data:
+                setattr(self, key, data[key])
+        if "monthly_repayment" in data:
+            self.monthly_repayment_pounds, self.monthly_repayment_pence = divmod(data["monthly_repayment"], 100)
+
+
+
+
+# Measures the memory still held once 'build' has turned the JSON text into accounts.
+# The JSON is parsed inside the measurement so that strings kept by the accounts are counted, while the parsed dictionaries themselves are thrown away.
+def measure_layout(accounts_text, build):
+    gc.collect()
+    tracemalloc.start()
+    accounts = build(json.loads(accounts_text))
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return accounts, current, peak
+
+
+
+# Compares the memory used by 'count' accounts in the old dictionary-backed objects, the '__slots__' account classes and 'ColumnarAccounts'.
+def benchmark_memory(count):
+    accounts_text = json.dumps(generate_account_dicts(count))
+    layouts = [
+        ("dict-backed objects", lambda dicts: [DictBackedAccount(d) for d in dicts]),
+        ("__slots__ objects", lambda dicts: [snb.account_from_dict(d) for d in dicts]),
+        ("columnar arrays", lambda dicts: snb.ColumnarAccounts.from_accounts(snb.account_from_dict(d) for d in dicts)),
+    ]
+    print(f"Memory used by {count} accounts:")
+    baseline = None
+    for name, build in layouts:
+        accounts, current, peak = measure_layout(accounts_text, build)
+        del accounts
+        if baseline is None:
+            baseline = current
+        print(f"{name:>20}: {current / 1048576:8.1f} MiB held ({current / count:6.1f} bytes per account, {current / baseline:5.1%} of dict-backed), {peak / 1048576:8.1f} MiB peak")
+
+
+
+
+# Returns the value at percentile 'p' (0 to 100) of a list of timings sorted from lowest to highest.
+def percentile(sorted_timings, p):
+    return sorted_timings[min(len(sorted_timings) - 1, int(len(sorted_timings) * p / 100))]
+
+
+
+# Prints the number, median, 99th percentile and worst latency of each kind of operation in milliseconds.
+def report_latencies(latencies):
+    for name, timings in latencies.items():
+        timings.sort()
+        print(f"{name:>20}: {len(timings):6} ops, p50 {percentile(timings, 50) * 1000:7.3f} ms, p99 {percentile(timings, 99) * 1000:7.3f} ms, max {timings[-1] * 1000:7.3f} ms")
+
+
+
+# Measures the latency of deposits, withdrawals and monthly mortgage payments against a SQLite database of 'count' accounts.
+# The database is built in a temporary folder, then imported the same way the application imports it when started with '--storage sqlite'.
+# Each operation changes the accounts the same way the account menus do and is saved in its own transaction, so the timings include the commit to disk.
+def benchmark_sqlite(count, operations):
+    generator = random.Random(2)
+    with tempfile.TemporaryDirectory() as folder:
+        storage = snb.SqliteAccountStorage(os.path.join(folder, "snb.db"))
+        storage.connect()
+        start = time.perf_counter()
+        accounts_dicts = generate_account_dicts(count)
+        with storage.connection:
+            storage.connection.executemany(storage.insert_account, (storage.account_row(snb.account_from_dict(d)) for d in accounts_dicts))
+        storage.save_customers(generate_credentials(accounts_dicts, 1))
+        del accounts_dicts
+        storage.close()
+        print(f"Built a database of {count} accounts in {time.perf_counter() - start:.2f} s ({os.path.getsize(storage.path) / 1048576:.1f} MiB)")
+
+        store = snb.AccountStore()
+        start = time.perf_counter()
+        storage.load(store)
+        print(f"Imported {len(store)} accounts in {time.perf_counter() - start:.2f} s")
+
+        numbers = {category: list(store.by_category[category]) for category in store.by_category}
+        latencies = {"deposit": [], "withdraw": [], "monthly payment": []}
+        for i in range(operations):
+            start = time.perf_counter()
+            if i % 3 == 0:
+                account = store.get(generator.choice(numbers["Savings"]))
+                account.balance += snb.Money(1050)
+                storage.record_change(account)
+                latencies["deposit"].append(time.perf_counter() - start)
+            elif i % 3 == 1:
+                account = store.get(generator.choice(numbers["Current"]))
+                account.balance -= snb.Money(min(account.balance.pence, 1050))
+                storage.record_change(account)
+                latencies["withdraw"].append(time.perf_counter() - start)
+            else:
+                mortgage = store.get(generator.choice(numbers["Mortgage"]))
+                current = store.for_customer(mortgage.customer_id, "Current")[0]
+                current.balance -= mortgage.monthly_repayment
+                mortgage.balance -= mortgage.monthly_repayment
+                mortgage.months_remaining -= 1
+                storage.record_change(current, mortgage)
+                latencies["monthly payment"].append(time.perf_counter() - start)
+        storage.close()
+    print(f"Latency of each operation at {count} accounts, including the commit:")
+    report_latencies(latencies)
+
+
+
+
+# Measures mortgage quotes in a burst where many customers ask about the same popular ammounts and terms, as on a busy quote web page.
+# Each quote takes its full repayment schedule too, and the burst is run once with the remembered quotes and once with them cleared before every quote.
+def benchmark_quotes(quotes):
+    generator = random.Random(3)
+    ammounts = [snb.Money.from_pounds_pence(pounds, 0) for pounds in range(100000, 400001, 25000)]
+    terms = [120, 180, 240, 300, 360]
+    requests = [(generator.choice(ammounts), generator.choice(terms)) for i in range(quotes)]
+    for label, clear in (("remembered", False), ("worked out each time", True)):
+        snb.mortgage_terms.cache_clear()
+        snb.amortization_schedule.cache_clear()
+        latencies = []
+        for borrow_ammount, repayment_term in requests:
+            start = time.perf_counter()
+            if clear:
+                snb.mortgage_terms.cache_clear()
+                snb.amortization_schedule.cache_clear()
+            snb.mortgage_quote(borrow_ammount, repayment_term)
+            snb.amortization_schedule(borrow_ammount.pence, repayment_term, snb.fixed_mortgage_interest)
+            latencies.append(time.perf_counter() - start)
+        print(f"{quotes} quotes with schedules, {label}: {sum(latencies):.2f} s")
+        report_latencies({"quote": latencies})
+
+    sheet_ammounts = [snb.Money.from_pounds_pence(pounds, 0) for pounds in range(10000, 1000001, 1000)]
+    sheet_terms = list(range(snb.minimum_mortgage_term, snb.maximum_mortgage_term + 1, 6))
+    start = time.perf_counter()
+    sheet = snb.mortgage_rate_sheet(sheet_ammounts, sheet_terms)
+    elapsed = time.perf_counter() - start
+    print(f"Rate sheet of {len(sheet)} quotes in {elapsed:.2f} s ({len(sheet) / elapsed:.0f} quotes per second)")
+
+
+
+
+# Starts the SNB server in its own process against 'count' synthetic accounts saved in 'folder', returning the process and the port it listens on.
+# Customer passwords are hashed with 'iterations' PBKDF2 iterations, which sets how long each login takes.
+# The server is given port 0 so the operating system picks a free port, which the server reports once it is listening.
+def start_benchmark_server(folder, count, iterations):
+    accounts_dicts = generate_account_dicts(count)
+    with open(os.path.join(folder, "accounts.json"), "w") as file:
+        json.dump(accounts_dicts, file, indent=4)
+    with open(os.path.join(folder, "customer_records.json"), "w") as file:
+        json.dump({c_name: credential.dict() for c_name, credential in generate_credentials(accounts_dicts, iterations).items()}, file, indent=4)
+    process = subprocess.Popen([sys.executable, os.path.abspath(snb.__file__), "serve", "--port", "0"], cwd=folder, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("SNB server listening"):
+        process.kill()
+        raise RuntimeError("the SNB server did not start")
+    return process, int(line.rstrip().rstrip(")").rsplit(", ", 1)[1])
+
+
+
+# Runs one customer session against the server: log in, list accounts, deposit into and withdraw from a 'Current' account, then log out.
+# Every request after logging in is sent with the session's token, the same as a client that does not keep its connection open would.
+# The time taken by each request is added to 'latencies' under the request's method.
+async def benchmark_session(port, customer, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    token = None
+
+    async def call(method, **params):
+        start = time.perf_counter()
+        request = {"id": 1, "method": method, "params": params}
+        if token is not None:
+            request["token"] = token
+        writer.write(json.dumps(request).encode("utf-8") + b"\n")
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        latencies[method].append(time.perf_counter() - start)
+        if "error" in reply:
+            raise RuntimeError(f"{method} failed: {reply['error']['message']}")
+        return reply["result"]
+
+    try:
+        token = (await call("login", username=f"customer_{customer}", password=f"pass_{customer}"))["token"]
+        accounts = (await call("accounts"))["accounts"]
+        current = next(account for account in accounts if account["category"] == "Current")
+        await call("deposit", account=current["number"], amount="10.00")
+        await call("withdraw", account=current["number"], amount="5.00")
+        await call("logout")
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+
+# Runs 'sessions' customer sessions spread over 'clients' clients connected at the same time, returning the session latencies and request latencies.
+async def run_benchmark_sessions(port, customers, clients, sessions):
+    generator = random.Random(4)
+    latencies = {"login": [], "accounts": [], "deposit": [], "withdraw": [], "logout": []}
+    session_latencies = []
+    remaining = [sessions]
+
+    async def client():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            await benchmark_session(port, generator.randint(1, customers), latencies)
+            session_latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client() for i in range(clients)))
+    return session_latencies, latencies
+
+
+
+# Measures how many customer sessions a second the SNB server handles with 'clients' customers connected at the same time.
+# The server runs in its own process against 'count' synthetic accounts in a temporary folder, and is stopped (saving its changes) at the end.
+# Logins take as long as the 'iterations' the synthetic customers' passwords are hashed with, so the application's 'credential_iterations' gives the real cost of a login.
+def benchmark_server(count, clients, sessions, iterations):
+    with tempfile.TemporaryDirectory() as folder:
+        process, port = start_benchmark_server(folder, count, iterations)
+        try:
+            start = time.perf_counter()
+            session_latencies, latencies = asyncio.run(run_benchmark_sessions(port, count // 6, clients, sessions))
+            elapsed = time.perf_counter() - start
+        finally:
+            process.terminate()
+            process.wait()
+    requests = sum(len(timings) for timings in latencies.values())
+    print(f"{sessions} sessions from {clients} clients at the same time in {elapsed:.2f} s: {sessions / elapsed:.0f} sessions per second, {requests / elapsed:.0f} requests per second")
+    latencies["whole session"] = session_latencies
+    report_latencies(latencies)
+
+
+
+
+# Makes 'transfers' random transfers between 'count' accounts from 'threads' threads at the same time, then checks that no money was created or lost.
+# A small number of accounts is used so that threads often transfer between the same accounts at the same time, in both directions.
+# The accounts are saved to a journal in a temporary folder as the transfers are made, and the saved accounts are also checked once read back.
+# The accounts read back, and those saved again from them as a compaction would, must also keep the order they were opened in.
+# Raises 'AssertionError' if the total money held by the accounts has changed or the accounts were read back in a different order.
+def stress_transfers(count, threads, transfers):
+    accounts_dicts = [d for d in generate_account_dicts(count * 3 // 2) if d["category"] != "Mortgage"][:count]
+    numbers = [d["number"] for d in accounts_dicts]
+    total = sum(d["balance"] for d in accounts_dicts)
+    with tempfile.TemporaryDirectory() as folder:
+        snb.account_store = snb.AccountStore()
+        for d in accounts_dicts:
+            snb.account_store.append(snb.account_from_dict(d))
+        snb.account_storage = snb.JsonAccountStorage(os.path.join(folder, "accounts.json"), snb.AccountJournal(os.path.join(folder, "accounts_journal.jsonl"), 32, 10000))
+        snb.account_storage.save(snb.account_store)
+        snb.account_storage.store = snb.account_store
+        outcomes = {"made": 0, "refused": 0}
+
+        def transfer_money(seed):
+            generator = random.Random(seed)
+            made = refused = 0
+            for i in range(transfers // threads):
+                from_number, to_number = generator.sample(numbers, 2)
+                try:
+                    snb.transfer(from_number, to_number, snb.Money(generator.randint(1, 2000000)))
+                    made += 1
+                except snb.InsufficientFundsError:
+                    refused += 1
+            with lock:
+                outcomes["made"] += made
+                outcomes["refused"] += refused
+
+        lock = threading.Lock()
+        workers = [threading.Thread(target=transfer_money, args=(seed,)) for seed in range(threads)]
+        # Threads are switched far more often than usual, so a transfer is often interrupted halfway by another one.
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        start = time.perf_counter()
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        elapsed = time.perf_counter() - start
+        snb.account_storage.journal.sync()
+
+        held = sum(account.balance.pence for account in snb.account_store)
+        saved_store = snb.AccountStore()
+        saved_storage = snb.JsonAccountStorage(os.path.join(folder, "accounts.json"), snb.AccountJournal(os.path.join(folder, "accounts_journal.jsonl"), 32, 10000))
+        saved_storage.load(saved_store)
+        saved = sum(account.balance.pence for account in saved_store)
+        replayed_order = (list(saved_store.by_number), {customer_id: list(customer_numbers) for customer_id, customer_numbers in saved_store.by_customer.items()})
+        saved_storage.save(saved_store)
+        compacted_store = snb.AccountStore()
+        saved_storage.load(compacted_store)
+        compacted_order = (list(compacted_store.by_number), {customer_id: list(customer_numbers) for customer_id, customer_numbers in compacted_store.by_customer.items()})
+        opened_order = (numbers, {customer_id: list(customer_numbers) for customer_id, customer_numbers in snb.account_store.by_customer.items()})
+        saved_storage.close()
+        snb.account_storage.close()
+    print(f"{outcomes['made']} transfers made and {outcomes['refused']} refused for lack of funds, across {count} accounts from {threads} threads in {elapsed:.2f} s")
+    print(f"Money held before: {snb.Money(total)}, after: {snb.Money(held)}, as saved: {snb.Money(saved)}")
+    assert held == total, "money was created or lost by concurrent transfers"
+    assert saved == total, "the saved accounts do not hold the same money as the accounts in memory"
+    assert replayed_order == opened_order, "replaying the journal changed the order of the accounts"
+    assert compacted_order == opened_order, "saving the replayed accounts changed the order of the accounts"
+    print("Total money conserved and the accounts kept their order")
+
+
+
+
+# Measures how quickly new account numbers are allocated as the range of account numbers fills up, then reserves numbers from several threads at once and checks that none was given out twice.
+# All 90 million 8-digit numbers cannot be filled in memory, so the allocator is given a range of only 'span' numbers instead, which fills up the same way.
+# Raises 'AssertionError' if the same account number was given out more than once.
+def benchmark_account_numbers(span, allocations, threads):
+    lowest, highest = snb.account_number_lowest, snb.account_number_highest
+    snb.account_number_lowest, snb.account_number_highest = 10000000, 10000000 + span - 1
+    try:
+        numbers = list(range(snb.account_number_lowest, snb.account_number_highest + 1))
+        random.Random(1).shuffle(numbers)
+        for fill in (0.5, 0.9, 0.99, 0.999):
+            snb.account_store = snb.AccountStore()
+            snb.account_store.by_number.update(dict.fromkeys(numbers[:int(span * fill)]))
+            allocator = snb.AccountNumberAllocator()
+            # Only a tenth of the free numbers are allocated so the range stays at about the same fill level while it is measured.
+            count = min(allocations, (span - len(snb.account_store)) // 10)
+            start = time.perf_counter()
+            for i in range(count):
+                allocator.allocate()
+            elapsed = time.perf_counter() - start
+            print(f"{fill:.1%} of numbers in use: {count / elapsed:.0f} allocations per second")
+
+        snb.account_store = snb.AccountStore()
+        allocator = snb.AccountNumberAllocator()
+        reserved = []
+
+        def reserve_numbers():
+            for i in range(allocations // threads // 100):
+                reserved.extend(allocator.reserve(100))
+
+        workers = [threading.Thread(target=reserve_numbers) for i in range(threads)]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        start = time.perf_counter()
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        elapsed = time.perf_counter() - start
+    finally:
+        snb.account_number_lowest, snb.account_number_highest = lowest, highest
+    print(f"{len(reserved)} numbers reserved in blocks of 100 from {threads} threads in {elapsed:.2f} s")
+    assert len(set(reserved)) == len(reserved), "the same account number was reserved more than once"
+    print("Every reserved number is unique")
+
+
+
+
+# Filters of the admin account browser measured by 'benchmark_queries', as the keyword arguments of 'query_accounts'.
+benchmark_query_filters = [
+    {},
+    {"category": "Savings", "interest_tier": "premium"},
+    {"fee_tier": "best", "min_balance": snb.Money(2500000)},
+    {"flagged": True},
+    {"flagged": False, "sort_by_balance": "descending"},
+    {"customer_id": 7},
+    {"min_balance": snb.Money(100000), "max_balance": snb.Money(110000), "sort_by_balance": "ascending"},
+]
+
+
+
+# Gives the accounts 'query_accounts' should return for 'filters' by checking every account in 'store', to compare the query's results against.
+def scan_accounts(store, category=None, customer_id=None, min_balance=None, max_balance=None, fee_tier=None, interest_tier=None, flagged=None, sort_by_balance=None):
+    matches = []
+    for account in store:
+        if category is not None and account.category != category:
+            continue
+        if customer_id is not None and account.customer_id != customer_id:
+            continue
+        if (min_balance is not None and account.balance < min_balance) or (max_balance is not None and account.balance > max_balance):
+            continue
+        if fee_tier is not None and (account.category != "Current" or account.foreign_exchange_fee != snb.foreign_exchange_fee_categories[fee_tier]):
+            continue
+        if interest_tier is not None and (account.category != "Savings" or account.interest_rate != snb.saving_interest_categories[interest_tier]):
+            continue
+        if flagged is not None and (account.category != "Mortgage" or account.flagged_for_missed_payments != flagged):
+            continue
+        matches.append(account)
+    if sort_by_balance is not None:
+        sign = 1 if sort_by_balance == "ascending" else -1
+        matches.sort(key=lambda account: (sign * account.balance.pence, account.number))
+    return [account.number for account in matches]
+
+
+
+# Measures how long the admin account browser takes to show the first page of each of the 'benchmark_query_filters', and to read every result, in each storage format.
+# The accounts are freshly imported before each format is measured so that none of them has been built yet, as when the application has just started.
+# Some accounts then have their tiers and flags changed, and every query is checked against a scan of every account.
+# Raises 'AssertionError' if a query gives different accounts from the scan.
+def benchmark_queries(count):
+    accounts_dicts = generate_account_dicts(count)
+    generator = random.Random(5)
+    for d in accounts_dicts:
+        if d["category"] == "Mortgage" and generator.random() < 0.02:
+            d["flagged_for_missed_payment"] = True
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, "accounts.json"), "w") as file:
+            json.dump(accounts_dicts, file, indent=4)
+        del accounts_dicts
+        journal = snb.AccountJournal(os.path.join(folder, "accounts_journal.jsonl"), 32, 10000)
+        storages = {"json": snb.JsonAccountStorage(os.path.join(folder, "accounts.json"), journal), "binary": snb.BinaryAccountStorage(os.path.join(folder, "accounts.snb")), "sqlite": snb.SqliteAccountStorage(os.path.join(folder, "snb.db"))}
+        store = snb.AccountStore()
+        storages["json"].load(store)
+        storages["binary"].save(store)
+        storages["sqlite"].save(store)
+        for storage_format, storage in storages.items():
+            snb.account_store = snb.AccountStore()
+            snb.account_storage = storage
+            start = time.perf_counter()
+            storage.load(snb.account_store)
+            print(f"{storage_format}: imported {len(snb.account_store)} accounts in {time.perf_counter() - start:.2f} s")
+            for filters in benchmark_query_filters:
+                start = time.perf_counter()
+                results = snb.query_accounts(**filters)
+                first_page = list(islice(results, snb.admin_page_size))
+                first_page_time = time.perf_counter() - start
+                remaining = list(results)
+                elapsed = time.perf_counter() - start
+                print(f"{snb.describe_account_filters(filters):>70}: {len(first_page) + len(remaining):8} accounts, first page {first_page_time * 1000:8.2f} ms, all {elapsed * 1000:8.2f} ms")
+            for number in generator.sample(list(snb.account_store.by_category["Current"]), 100):
+                snb.set_fee_tier(number, generator.choice(list(snb.foreign_exchange_fee_categories)))
+            for number in generator.sample(list(snb.account_store.by_category["Mortgage"]), 100):
+                snb.set_missed_payment_flag(number, generator.random() < 0.5)
+            for filters in benchmark_query_filters:
+                expected = scan_accounts(snb.account_store, **filters)
+                numbers = [account.number for account in snb.query_accounts(**filters)]
+                # Accounts whose tier or flag has changed move to the end of its index, so only sorted results are compared in order.
+                if "sort_by_balance" not in filters:
+                    numbers, expected = sorted(numbers), sorted(expected)
+                assert numbers == expected, f"'{snb.describe_account_filters(filters)}' does not match a scan of every account"
+            storage.close()
+    print("Every query matches a scan of every account")
+
+
+
+
+# Measures a bulk repricing of every 'standard' savings account to 'premium' in each storage format, first as a dry run and then for real, including saving the changes.
+# The tier counts of each repricing are checked against a scan of every account, and the saved accounts are read back and checked too.
+# Raises 'AssertionError' if the repricing changed the wrong accounts or the changes were not saved.
+def benchmark_repricing(count):
+    accounts_dicts = generate_account_dicts(count)
+    standard = sum(1 for d in accounts_dicts if d.get("interest_rate") == snb.saving_interest_categories["standard"])
+    savings = sum(1 for d in accounts_dicts if d["category"] == "Savings")
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, "accounts.json"), "w") as file:
+            json.dump(accounts_dicts, file, indent=4)
+        del accounts_dicts
+        storages = {"json": lambda: snb.JsonAccountStorage(os.path.join(folder, "accounts.json"), snb.AccountJournal(os.path.join(folder, "accounts_journal.jsonl"), 32, 10000)), "binary": lambda: snb.BinaryAccountStorage(os.path.join(folder, "accounts.snb")), "sqlite": lambda: snb.SqliteAccountStorage(os.path.join(folder, "snb.db"))}
+        store = snb.AccountStore()
+        storages["json"]().load(store)
+        storages["binary"]().save(store)
+        storages["sqlite"]().save(store)
+        for storage_format, create_storage in storages.items():
+            snb.account_store = snb.AccountStore()
+            snb.account_storage = create_storage()
+            snb.account_storage.load(snb.account_store)
+            start = time.perf_counter()
+            dry_run = snb.reprice_accounts("Savings", "premium", {"interest_tier": "standard"}, dry_run=True)
+            dry_run_time = time.perf_counter() - start
+            start = time.perf_counter()
+            summary = snb.reprice_accounts("Savings", "premium", {"interest_tier": "standard"})
+            reprice_time = time.perf_counter() - start
+            start = time.perf_counter()
+            snb.account_storage.checkpoint()
+            snb.account_storage.close()
+            save_time = time.perf_counter() - start
+            print(f"{storage_format}: {summary.changed} of {savings} savings accounts repriced, dry run {dry_run_time:.2f} s, repricing {reprice_time:.2f} s, saving {save_time:.2f} s")
+            assert dry_run.changed == summary.changed == summary.accounts == standard, "the repricing did not match every 'standard' savings account"
+            assert dry_run.before == summary.before == {"standard": standard} and summary.after == {"premium": standard}, "the tier counts do not match the accounts repriced"
+            saved_store = snb.AccountStore()
+            saved_storage = create_storage()
+            saved_storage.load(saved_store)
+            saved_standard = sum(1 for account in saved_store.in_category("Savings") if account.interest_rate == snb.saving_interest_categories["standard"])
+            saved_storage.close()
+            assert saved_standard == 0, "the repriced accounts were not saved"
+    print("Every repricing matched and saved the right accounts")
+
+
+
+
+# Gives the menu choices typed by a customer who logs in and then goes round the menus 'actions' times in one session, as a list of input lines.
+# Each round deposits, withdraws and views the balance of 'current_number', transfers £1.00 to 'savings_number', and returns to the customer menu.
+# Returns the input lines along with the number of transfers they make.
+def soak_script(actions, current_number, savings_number):
+    lines = ["2", "customer_1", "pass_1"]
+    rounds = 0
+    while len(lines) < actions:
+        lines += ["1", str(current_number), "2", "1.00", "1", "3", "1.00", "1", "1", "1", "4", str(savings_number), "1.00", "1", "5"]
+        rounds += 1
+    lines.append("3")
+    return lines, rounds
+
+
+
+# Runs the menus of the SNB Application in its own process for one long customer session of 'actions' menu choices, against synthetic accounts in a temporary folder.
+# Returns the seconds taken, the peak memory of the process in KiB, and the balances of the two accounts used once the accounts are read back from the folder.
+# Raises 'AssertionError' if the application did not finish the session and exit normally.
+def run_soak_session(actions):
+    accounts_dicts = generate_account_dicts(60)
+    current = next(d for d in accounts_dicts if d["customer_id"] == 1 and d["category"] == "Current")
+    savings = next(d for d in accounts_dicts if d["customer_id"] == 1 and d["category"] == "Savings")
+    lines, rounds = soak_script(actions, current["number"], savings["number"])
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, "accounts.json"), "w") as file:
+            json.dump(accounts_dicts, file, indent=4)
+        with open(os.path.join(folder, "customer_records.json"), "w") as file:
+            json.dump({c_name: credential.dict() for c_name, credential in generate_credentials(accounts_dicts, 1000).items()}, file, indent=4)
+        with open(os.path.join(folder, "input.txt"), "w") as file:
+            file.write("\n".join(lines) + "\n")
+        with open(os.path.join(folder, "input.txt"), "r") as script, open(os.path.join(folder, "output.txt"), "w") as output:
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, os.path.abspath(snb.__file__)], cwd=folder, stdin=script, stdout=output, stderr=subprocess.STDOUT)
+            # 'wait4' gives the resources used by this process alone, including its peak memory.
+            pid, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            elapsed = time.perf_counter() - start
+        with open(os.path.join(folder, "output.txt"), "r") as output:
+            ending = output.read()[-2000:]
+        assert process.returncode == 0 and "Goodbye" in ending, f"the session did not finish normally:\n{ending}"
+        store = snb.AccountStore()
+        snb.JsonAccountStorage(os.path.join(folder, "accounts.json"), snb.AccountJournal(os.path.join(folder, "accounts_journal.jsonl"), 32, 10000)).load(store)
+        balances = (store.get(current["number"]).balance.pence - current["balance"], store.get(savings["number"]).balance.pence - savings["balance"])
+    assert balances == (-100 * rounds, 100 * rounds), "the session's deposits, withdrawals and transfers were not all saved"
+    return elapsed, usage.ru_maxrss, len(lines)
+
+
+
+# Runs a customer session of 'actions' menu choices through the menus, and one a tenth as long, and compares their peak memory.
+# With every menu returning the next one instead of calling it, the longer session uses no more stack or memory than the shorter one.
+def benchmark_soak(actions):
+    for session_actions in (actions // 10, actions):
+        elapsed, peak, typed = run_soak_session(session_actions)
+        print(f"{typed} menu choices in one session in {elapsed:.2f} s ({typed / elapsed:.0f} per second), peak memory {peak / 1024:.1f} MiB")
+    print("Every session finished normally and saved every transaction")
+
+
+
+
+# The account numbers of a synthetic book are spread evenly over every 8-digit number, so the number of any account can be worked out from its position.
+# This lets books of millions of accounts be written and used without holding a list of their numbers.
+def book_account_number(i, count):
+    return snb.account_number_lowest + i * ((snb.account_number_highest - snb.account_number_lowest) // count)
+
+
+
+# Writes a synthetic book of 'count' accounts to 'accounts.json' and the logins of their customers to 'customer_records.json' in 'folder'.
+# The accounts are written one at a time in the same layout the application saves, so a book of ten million accounts is never held in memory.
+# Passwords are hashed with 'iterations' PBKDF2 iterations, the same as 'generate_credentials'.
+def write_book(folder, count, per_customer, iterations):
+    generator = random.Random(1)
+    with open(os.path.join(folder, "accounts.json"), "w") as file:
+        file.write("[")
+        for i in range(count):
+            text = json.dumps(synthetic_account(generator, i, book_account_number(i, count), per_customer), separators = (",\n        ", ": "))
+            file.write(("\n    {\n        " if i == 0 else ",\n    {\n        ") + text[1:-1] + "\n    }")
+        file.write("\n]")
+    with open(os.path.join(folder, "customer_records.json"), "w") as file:
+        file.write("{")
+        for customer_id in range(1, (count - 1) // per_customer + 2):
+            text = json.dumps(synthetic_credential(customer_id, iterations).dict(), indent=4).replace("\n", "\n    ")
+            file.write(("\n    " if customer_id == 1 else ",\n    ") + f'"customer_{customer_id}": ' + text)
+        file.write("\n}")
+
+
+
+# Gives the total bytes this process has written to files and sockets so far, or None where the system does not report it.
+# Changes made through a memory-mapped file (as the binary storage saves single accounts) are written by the system and are not counted.
+def bytes_written():
+    try:
+        with open("/proc/self/io", "r") as file:
+            for line in file:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+
+# The most memory this process has used so far, in KiB.
+def peak_memory():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+
+# Takes the place of the screen while scripted sessions are replayed, throwing away everything the menus print.
+class DiscardedOutput:
+    def write(self, text):
+        return len(text)
+
+
+
+    def flush(self):
+        pass
+
+
+
+
+# Raised by 'ScriptedInput' when a replayed session has typed every line of its script.
+class ScriptFinished(Exception):
+    pass
+
+
+
+
+# Takes the place of 'input' in the application so a session can be replayed from a list of typed lines.
+# 'ScriptFinished' is raised when the menus ask for a line after the last one, which ends the session where it stands without exiting the application.
+class ScriptedInput:
+    def __init__(self, lines):
+        self.lines = iter(lines)
+
+
+
+    def __call__(self, prompt=""):
+        line = next(self.lines, None)
+        if line is None:
+            raise ScriptFinished
+        return line
+
+
+
+# Gives the lines typed by a customer who logs in, deposits £2.00 into 'current_number', withdraws £1.00, views the balance and transfers £1.00 to 'savings_number'.
+# The session ends back at the customer menu.
+def session_script(customer_id, current_number, savings_number):
+    return ["2", f"customer_{customer_id}", f"pass_{customer_id}", "1", str(current_number), "2", "2.00", "1", "3", "1.00", "1", "1", "1", "4", str(savings_number), "1.00", "1", "5"]
+
+
+
+# Times 'operation' once for each item of 'items', and gives the result of one phase of the suite.
+# The result holds how many operations were made, the seconds they took, their latencies from lowest to highest and the bytes written.
+# While 'tracemalloc' is tracing, the result also holds the most memory the phase had allocated at once on top of what was already held when it started, otherwise this is None.
+def time_phase(operation, items):
+    latencies = []
+    written = bytes_written()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        held = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    for item in items:
+        operation_start = time.perf_counter()
+        operation(item)
+        latencies.append(time.perf_counter() - operation_start)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "operations": len(latencies),
+        "seconds": elapsed,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "bytes_written": None if written is None else bytes_written() - written,
+        "peak_memory": tracemalloc.get_traced_memory()[1] - held if tracing else None,
+    }
+
+
+
+# Gives the result of a phase made of one bulk operation over every account of the book, such as importing it, counting each account as one operation.
+def time_bulk_phase(operation, count):
+    result = time_phase(lambda item: operation(), [None])
+    result.update({"operations": count, "p50": None, "p99": None})
+    return result
+
+
+
+# Converts the synthetic book in 'folder' from 'accounts.json' to the given storage format, in the same way as 'python SNB_banking_application.py convert'.
+def convert_book(folder, storage_format):
+    os.chdir(folder)
+    with contextlib.redirect_stdout(DiscardedOutput()):
+        snb.convert_storage("json", storage_format)
+
+
+
+# Replays every phase of the suite against the synthetic book of 'count' accounts in 'folder', saved in the given storage format.
+# This runs in a process of its own, so the book is imported from scratch and the peak memory of each book is measured separately.
+# The book is imported, looked up, posted to, used by scripted customer sessions and finally exported, with the accounts and customers chosen at random from the book.
+# If 'metrics' is True the application's timers and counters are turned on first, so the results can be compared with a run without them to measure what they cost.
+# If 'trace_memory' is True every allocation is traced with 'tracemalloc' so the peak memory of each phase can be given, which makes every phase slower.
+# Returns a dictionary of the result of each phase, as given by 'time_phase', and the peak memory of the process over the whole book in KiB.
+def replay_book(folder, storage_format, count, per_customer, lookups, postings, sessions, metrics, trace_memory):
+    os.chdir(folder)
+    if metrics:
+        snb.enable_metrics()
+    if trace_memory:
+        tracemalloc.start()
+    snb.account_storage = snb.create_account_storage(storage_format)
+    generator = random.Random(3)
+    results = {}
+
+    def import_book():
+        snb.import_customer_records()
+        snb.import_accounts()
+    results["import"] = time_bulk_phase(import_book, count)
+
+    def look_up(i):
+        if i % 4 == 3:
+            snb.account_store.for_customer(i // per_customer + 1)
+        else:
+            assert snb.account_store.get(str(book_account_number(i, count))) is not None, f"account {i} of the book was not found"
+    results["lookups"] = time_phase(look_up, [generator.randrange(count) for i in range(lookups)])
+
+    # Each customer's first account is a 'Current' account, followed by a 'Savings' and a 'Mortgage' account.
+    # Postings are made against customers with a full set of accounts, and declined postings (such as a withdrawal the balance does not cover) are timed the same as the rest.
+    full_customers = count // per_customer
+
+    def post(posting):
+        kind, first = posting
+        current, savings, mortgage = (book_account_number(first + offset, count) for offset in range(3))
+        ammount = snb.Money(generator.randint(100, 10000))
+        try:
+            if kind == "deposit":
+                snb.deposit(current, ammount)
+            elif kind == "withdraw":
+                snb.withdraw(savings, ammount)
+            elif kind == "transfer":
+                snb.transfer(current, savings, ammount)
+            elif kind == "pay_mortgage":
+                snb.pay_mortgage(mortgage, current)
+        except snb.BankError:
+            pass
+    mix = ["deposit"] * 4 + ["withdraw"] * 3 + ["transfer"] * 2 + ["pay_mortgage"]
+    results["postings"] = time_phase(post, [(generator.choice(mix), generator.randrange(max(full_customers, 1)) * per_customer) for i in range(postings)])
+
+    def replay_session(customer_id):
+        first = (customer_id - 1) * per_customer
+        snb.input = ScriptedInput(session_script(customer_id, book_account_number(first, count), book_account_number(first + 1, count)))
+        try:
+            snb.run_menus(snb.welcome_menu)
+        except ScriptFinished:
+            pass
+    try:
+        with contextlib.redirect_stdout(DiscardedOutput()):
+            results["sessions"] = time_phase(replay_session, [generator.randint(1, max(full_customers, 1)) for i in range(sessions)])
+    finally:
+        vars(snb).pop("input", None)
+
+    results["export"] = time_bulk_phase(snb.export_accounts, count)
+    snb.account_storage.close()
+    return results, peak_memory()
+
+
+
+# Runs 'function' with 'arguments' in a new process of its own and gives back what it returns.
+# Starting a fresh interpreter for each run keeps the memory measured for one book from being counted for the next.
+# Anything raised in the new process, including the 'SystemExit' raised when the application cannot read its files, is raised again here.
+def run_in_own_process(function, *arguments):
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(function, *arguments).result()
+
+
+
+# Prints the result of each phase of one book: operations a second, median and 99th percentile latency, bytes written per operation and the peak memory of the phase if it was traced.
+# The peak memory of the process over the whole book, 'book_peak' in KiB, is printed once afterwards.
+def report_phases(results, book_peak):
+    for phase, result in results.items():
+        latency = "" if result["p50"] is None else f", p50 {result['p50'] * 1000:8.3f} ms, p99 {result['p99'] * 1000:8.3f} ms"
+        written = "" if result["bytes_written"] is None else f", {result['bytes_written'] / result['operations']:9.1f} bytes written per op"
+        memory = "" if result["peak_memory"] is None else f", peak memory {result['peak_memory'] / 1048576:8.1f} MiB"
+        print(f"{phase:>10}: {result['operations']:9} ops in {result['seconds']:8.3f} s, {result['operations'] / result['seconds']:11.0f} ops/s{latency}{written}{memory}")
+    print(f"{'process':>10}: peak memory {book_peak / 1024:.1f} MiB over the whole book")
+
+
+
+# Compares the results of the suite with a baseline saved by an earlier run, printing the change in operations a second of each phase found in both.
+# A phase is reported as a regression when it manages fewer operations a second than the baseline by more than 'tolerance' (0.1 being 10%).
+# Returns the number of regressions.
+def compare_with_baseline(results, baseline, tolerance):
+    regressions = 0
+    print(f"Compared with the baseline (regressions are phases more than {tolerance:.0%} slower):")
+    for book, phases in results.items():
+        for phase, result in phases.items():
+            if phase not in baseline.get(book, {}):
+                continue
+            before = baseline[book][phase]["operations"] / baseline[book][phase]["seconds"]
+            after = result["operations"] / result["seconds"]
+            change = after / before - 1
+            regressed = change < -tolerance
+            regressions += regressed
+            print(f"{book + ' ' + phase:>30}: {before:11.0f} -> {after:11.0f} ops/s ({change:+7.1%}){'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+
+# Generates a synthetic book for each of 'sizes' and replays imports, lookups, postings, scripted sessions and an export against it in each of 'storage_formats'.
+# Each book is written to a temporary folder, converted to the storage format and replayed in a process of its own, so the real account files are never touched.
+# The results are saved as JSON to 'output_path' if given, and compared with those saved to 'baseline_path' by an earlier run if given.
+# With 'metrics' True every book is replayed with the application's timers and counters turned on, and with 'trace_memory' True the peak memory of each phase is measured as well.
+# Returns the number of phases that regressed compared with the baseline.
+def benchmark_suite(sizes, storage_formats, per_customer, lookups, postings, sessions, metrics, trace_memory, output_path, baseline_path, tolerance):
+    results = {}
+    for count in sizes:
+        for storage_format in storage_formats:
+            with tempfile.TemporaryDirectory() as folder:
+                start = time.perf_counter()
+                write_book(folder, count, per_customer, 1)
+                if storage_format != "json":
+                    run_in_own_process(convert_book, folder, storage_format)
+                print(f"{count} accounts in {storage_format} storage{' with metrics turned on' if metrics else ''}{' with memory traced' if trace_memory else ''} (book written in {time.perf_counter() - start:.1f} s):")
+                book = f"{storage_format}/{count}"
+                results[book], book_peak = run_in_own_process(replay_book, folder, storage_format, count, per_customer, lookups, postings, sessions, metrics, trace_memory)
+                report_phases(results[book], book_peak)
+    if output_path is not None:
+        with open(output_path, "w") as file:
+            json.dump(results, file, indent=4)
+    if baseline_path is None:
+        return 0
+    with open(baseline_path, "r") as file:
+        baseline = json.load(file)
+    return compare_with_baseline(results, baseline, tolerance)
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the SNB Banking Application")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    memory_parser = subparsers.add_parser("memory", help="compare the memory used by each in-memory layout of accounts")
+    memory_parser.add_argument("--accounts", type=int, default=100000)
+
+    sqlite_parser = subparsers.add_parser("sqlite", help="measure the latency of saving single transactions to the SQLite storage")
+    sqlite_parser.add_argument("--accounts", type=int, default=1000000)
+    sqlite_parser.add_argument("--operations", type=int, default=3000)
+
+    quotes_parser = subparsers.add_parser("quotes", help="measure mortgage quotes with and without the remembered quotes, and a large rate sheet")
+    quotes_parser.add_argument("--quotes", type=int, default=100000)
+
+    server_parser = subparsers.add_parser("server", help="measure customer sessions per second against the SNB server")
+    server_parser.add_argument("--accounts", type=int, default=60000)
+    server_parser.add_argument("--clients", type=int, default=100)
+    server_parser.add_argument("--sessions", type=int, default=10000)
+    server_parser.add_argument("--iterations", type=int, default=1000, help="PBKDF2 iterations each synthetic customer's password is hashed with")
+
+    transfers_parser = subparsers.add_parser("transfers", help="make concurrent transfers from several threads and check that money is conserved and the saved accounts keep their order")
+    transfers_parser.add_argument("--accounts", type=int, default=50)
+    transfers_parser.add_argument("--threads", type=int, default=8)
+    transfers_parser.add_argument("--transfers", type=int, default=20000)
+
+    numbers_parser = subparsers.add_parser("numbers", help="measure account number allocation as the numbers fill up, and reserve numbers from several threads")
+    numbers_parser.add_argument("--span", type=int, default=1000000)
+    numbers_parser.add_argument("--allocations", type=int, default=20000)
+    numbers_parser.add_argument("--threads", type=int, default=8)
+
+    queries_parser = subparsers.add_parser("queries", help="measure the first page and every result of the admin account browser's queries in each storage format")
+    queries_parser.add_argument("--accounts", type=int, default=1000000)
+
+    reprice_parser = subparsers.add_parser("reprice", help="measure a bulk repricing of savings accounts, as a dry run and for real, in each storage format")
+    reprice_parser.add_argument("--accounts", type=int, default=1000000)
+
+    soak_parser = subparsers.add_parser("soak", help="run one long customer session through the menus and check its memory does not grow")
+    soak_parser.add_argument("--actions", type=int, default=100000)
+
+    suite_parser = subparsers.add_parser("suite", help="replay imports, lookups, postings, scripted sessions and exports against synthetic books of several sizes")
+    suite_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="numbers of accounts in each book (default: 1000 10000 100000)")
+    suite_parser.add_argument("--storage", nargs="+", choices=snb.account_storage_formats, default=snb.account_storage_formats, help="storage formats to replay each book in (default: all of them)")
+    suite_parser.add_argument("--per-customer", type=int, default=6, help="accounts held by each synthetic customer")
+    suite_parser.add_argument("--lookups", type=int, default=10000)
+    suite_parser.add_argument("--postings", type=int, default=10000)
+    suite_parser.add_argument("--sessions", type=int, default=1000)
+    suite_parser.add_argument("--metrics", action="store_true", help="turn on the application's timers and counters while replaying, to measure what they cost against a baseline without them")
+    suite_parser.add_argument("--trace-memory", action="store_true", help="trace every allocation to give the peak memory of each phase, which slows every phase down")
+    suite_parser.add_argument("--output", help="file to save the results to as JSON, to be used as a baseline later")
+    suite_parser.add_argument("--baseline", help="results saved by an earlier run to compare with")
+    suite_parser.add_argument("--tolerance", type=float, default=0.1, help="how much slower a phase may be than the baseline before it is a regression (default: 0.1, which is 10%%)")
+
+    arguments = parser.parse_args()
+    if arguments.benchmark == "memory":
+        benchmark_memory(arguments.accounts)
+    elif arguments.benchmark == "sqlite":
+        benchmark_sqlite(arguments.accounts, arguments.operations)
+    elif arguments.benchmark == "quotes":
+        benchmark_quotes(arguments.quotes)
+    elif arguments.benchmark == "server":
+        benchmark_server(arguments.accounts, arguments.clients, arguments.sessions, arguments.iterations)
+    elif arguments.benchmark == "transfers":
+        stress_transfers(arguments.accounts, arguments.threads, arguments.transfers)
+    elif arguments.benchmark == "numbers":
+        benchmark_account_numbers(arguments.span, arguments.allocations, arguments.threads)
+    elif arguments.benchmark == "queries":
+        benchmark_queries(arguments.accounts)
+    elif arguments.benchmark == "reprice":
+        benchmark_repricing(arguments.accounts)
+    elif arguments.benchmark == "soak":
+        benchmark_soak(arguments.actions)
+    elif arguments.benchmark == "suite":
+        if benchmark_suite(arguments.sizes, arguments.storage, arguments.per_customer, arguments.lookups, arguments.postings, arguments.sessions, arguments.metrics, arguments.trace_memory, arguments.output, arguments.baseline, arguments.tolerance):
+            sys.exit(1)
+
+
+
+if __name__ == "__main__":
+    main()